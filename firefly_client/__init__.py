@@ -1,12 +1,36 @@
-from importlib.metadata import PackageNotFoundError, version
-
-from .firefly_client import FireflyClient
-from .ffws import FFWs
-from .env import Env
-from .range_values import RangeValues
-
-try:
-    __version__ = version("firefly_client")
-except PackageNotFoundError:
-    # package is not installed
-    __version__ = None
+"""
+Python API for the Firefly viewer.
+
+Submodules and their dependencies (requests, websocket-client) are only imported when first
+used, so ``import firefly_client`` stays fast, e.g. for worker processes that only need `RangeValues`.
+"""
+from importlib import import_module
+
+_LAZY_ATTRIBUTES = {
+    'FireflyClient': '.firefly_client',
+    'FFWs': '.ffws',
+    'Env': '.env',
+    'RangeValues': '.range_values',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES) + ['__version__']
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    elif name == '__version__':
+        from importlib.metadata import PackageNotFoundError, version
+        try:
+            value = version("firefly_client")
+        except PackageNotFoundError:
+            # package is not installed
+            value = None
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
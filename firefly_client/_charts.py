@@ -0,0 +1,166 @@
+"""
+Preparation of plotly trace data for `FireflyClient.show_chart`.
+
+Numpy arrays are accepted anywhere in the traces. Large numeric arrays at the top level of a
+trace (x, y, z, error arrays, ...) can be moved into a table: the trace then refers to the
+table columns (``'x': 'tables::x'``) and Firefly loads and decimates the points server-side.
+
+When the server supports them, numpy arrays that stay inline are sent as plotly typed arrays,
+``{'dtype': 'f4', 'bdata': <base64 of the little-endian buffer>}``, instead of number lists.
+"""
+import base64
+from collections import Counter
+
+# numpy dtypes plotly has typed arrays for; others are converted to the listed type first
+_TYPED_ARRAY_DTYPES = {'f8': 'f8', 'f4': 'f4', 'f2': 'f4', 'i4': 'i4', 'u4': 'u4', 'i2': 'i2', 'u2': 'u2',
+                       'i1': 'i1', 'u1': 'u1', 'b1': 'u1', 'i8': 'f8', 'u8': 'f8'}
+
+
+def is_numpy(value):
+    """True for numpy arrays and scalars, without importing numpy."""
+    return type(value).__module__ == 'numpy'
+
+
+def typed_array(arr):
+    """
+    Plotly typed array of a 1-D or 2-D numeric numpy array, or None if there is no typed array for it.
+
+    The base64 data comes straight from the array buffer (converted to little-endian if needed),
+    without a Python-level loop over the values.
+    """
+    code = '%s%d' % (arr.dtype.kind, arr.dtype.itemsize)
+    if code not in _TYPED_ARRAY_DTYPES or arr.ndim not in (1, 2):
+        return None
+    dtype = _TYPED_ARRAY_DTYPES[code]
+    import numpy as np
+    buffer = np.ascontiguousarray(arr, dtype=np.dtype(dtype).newbyteorder('<'))
+    out = {'dtype': dtype, 'bdata': base64.b64encode(buffer.data).decode('ascii')}
+    arr.ndim == 2 and out.update({'shape': '%d, %d' % arr.shape})
+    return out
+
+
+def to_jsonable(obj, typed_arrays=False):
+    """
+    `obj` with numpy arrays and scalars replaced by lists and Python numbers, for `json.dumps`.
+
+    If `typed_arrays` is True, numeric numpy arrays become plotly typed arrays instead of lists.
+    """
+    if is_numpy(obj):
+        if not hasattr(obj, 'tolist'):
+            return obj
+        if typed_arrays and getattr(obj, 'ndim', 0) > 0:
+            typed = typed_array(obj)
+            if typed:
+                return typed
+        return obj.tolist()
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v, typed_arrays) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if not any(isinstance(v, (dict, list, tuple)) or is_numpy(v) for v in obj):
+            return obj  # a plain list of numbers or strings, nothing to convert
+        return [to_jsonable(v, typed_arrays) for v in obj]
+    return obj
+
+
+def _numeric_array(value, min_points):
+    """`value` as a 1-D numeric numpy array if it has at least `min_points` elements, else None."""
+    if is_numpy(value) and getattr(value, 'ndim', 0) == 1:
+        return value if value.dtype.kind in 'biuf' and len(value) >= min_points else None
+    if isinstance(value, (list, tuple)) and len(value) >= min_points:
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value[:100]):
+            return None
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+        arr = np.asarray(value)
+        return arr if arr.ndim == 1 and arr.dtype.kind in 'iuf' else None
+    return None
+
+
+def large_trace_columns(trace, min_points):
+    """
+    Top-level arrays of `trace` with at least `min_points` numbers, to be sent as table columns.
+
+    Only arrays of the most common length are returned, since they go in one table.
+
+    Returns
+    -------
+    out : `dict`
+        Trace key to 1-D numpy array, empty if nothing should move to a table.
+    """
+    if min_points is None or 'tbl_id' in trace:
+        return {}
+    columns = {}
+    for key, value in trace.items():
+        arr = _numeric_array(value, min_points)
+        if arr is not None:
+            columns[key] = arr
+    if not columns:
+        return {}
+    length = Counter(len(a) for a in columns.values()).most_common(1)[0][0]
+    return {k: a for k, a in columns.items() if len(a) == length}
+
+
+def _as_list(values):
+    if is_numpy(values):
+        return values.tolist() if getattr(values, 'ndim', 0) else [values.item()]
+    return list(values) if isinstance(values, (list, tuple)) else [values]
+
+
+class ChartStream:
+    """
+    Points waiting to be appended to the traces of one chart.
+
+    For servers without the chart extend action, it also keeps the inline arrays of each trace,
+    so a flush can replace them with the extended arrays.
+
+    Parameters
+    ----------
+    traces : `list` of `dict`, optional
+        Traces the chart was created with.
+    """
+
+    def __init__(self, traces=None):
+        self.traces = [dict(t) for t in traces or []]
+        self.pending = {}
+        self.max_points = None
+        self.last_flush = 0.0
+        self.timer = None
+        self.sending = False
+
+    def add(self, trace_index, columns, max_points=None):
+        """Buffer new points of trace `trace_index`; `columns` maps a trace key, e.g. 'x', to new values."""
+        buffer = self.pending.setdefault(trace_index, {})
+        for key, values in columns.items():
+            buffer.setdefault(key, []).extend(_as_list(values))
+        max_points and setattr(self, 'max_points', max_points)
+
+    def take(self):
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def extend_payload(self, chart_id, pending):
+        """Payload of a chart extend action with the `pending` points, like plotly's extendTraces."""
+        indices = sorted(pending)
+        keys = sorted({key for i in indices for key in pending[i]})
+        payload = {'chartId': chart_id, 'traceIndices': indices,
+                   'data': {key: [pending[i].get(key, []) for i in indices] for key in keys}}
+        self.max_points and payload.update({'maxPoints': self.max_points})
+        return payload
+
+    def apply(self, pending):
+        """Append the `pending` points to the kept traces, return the chart update changes replacing them."""
+        changes = {}
+        for i, columns in sorted(pending.items()):
+            while len(self.traces) <= i:
+                self.traces.append({})
+            trace = self.traces[i]
+            for key, values in columns.items():
+                old = trace.get(key, [])
+                if isinstance(old, str):
+                    raise ValueError('%s of trace %d comes from a table and cannot be extended' % (key, i))
+                new = _as_list(old) + values
+                trace[key] = new[-self.max_points:] if self.max_points else new
+                changes['data.%d.%s' % (i, key)] = trace[key]
+        return changes
@@ -0,0 +1,81 @@
+"""
+Compression of large request bodies sent to CmdSrv/sync.
+
+Form-encoded action bodies above a size threshold are sent with a gzip or deflate
+Content-Encoding, on servers that support it (see `FEATURE_COMPRESSED_REQUESTS`).
+"""
+import threading
+import zlib
+from urllib.parse import urlencode
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+ENCODINGS = {'gzip': 31, 'deflate': 15}  # zlib wbits of each HTTP content coding
+
+
+def compress(raw, encoding='gzip', level=6):
+    """`raw` bytes compressed with the HTTP content coding `encoding`."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(raw) + compressor.flush()
+
+
+def decompress(body, encoding):
+    """Inverse of `compress`; `encoding` '' or 'identity' returns `body` unchanged."""
+    if encoding in ('', 'identity'):
+        return body
+    return zlib.decompress(body, ENCODINGS[encoding])
+
+
+class RequestCompression:
+    """
+    Settings and totals of request body compression for one client.
+
+    Parameters
+    ----------
+    encoding : {'gzip', 'deflate'}
+        Content coding to use.
+    min_bytes : `int`
+        Only bodies of at least this many bytes are compressed.
+    level : `int`
+        zlib compression level, 1 (fastest) to 9 (smallest).
+    """
+
+    def __init__(self, encoding='gzip', min_bytes=32 * 1024, level=6):
+        if encoding not in ENCODINGS:
+            raise ValueError('encoding must be one of %s' % ', '.join(ENCODINGS))
+        self.encoding = encoding
+        self.min_bytes = min_bytes
+        self.level = level
+        self.requests = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self._lock = threading.Lock()
+
+    def encode(self, data):
+        """
+        Compressed form-encoded body of `data`, or None if it is below the threshold or does not shrink.
+
+        Returns
+        -------
+        out : `tuple` or None
+            (compressed body, raw size in bytes)
+        """
+        raw = urlencode(data).encode('utf-8')
+        if len(raw) < self.min_bytes:
+            return None
+        body = compress(raw, self.encoding, self.level)
+        return (body, len(raw)) if len(body) < len(raw) else None
+
+    def record(self, raw_size, sent_size):
+        with self._lock:
+            self.requests += 1
+            self.raw_bytes += raw_size
+            self.sent_bytes += sent_size
+
+    @property
+    def ratio(self):
+        """Total uncompressed size over total sent size of the compressed requests, None before the first one."""
+        return self.raw_bytes / self.sent_bytes if self.sent_bytes else None
+
+    def stats(self):
+        return {'encoding': self.encoding, 'requests': self.requests, 'raw_bytes': self.raw_bytes,
+                'sent_bytes': self.sent_bytes, 'ratio': self.ratio}
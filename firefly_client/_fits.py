@@ -0,0 +1,379 @@
+"""
+Minimal FITS reading and writing with numpy only, for data the client uploads itself (no astropy
+needed, except to find the pixels of a sky position for a cutout).
+"""
+import math
+import re
+import warnings
+
+BLOCK = 2880
+
+_IMAGE_BITPIX = {'u1': 8, 'i2': 16, 'i4': 32, 'i8': 64, 'f4': -32, 'f8': -64}
+
+_BITPIX_DTYPES = {8: 'u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+_BINTABLE_FORMATS = {'f8': 'D', 'f4': 'E', 'i8': 'K', 'i4': 'J', 'i2': 'I', 'u1': 'B', 'b1': 'L'}
+
+
+def _card(key, value=None, comment=None):
+    if value is None:
+        return key.ljust(80)
+    if isinstance(value, bool):
+        value = 'T' if value else 'F'
+    elif isinstance(value, str):
+        value = "'%s'" % value.replace("'", "''").ljust(8)
+        card = '%-8s= %-20s' % (key, value)
+        return (card + (' / %s' % comment if comment else '')).ljust(80)[:80]
+    card = '%-8s= %20s' % (key, value)
+    return (card + (' / %s' % comment if comment else '')).ljust(80)[:80]
+
+
+def header_bytes(cards):
+    """FITS header from a list of (key, value) tuples, END added and padded to a full block."""
+    return _header([_card(*c) for c in cards])
+
+
+def _header(card_images):
+    text = ''.join(card_images) + _card('END')
+    return text.ljust(BLOCK * math.ceil(len(text) / BLOCK)).encode('ascii')
+
+
+def _pad(nbytes, fill=b'\0'): return fill * (-nbytes % BLOCK)
+
+
+def bintable_dtype(arr):
+    """FITS-compatible numpy dtype code (without byte order) and TFORM letter of a 1-D column."""
+    kind, size = arr.dtype.kind, arr.dtype.itemsize
+    if kind == 'b':
+        return 'b1', 'L'
+    if kind == 'u' and size == 1:
+        return 'u1', 'B'
+    if kind in 'iu':
+        bits = size * 8 + (8 if kind == 'u' else 0)  # unsigned values need the next larger signed type
+        if bits > 64 and arr.size and arr.max() >= 2 ** 63:
+            return 'f8', 'D'  # uint64 values past the int64 range would wrap around
+        code = 'i2' if bits <= 16 else 'i4' if bits <= 32 else 'i8'
+        return code, _BINTABLE_FORMATS[code]
+    if kind == 'f':
+        return ('f4', 'E') if size <= 4 else ('f8', 'D')
+    raise TypeError('unsupported column dtype %s' % arr.dtype)
+
+
+def write_bintable(fp, columns, extname='TABLE'):
+    """
+    Write a FITS file with an empty primary HDU and one binary table extension.
+
+    Parameters
+    ----------
+    fp : `file-like object`
+        Binary stream to write to.
+    columns : `dict`
+        Column name to a 1-D array-like; all columns have the same length.
+    extname : `str`, optional
+        EXTNAME of the table extension.
+    """
+    import numpy as np
+    arrays = {name: np.asarray(col).ravel() for name, col in columns.items()}
+    lengths = {len(a) for a in arrays.values()}
+    if len(lengths) != 1:
+        raise ValueError('all columns must have the same length')
+    nrows = lengths.pop()
+
+    fields, cards = [], []
+    for i, (name, arr) in enumerate(arrays.items(), 1):
+        code, tform = bintable_dtype(arr)
+        fields.append((name, code if code in ('b1', 'u1') else '>' + code))
+        cards += [('TTYPE%d' % i, name), ('TFORM%d' % i, '1' + tform)]
+    rows = np.empty(nrows, dtype=fields)
+    for name, arr in arrays.items():
+        rows[name] = arr
+    logicals = [name for name in arrays if rows.dtype[name].kind == 'b']
+    data = _logicals_to_chars(rows, logicals) if logicals else rows.tobytes()
+
+    fp.write(header_bytes([('SIMPLE', True), ('BITPIX', 8), ('NAXIS', 0), ('EXTEND', True)]))
+    fp.write(header_bytes([('XTENSION', 'BINTABLE'), ('BITPIX', 8), ('NAXIS', 2),
+                           ('NAXIS1', rows.dtype.itemsize), ('NAXIS2', nrows), ('PCOUNT', 0), ('GCOUNT', 1),
+                           ('TFIELDS', len(arrays))] + cards + [('EXTNAME', extname)]))
+    fp.write(data)
+    fp.write(_pad(len(data)))
+
+
+def _logicals_to_chars(rows, names):
+    """Row bytes with the logical columns written as the characters 'T' and 'F', as FITS requires."""
+    import numpy as np
+    out = rows.view(np.uint8).reshape(len(rows), rows.dtype.itemsize).copy()
+    for name in names:
+        offset = rows.dtype.fields[name][1]
+        out[:, offset] = np.where(rows[name], ord('T'), ord('F'))
+    return out.tobytes()
+
+
+def write_image(fp, data, cards=()):
+    """
+    Write a FITS file with `data` as the primary image.
+
+    Parameters
+    ----------
+    fp : `file-like object`
+        Binary stream to write to.
+    data : `numpy.ndarray`
+        Image, the last axis is NAXIS1. Its dtype must be uint8, int16, int32, int64, float32 or float64.
+    cards : `list` of `tuple`, optional
+        Extra (key, value) header cards.
+    """
+    code = '%s%d' % (data.dtype.kind, data.dtype.itemsize)
+    if code not in _IMAGE_BITPIX:
+        raise TypeError('unsupported image dtype %s' % data.dtype)
+    axes = [('NAXIS%d' % (i + 1), n) for i, n in enumerate(reversed(data.shape))]
+    fp.write(header_bytes([('SIMPLE', True), ('BITPIX', _IMAGE_BITPIX[code]), ('NAXIS', data.ndim)] + axes +
+                          list(cards)))
+    raw = data.astype(data.dtype.newbyteorder('>'), copy=False).tobytes()
+    fp.write(raw)
+    fp.write(_pad(len(raw)))
+
+
+def _value(card):
+    """Value of a header card: `str`, `bool`, `int` or `float` (None if it has no value)."""
+    if card[8:10] != '= ':
+        return None
+    text = card[10:].strip()
+    if text.startswith("'"):
+        match = re.match(r"'((?:[^']|'')*)'", text)
+        return match.group(1).replace("''", "'").rstrip() if match else text
+    text = text.split('/')[0].strip()
+    if text in ('T', 'F'):
+        return text == 'T'
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text.replace('D', 'E'))
+        except ValueError:
+            return text
+
+
+def read_headers(fp):
+    """
+    Read the headers of the HDUs of a FITS file, skipping the data.
+
+    Parameters
+    ----------
+    fp : `file-like object`
+        Seekable binary stream of the FITS file.
+
+    Yields
+    ------
+    out : `tuple`
+        (header cards as a `list` of 80-character `str`, `dict` of keyword to value,
+        offset of the data in bytes, size of the data in bytes)
+    """
+    offset = 0
+    while True:
+        fp.seek(offset)
+        cards, end = [], False
+        while not end:
+            block = fp.read(BLOCK)
+            if len(block) < BLOCK:
+                return
+            offset += BLOCK
+            text = block.decode('ascii', errors='replace')
+            for i in range(0, BLOCK, 80):
+                card = text[i:i + 80]
+                if card.rstrip() == 'END':
+                    end = True
+                    break
+                cards.append(card)
+        values = {c[:8].strip(): _value(c) for c in cards if c[8:10] == '= '}
+        naxes = [values.get('NAXIS%d' % (i + 1), 0) for i in range(values.get('NAXIS', 0))]
+        size = (abs(values.get('BITPIX', 8)) // 8 * values.get('GCOUNT', 1) *
+                (values.get('PCOUNT', 0) + math.prod(naxes))) if naxes else 0
+        yield cards, values, offset, size
+        offset += size + len(_pad(size))
+
+
+def _image_hdu(fp, image_index=None):
+    """Header cards, values and data offset of the first image HDU, or of image number `image_index`."""
+    images = (h for h in read_headers(fp)
+              if h[1].get('NAXIS', 0) >= 2 and h[1].get('XTENSION', 'IMAGE') == 'IMAGE')
+    for i, hdu in enumerate(images):
+        if image_index is None or i == image_index:
+            return hdu[:3]
+    raise ValueError('no image HDU%s in the file' % ('' if image_index is None else ' %d' % image_index))
+
+
+def open_image(path, image_index=None):
+    """
+    Header and memory-mapped data of an image of a local FITS file.
+
+    Returns
+    -------
+    out : `tuple`
+        (header cards as 80-character `str`, `dict` of keyword to value, `numpy.memmap` of the
+        raw data, BSCALE and BZERO not applied)
+    """
+    import numpy as np
+    with open(path, 'rb') as src:
+        cards, values, offset = _image_hdu(src, image_index)
+    shape = tuple(values['NAXIS%d' % i] for i in range(values['NAXIS'], 0, -1))
+    return cards, values, np.memmap(path, dtype=_BITPIX_DTYPES[values['BITPIX']], mode='r', offset=offset, shape=shape)
+
+
+_STRUCTURE_KEYS = ('SIMPLE', 'XTENSION', 'BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT', 'EXTEND', 'CHECKSUM', 'DATASUM',
+                   'BLANK', 'BSCALE', 'BZERO')
+
+
+def image_cards(cards):
+    """
+    (key, value) tuples of the header `cards` that describe the image, not its data layout.
+    `cards` are 80-character card images, or (key, value) tuples such as the items of an
+    astropy header.
+    """
+    out = []
+    for card in cards:
+        if isinstance(card, str):
+            if card[8:10] != '= ':
+                continue
+            card = card[:8].strip(), _value(card)
+        key, value = card[0], card[1]
+        if key and key not in _STRUCTURE_KEYS + ('COMMENT', 'HISTORY') and not re.fullmatch(r'NAXIS\d+', key):
+            out.append((key, value))
+    return out
+
+
+def image_array(data):
+    """`data` with a dtype a FITS image can have, e.g. bool as uint8 and uint16 as int32."""
+    import numpy as np
+    data = np.asarray(data)
+    kind, size = data.dtype.kind, data.dtype.itemsize
+    if kind == 'b' or (kind == 'u' and size == 1):
+        return data.astype(np.uint8, copy=False)
+    if kind in 'iu':
+        bits = size * 8 + (8 if kind == 'u' else 0)
+        return data.astype(np.int16 if bits <= 16 else np.int32 if bits <= 32 else np.int64, copy=False)
+    if kind == 'f':
+        return data.astype(np.float32 if size <= 4 else np.float64, copy=False)
+    raise TypeError('unsupported image dtype %s' % data.dtype)
+
+
+def binned_cards(cards, factor):
+    """
+    (key, value) header `cards` of an image binned by `factor` in both axes.
+
+    The reference pixels, pixel sizes (CDELTn, CDi_j) and the IRAF physical coordinate keywords
+    (LTVn, LTMi_i) are changed so sky and physical coordinates stay the same.
+    """
+    values = dict(cards)
+    out = []
+    for key, value in cards:
+        if re.fullmatch(r'(CRPIX[12]|LTV[12])[A-Z]?', key):
+            value = (value - 0.5) / factor + 0.5
+        elif re.fullmatch(r'(CDELT[12]|CD[12]_[12])[A-Z]?', key):
+            value = value * factor
+        elif re.fullmatch(r'LTM[12]_[12]', key):
+            value = value / factor
+        out.append((key, value))
+    for axis in '12':
+        'LTV' + axis not in values and out.append(('LTV' + axis, 0.5 - 0.5 / factor))
+        'LTM%s_%s' % (axis, axis) not in values and out.append(('LTM%s_%s' % (axis, axis), 1.0 / factor))
+    return out
+
+
+def block_mean(data, factor, rows_per_read=4096, blank=None):
+    """
+    First plane of the image `data` binned by `factor` in both axes, as float32 means of the
+    blocks. Rows and columns left over at the top and right edges are dropped. The image is
+    read in bands of about `rows_per_read` rows, so a memory map is never read whole into memory.
+
+    Pixels equal to `blank` (the BLANK value of an integer image) and NaN pixels are left out
+    of the means; a block with no other pixel is NaN.
+    """
+    import numpy as np
+    plane = data[(0,) * (data.ndim - 2)]
+    ny, nx = plane.shape[0] // factor, plane.shape[1] // factor
+    band = max(1, rows_per_read // factor)
+    out = np.empty((ny, nx), dtype=np.float32)
+    for y in range(0, ny, band):
+        raw = plane[y * factor:min(y + band, ny) * factor, :nx * factor]
+        rows = np.array(raw, dtype=np.float32)
+        if blank is not None:
+            rows[raw == blank] = np.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # blocks with only blank pixels
+            out[y:y + band] = np.nanmean(rows.reshape(-1, factor, nx, factor), axis=(1, 3))
+    return out
+
+
+def sky_box(cards, ra, dec, size):
+    """
+    Pixel box (x0, y0, x1, y1) of a square of `size` degrees centered on `ra`, `dec`, in the image
+    with the header `cards`. Needs astropy.
+    """
+    from astropy.io import fits
+    from astropy.wcs import WCS
+    from astropy.wcs.utils import proj_plane_pixel_scales
+    wcs = WCS(fits.Header.fromstring(''.join(cards)), naxis=2)
+    x, y = wcs.world_to_pixel_values(ra, dec)
+    half_x, half_y = size / 2 / proj_plane_pixel_scales(wcs)
+    return (int(math.floor(x - half_x + 0.5)), int(math.floor(y - half_y + 0.5)),
+            int(math.floor(x + half_x + 0.5)) + 1, int(math.floor(y + half_y + 0.5)) + 1)
+
+
+def write_cutout(fp, path, cutout, image_index=None, rows_per_write=1024):
+    """
+    Write a FITS file with part of an image of a local FITS file.
+
+    The image is memory-mapped, so only the rows of the cutout are read. The header is copied
+    with NAXIS1, NAXIS2 and the reference pixels (CRPIX1, CRPIX2 and their alternate WCS
+    versions) changed for the cutout, and LTV1, LTV2 set so physical coordinates stay those of
+    the full image. Higher axes (cube planes) are kept whole.
+
+    Parameters
+    ----------
+    fp : `file-like object`
+        Binary stream to write to.
+    path : `str`
+        Path of the FITS file.
+    cutout : `tuple`
+        (ra, dec, size) in degrees for a square on the sky, or a pixel box (x0, y0, x1, y1) of
+        zero-based pixels, x1 and y1 excluded. The box is clipped to the image.
+    image_index : `int`, optional
+        Index of the image HDU among the image HDUs of the file, the default is the first image.
+
+    Returns
+    -------
+    out : `tuple`
+        The pixel box (x0, y0, x1, y1) written.
+    """
+    import numpy as np
+    cards, values, data = open_image(path, image_index)
+    if len(cutout) == 3:
+        cutout = sky_box(cards, *cutout)
+    naxes = [values['NAXIS%d' % (i + 1)] for i in range(values['NAXIS'])]
+    x0, y0 = max(int(cutout[0]), 0), max(int(cutout[1]), 0)
+    x1, y1 = min(int(cutout[2]), naxes[0]), min(int(cutout[3]), naxes[1])
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError('the cutout is outside of the image')
+
+    changes = {'NAXIS1': x1 - x0, 'NAXIS2': y1 - y0,
+               'LTV1': values.get('LTV1', 0) - x0, 'LTV2': values.get('LTV2', 0) - y0}
+    for key, value in values.items():
+        if re.fullmatch(r'CRPIX[12][A-Z]?', key):
+            changes[key] = value - (x0 if key[5] == '1' else y0)
+    header = [_card('SIMPLE', True)]
+    for card in cards:
+        key = card[:8].strip()
+        if key in ('SIMPLE', 'XTENSION', 'PCOUNT', 'GCOUNT', 'EXTEND', 'CHECKSUM', 'DATASUM'):
+            continue
+        header.append(_card(key, changes.pop(key), 'cutout') if key in changes else card)
+    header += [_card(key, value) for key, value in changes.items()]
+    fp.write(_header(header))
+
+    nbytes = 0
+    for plane in np.ndindex(data.shape[:-2]):
+        for y in range(y0, y1, rows_per_write):
+            raw = np.ascontiguousarray(data[plane + (slice(y, min(y + rows_per_write, y1)), slice(x0, x1))]).tobytes()
+            fp.write(raw)
+            nbytes += len(raw)
+    fp.write(_pad(nbytes))
+    del data
+    return x0, y0, x1, y1
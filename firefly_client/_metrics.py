@@ -0,0 +1,209 @@
+"""
+Opt-in metrics for the client-side hot paths: dispatch latency and payload size per action,
+uploads, response parsing, websocket messages and callbacks.
+
+There is one registry for the Python session, `metrics`, since websocket connections are shared
+by FireflyClient instances. Nothing is recorded until it is enabled, e.g. through
+`FireflyClient.enable_metrics`. Snapshots can be exported as JSON or in the Prometheus text format.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(11))  # 256 B to 256 MB
+RATIO_BUCKETS = (1, 1.5, 2, 3, 5, 7.5, 10, 15, 20, 50)
+
+
+def _buckets_for(name):
+    if name.endswith('_bytes') or name.endswith('_bytes_per_second'):
+        return BYTES_BUCKETS
+    if name.endswith('_ratio'):
+        return RATIO_BUCKETS
+    return SECONDS_BUCKETS
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds, plus count, sum, min and max."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate of quantile `q` by linear interpolation within the bucket it falls in."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, cnt in enumerate(self.counts):
+            if cnt and seen + cnt >= rank:
+                low = self.bounds[i - 1] if i > 0 else self.min
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                low, high = max(low, self.min), min(high, self.max)
+                return low + (high - low) * (rank - seen) / cnt
+            seen += cnt
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'min': self.min, 'max': self.max,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99)}
+
+
+class Meter:
+    """Count of events with a rate over the last `window` seconds."""
+
+    def __init__(self, window=60):
+        self.window = window
+        self.count = 0
+        self.started = time.monotonic()
+        self._per_second = deque()
+
+    def mark(self, n=1, now=None):
+        now = int(time.monotonic() if now is None else now)
+        self.count += n
+        if self._per_second and self._per_second[-1][0] == now:
+            self._per_second[-1][1] += n
+        else:
+            self._per_second.append([now, n])
+        while self._per_second and self._per_second[0][0] <= now - self.window:
+            self._per_second.popleft()
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        span = min(self.window, max(1.0, now - self.started))
+        return sum(n for t, n in self._per_second if t > now - self.window) / span
+
+    def snapshot(self):
+        return {'count': self.count, 'per_second': self.rate()}
+
+
+def _label_key(labels): return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """Counters, histograms and meters keyed by metric name and labels."""
+
+    PREFIX = 'firefly_client_'
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.meters = {}
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(_buckets_for(name))
+            self.histograms[key].observe(value)
+
+    def mark(self, name, n=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.meters:
+                self.meters[key] = Meter()
+            self.meters[key].mark(n)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds spent in the ``with`` block under `name`."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        All metrics as a `dict`: metric name to a list of entries, each with its labels and values.
+        """
+        out = {}
+        with self._lock:
+            for kind, items in (('counter', self.counters), ('histogram', self.histograms), ('meter', self.meters)):
+                for (name, labels), metric in sorted(items.items(), key=lambda kv: kv[0]):
+                    values = {'value': metric} if kind == 'counter' else metric.snapshot()
+                    out.setdefault(name, []).append({'type': kind, 'labels': dict(labels), **values})
+        return out
+
+    def to_json(self):
+        return json.dumps({'timestamp': time.time(), 'metrics': self.snapshot()}, indent=2)
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format."""
+        def fmt_labels(labels, **extra):
+            items = list(labels) + list(extra.items())
+            if not items:
+                return ''
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                                     for k, v in items)
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append('# TYPE %s%s_total counter' % (self.PREFIX, name))
+                for (n, labels), value in sorted(self.counters.items()):
+                    n == name and lines.append('%s%s_total%s %s' % (self.PREFIX, name, fmt_labels(labels), value))
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append('# TYPE %s%s histogram' % (self.PREFIX, name))
+                for (n, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, cnt in zip(list(h.bounds) + ['+Inf'], h.counts):
+                        cumulative += cnt
+                        lines.append('%s%s_bucket%s %d' % (self.PREFIX, name, fmt_labels(labels, le=bound), cumulative))
+                    lines.append('%s%s_sum%s %s' % (self.PREFIX, name, fmt_labels(labels), h.sum))
+                    lines.append('%s%s_count%s %d' % (self.PREFIX, name, fmt_labels(labels), h.count))
+            for name in sorted({n for n, _ in self.meters}):
+                lines.append('# TYPE %s%s_total counter' % (self.PREFIX, name))
+                for (n, labels), m in sorted(self.meters.items(), key=lambda kv: kv[0]):
+                    n == name and lines.append('%s%s_total%s %d' % (self.PREFIX, name, fmt_labels(labels), m.count))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, fmt=None):
+        """
+        Write a snapshot to `path`, as JSON (`fmt` 'json', or a path ending in '.json') or
+        else in the Prometheus text format.
+        """
+        fmt = fmt or ('json' if path.endswith('.json') else 'prometheus')
+        with open(path, 'w') as fp:
+            fp.write(self.to_json() if fmt == 'json' else self.to_prometheus())
+
+
+metrics = MetricsRegistry()
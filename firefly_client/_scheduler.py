@@ -0,0 +1,188 @@
+"""
+Scheduling of requests sent to a Firefly server.
+
+Every request to a server goes through the `SendScheduler` of that server, shared by all
+FireflyClient instances using it. The scheduler has three priority lanes (interactive,
+normal, bulk), optional token-bucket rate limits per server and per channel, and optional
+caps on the number of requests in flight. With the default configuration nothing is limited.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count
+
+try:
+    from .fc_utils import ACTION_DICT
+except ImportError:
+    from fc_utils import ACTION_DICT
+
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+LANE_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BULK: 'bulk'}
+
+INTERACTIVE_ACTIONS = {ACTION_DICT[a] for a in ('ZoomImage', 'PanImage', 'StretchImage', 'ColorImage')}
+"""Action types sent in the interactive lane (`set`)."""
+
+BULK_PAYLOAD_BYTES = 256 * 1024
+"""Actions with a JSON payload larger than this are sent in the bulk lane (`int`)."""
+
+_SMALL_PAYLOAD_BYTES = 4096
+
+
+def lane_for_data(data):
+    """
+    Lane for the form data of an action (or of several batched actions).
+
+    Large payloads go to the bulk lane, zoom/pan/stretch/color changes to the interactive lane,
+    everything else to the normal lane.
+    """
+    body = data.get('action') or data.get('actions') or ''
+    if len(body) > BULK_PAYLOAD_BYTES:
+        return BULK
+    if len(body) > _SMALL_PAYLOAD_BYTES:
+        return NORMAL
+    actions = json.loads(body) if body else []
+    actions = actions if isinstance(actions, list) else [actions]
+    return INTERACTIVE if actions and all(a.get('type') in INTERACTIVE_ACTIONS for a in actions) else NORMAL
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Parameters
+    ----------
+    rate : `float`
+        Tokens added per second.
+    burst : `float`
+        Maximum number of tokens, i.e. requests that can go at once after an idle period.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class SendScheduler:
+    """
+    Admission control for the requests to one Firefly server. Use `for_server` to get the shared instance.
+
+    A request waits in its lane until it may go: the in-flight caps and the rate limits allow it,
+    and no request ahead of it (a higher priority lane, or earlier in the same lane) may go instead.
+    The bulk lane has its own in-flight cap, below the global one, so an interactive request never
+    waits for a long upload to finish.
+    """
+
+    _servers = {}
+    _servers_lock = threading.Lock()
+
+    @classmethod
+    def for_server(cls, location):
+        with cls._servers_lock:
+            if location not in cls._servers:
+                cls._servers[location] = cls()
+            return cls._servers[location]
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = count()
+        self._waiting = []
+        self.in_flight = [0, 0, 0]
+        self.configure()
+
+    def configure(self, rate=None, burst=None, channel_rate=None, channel_burst=None,
+                  max_in_flight=None, bulk_max_in_flight=None):
+        """
+        Set the limits, None means unlimited. See `FireflyClient.configure_scheduler`.
+        """
+        if max_in_flight is not None and max_in_flight < 2:
+            raise ValueError('max_in_flight must be at least 2, to keep a slot for interactive requests')
+        with self._cond:
+            self.server_bucket = TokenBucket(rate, burst or max(1.0, rate)) if rate else None
+            self.channel_rate = channel_rate
+            self.channel_burst = channel_burst or (max(1.0, channel_rate) if channel_rate else None)
+            self.channel_buckets = {}
+            self.max_in_flight = max_in_flight
+            if bulk_max_in_flight is None and max_in_flight is not None:
+                bulk_max_in_flight = max_in_flight - 1
+            self.bulk_max_in_flight = bulk_max_in_flight
+            self.limited = bool(rate or channel_rate or max_in_flight or bulk_max_in_flight)
+            self._cond.notify_all()
+
+    def _channel_bucket(self, channel):
+        if not self.channel_rate:
+            return None
+        if channel not in self.channel_buckets:
+            self.channel_buckets[channel] = TokenBucket(self.channel_rate, self.channel_burst)
+        return self.channel_buckets[channel]
+
+    def _wait_time(self, lane, channel, now):
+        """0 if a request in this lane and channel may go now, the seconds to wait for a token, or None to wait for a slot."""
+        total = sum(self.in_flight)
+        if self.max_in_flight and total >= self.max_in_flight:
+            return None
+        if lane == BULK and self.bulk_max_in_flight and self.in_flight[BULK] >= self.bulk_max_in_flight:
+            return None
+        buckets = [b for b in (self.server_bucket, self._channel_bucket(channel)) if b]
+        return max([b.wait_time(now) for b in buckets], default=0.0)
+
+    @contextmanager
+    def slot(self, lane, channel):
+        """Wait until a request in `lane` for `channel` may go, and count it as in flight within the block."""
+        if not self.limited:
+            # still counted, under the lock, since limits set later rely on the in-flight counts
+            with self._cond:
+                self.in_flight[lane] += 1
+            try:
+                yield
+            finally:
+                with self._cond:
+                    self.in_flight[lane] -= 1
+                    self._cond.notify_all()
+            return
+
+        ticket = (lane, next(self._seq), channel)
+        with self._cond:
+            self._waiting.append(ticket)
+            self._waiting.sort()
+            while True:
+                timeout = self._admit_wait(ticket)
+                if timeout == 0:
+                    break
+                self._cond.wait(timeout)
+            self._waiting.remove(ticket)
+            for b in (self.server_bucket, self._channel_bucket(channel)):
+                b and b.consume()
+            self.in_flight[lane] += 1
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight[lane] -= 1
+                self._cond.notify_all()
+
+    def _admit_wait(self, ticket):
+        now = time.monotonic()
+        for ahead in self._waiting:
+            if ahead == ticket:
+                break
+            if self._wait_time(ahead[0], ahead[2], now) == 0:
+                return None  # that one goes first; it notifies when done
+        return self._wait_time(ticket[0], ticket[2], now)
@@ -0,0 +1,254 @@
+"""
+Optional background sender for dispatched actions.
+
+Actions are put in an ordered mailbox and sent by a background thread. An action that
+fully supersedes an earlier one (zoom, pan, stretch, color of the same plot; filter or
+sort of the same table) replaces the earlier one if it has not been sent yet, so the
+server only sees the latest state. Any other action is a barrier: nothing queued after
+it is merged with anything queued before it, so ordering between related actions holds.
+
+In auto-batch mode the sender works like Nagle's algorithm: while a request is in flight,
+and for a short window tuned from the measured round-trip time, dispatched actions gather
+in the mailbox and then go out together in one request.
+"""
+import atexit
+import threading
+from collections import deque
+
+try:
+    from .fc_utils import ACTION_DICT, warn, dispatch_logger
+except ImportError:
+    from fc_utils import ACTION_DICT, warn, dispatch_logger
+try:
+    from ._metrics import metrics
+except ImportError:
+    from _metrics import metrics
+
+COALESCABLE_ACTIONS = {ACTION_DICT[a] for a in
+                       ('ZoomImage', 'PanImage', 'StretchImage', 'ColorImage', 'TableFilter', 'TableSort')}
+"""Action types whose latest instance supersedes earlier ones for the same target (`set`)."""
+
+
+def coalesce_key(action_type, payload, channel):
+    """
+    Key identifying what a superseding action applies to.
+
+    Parameters
+    ----------
+    action_type : `str`
+        Action type.
+    payload : `dict`
+        Action payload.
+    channel : `str`
+        Channel the action is dispatched to.
+
+    Returns
+    -------
+    out : `tuple` or None
+        The key, or None if the action must never be merged with another one.
+    """
+    if action_type not in COALESCABLE_ACTIONS:
+        return None
+    target = payload.get('plotId') or payload.get('request', {}).get('tbl_id')
+    if not target:
+        return None  # applies to the active plot group, which can change in between
+    target = tuple(target) if isinstance(target, (list, tuple)) else target
+    variant = None
+    if action_type == ACTION_DICT['StretchImage']:
+        variant = tuple(sd.get('band') for sd in payload.get('stretchData', []))
+    elif action_type == ACTION_DICT['ColorImage']:
+        variant = 'useRed' in payload  # 3-color and single band color changes set different things
+    return channel, action_type, target, variant
+
+
+class RoundTripEstimator:
+    """Exponentially weighted moving average of request round-trip times, in seconds."""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, seconds):
+        self.value = seconds if self.value is None else self.alpha * seconds + (1 - self.alpha) * self.value
+
+
+class _Outgoing:
+    def __init__(self, data, key, wait):
+        self.data = data
+        self.key = key
+        self.wait = wait
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ActionMailbox:
+    """
+    FIFO of outgoing actions where an entry with a key replaces the queued entry with the same key.
+
+    Replacement keeps the position of the queued entry. Entries without a key are barriers:
+    entries queued after a barrier never replace entries queued before it.
+    """
+
+    def __init__(self):
+        self._entries = deque()
+        self._by_key = {}
+        self._unfinished = 0
+        self._cond = threading.Condition()
+        self.coalesced_cnt = 0
+
+    def __len__(self): return len(self._entries)
+
+    def put(self, data, key=None, wait=False):
+        """Queue `data`, return the entry that will carry it."""
+        with self._cond:
+            if key is not None and key in self._by_key:
+                entry = self._by_key[key]
+                entry.data = data
+                self.coalesced_cnt += 1
+                metrics.inc('coalesced_actions')
+                return entry
+            entry = _Outgoing(data, key, wait)
+            self._entries.append(entry)
+            self._unfinished += 1
+            if key is None:
+                self._by_key.clear()
+            else:
+                self._by_key[key] = entry
+            self._cond.notify_all()
+            return entry
+
+    def take(self, timeout=None):
+        """Remove and return the oldest entry, or None if there is none within `timeout` seconds."""
+        with self._cond:
+            if not self._entries and not self._cond.wait_for(lambda: self._entries, timeout):
+                return None
+            entry = self._entries.popleft()
+            if entry.key is not None and self._by_key.get(entry.key) is entry:
+                del self._by_key[entry.key]
+            return entry
+
+    def take_all(self):
+        """Remove and return all queued entries, oldest first."""
+        with self._cond:
+            entries = list(self._entries)
+            self._entries.clear()
+            self._by_key.clear()
+            return entries
+
+    def task_done(self, entry):
+        entry.done.set()
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every queued entry is sent, return False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._unfinished == 0, timeout)
+
+
+class BackgroundSender:
+    """
+    Send actions from an `ActionMailbox` on a background thread.
+
+    Parameters
+    ----------
+    send_func : `Function`
+        Called with the form data of one action, returns the status dict from the server.
+    send_batch_func : `Function`, optional
+        Called with a list of form data, returns the list of status dicts. Setting it turns on auto-batch mode.
+    round_trip : `RoundTripEstimator`, optional
+        Round-trip time of requests to the server, used to tune the batching window.
+    max_window : `float`, optional
+        Upper bound in seconds of the batching window.
+    """
+
+    WINDOW_RTT_FRACTION = 0.5
+
+    def __init__(self, send_func, send_batch_func=None, round_trip=None, max_window=0.01):
+        self._send = send_func
+        self._send_batch = send_batch_func
+        self.round_trip = round_trip
+        self.max_window = max_window
+        self.mailbox = ActionMailbox()
+        self.errors = []
+        self._flush_now = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='firefly-client-sender', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    @property
+    def auto_batch(self): return self._send_batch is not None
+
+    def window(self):
+        """Seconds to wait for more actions before sending a batch."""
+        rtt = self.round_trip.value if self.round_trip else None
+        return self.max_window if rtt is None else min(self.max_window, self.WINDOW_RTT_FRACTION * rtt)
+
+    def _run(self):
+        while self._running or len(self.mailbox):
+            entry = self.mailbox.take(timeout=0.5)
+            if entry is None:
+                continue
+            if not self.auto_batch:
+                self._send_entries([entry], lambda entries: [self._send(entries[0].data)])
+                continue
+            self._running and self._flush_now.wait(self.window())
+            entries = [entry] + self.mailbox.take_all()
+            self._send_entries(entries, lambda entries: self._send_batch([e.data for e in entries]))
+
+    def _send_entries(self, entries, send):
+        try:
+            for entry, result in zip(entries, send(entries)):
+                entry.result = result
+        except Exception as err:
+            for entry in entries:
+                entry.error = err
+            if not all(entry.wait for entry in entries):
+                warn('background send failed: %s', err, log=dispatch_logger)
+                self.errors.append(err)
+        finally:
+            if not len(self.mailbox):
+                self._flush_now.clear()
+            for entry in entries:
+                self.mailbox.task_done(entry)
+
+    def submit(self, data, key=None):
+        """
+        Queue the form data of one action.
+
+        An action with a `key` may be replaced by a later one and returns right away with
+        ``{'success': True, 'queued': True}``, as does every action in auto-batch mode.
+        Otherwise the action waits until it is sent and returns the status from the server.
+        """
+        if not self._running:
+            raise RuntimeError('background sender is stopped')
+        wait = key is None and not self.auto_batch
+        entry = self.mailbox.put(data, key, wait)
+        if not wait:
+            return {'success': True, 'queued': True}
+        entry.done.wait()
+        if entry.error:
+            raise entry.error
+        return entry.result
+
+    def flush(self, timeout=None, raise_errors=True):
+        """
+        Send queued actions now and wait until they are sent. Raise the first error of a queued
+        action since the last flush, unless `raise_errors` is False: the errors are then kept for
+        the next flush.
+        """
+        self._flush_now.set()
+        self.mailbox.join(timeout)
+        if self.errors and raise_errors:
+            errors, self.errors = self.errors, []
+            raise errors[0]
+
+    def stop(self):
+        """Send what is queued, then stop the thread."""
+        atexit.unregister(self.stop)
+        self._running = False
+        self._flush_now.set()
+        self._thread.join()
@@ -9,6 +9,17 @@
 MIN_SERVER_VERSION = '2025.4'
 
 FIREFLY_VERSION_KEY = 'Firefly Version'
+FIREFLY_CAPABILITIES_KEY = 'Capabilities'
+
+# Optional server features. The client uses one when the server lists it under FIREFLY_CAPABILITIES_KEY
+# in the version response. Features that fail cleanly on servers without them may also be probed:
+# tried once when the server doesn't list capabilities, and remembered as unsupported if the server refuses.
+FEATURE_BATCH_ACTIONS = 'pushActions'  # several actions in one CmdSrv/sync request
+FEATURE_WS_ACTIONS = 'wsActions'  # actions sent as websocket frames and acknowledged by request ID; never probed
+FEATURE_COMPRESSED_REQUESTS = 'compressedRequests'  # gzip or deflate Content-Encoding of CmdSrv/sync bodies; never probed
+FEATURE_REGION_CHANGES_FILE = 'regionChangesFile'  # fileOnServer in add/remove region data actions; never probed
+FEATURE_TYPED_ARRAYS = 'plotlyTypedArrays'  # plotly {'dtype', 'bdata'} arrays in chart payloads; never probed
+FEATURE_CHART_EXTEND = 'chartExtend'  # charts.data/chartExtend action appending points to traces; never probed
 
 
 def _parse_version(version_str: str) -> tuple[int, int] | None:
@@ -34,3 +45,27 @@ def is_server_compatible(server_version: str | None) -> bool:
     # Python tuples are compared lexicographically (element-by-element), so (2026, 1) >= (2025, 4)
     # evaluates as: 2026 > 2025 → True, without needing to inspect the minor at all
     return parsed_server_version >= _parse_version(MIN_SERVER_VERSION)
+
+
+class ServerFeatures:
+    """Which optional server features are known to be supported (True), unsupported (False) or unknown (None)."""
+
+    def __init__(self, advertised=None):
+        self._known = {}
+        self.set_advertised(advertised)
+
+    def set_advertised(self, advertised):
+        """Record the capabilities listed by the server; a server that lists any rules out all the others."""
+        if advertised:
+            self._known = {f: True for f in advertised}
+            self._complete = True
+        else:
+            self._complete = False
+
+    def supports(self, feature):
+        if feature in self._known:
+            return self._known[feature]
+        return False if self._complete else None
+
+    def set_supported(self, feature, supported):
+        self._known[feature] = supported
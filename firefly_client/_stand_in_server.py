@@ -0,0 +1,205 @@
+"""
+A small stand-in for the Firefly server endpoints that firefly_client talks to.
+
+It answers ``healthz``, ``CmdSrv/sync?cmd=CmdVersion``, ``upload``, ``pushAction`` and
+``pushAliveCheck`` well enough for a FireflyClient to run against it without a real
+Firefly server. It is used by the load generator and by the tests; it does not render anything.
+"""
+import json
+import os
+import socketserver
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+    from ._server_compat import FIREFLY_VERSION_KEY, FIREFLY_CAPABILITIES_KEY, FEATURE_BATCH_ACTIONS, \
+        FEATURE_COMPRESSED_REQUESTS, FEATURE_REGION_CHANGES_FILE, FEATURE_TYPED_ARRAYS, \
+        FEATURE_CHART_EXTEND
+except ImportError:
+    from _server_compat import FIREFLY_VERSION_KEY, FIREFLY_CAPABILITIES_KEY, FEATURE_BATCH_ACTIONS, \
+        FEATURE_COMPRESSED_REQUESTS, FEATURE_REGION_CHANGES_FILE, FEATURE_TYPED_ARRAYS, \
+        FEATURE_CHART_EXTEND
+try:
+    from ._compression import decompress
+except ImportError:
+    from _compression import decompress
+
+ALL_FEATURES = (FEATURE_BATCH_ACTIONS, FEATURE_COMPRESSED_REQUESTS, FEATURE_REGION_CHANGES_FILE,
+                FEATURE_TYPED_ARRAYS, FEATURE_CHART_EXTEND)
+
+
+class StandInFirefly:
+    """
+    The request handling logic of the stand-in server, independent of any HTTP server.
+
+    Parameters
+    ----------
+    version : `str`
+        Firefly version string reported by ``CmdVersion``.
+    latency : `float`
+        Seconds to sleep before answering each request, to mimic server work.
+    max_recorded : `int`
+        Number of most recent actions kept in `actions`.
+    features : `tuple` of `str`
+        Optional server features to implement, see `firefly_client._server_compat`.
+    advertise : `bool`
+        If True, list `features` in the ``CmdVersion`` response.
+    """
+
+    def __init__(self, version='2026.1', latency=0.0, max_recorded=10000, features=ALL_FEATURES, advertise=True):
+        self.version = version
+        self.features = set(features)
+        self.advertise = advertise
+        self.latency = latency
+        self.actions = deque(maxlen=max_recorded)
+        self.counts = Counter()
+        self.upload_bytes = 0
+        self.compressed_bytes = 0
+        self._upload_cnt = 0
+        self._lock = threading.Lock()
+
+    def handle(self, method, path, query, body=b'', content_type='', content_encoding=''):
+        """
+        Answer one request.
+
+        Parameters
+        ----------
+        method : {'GET', 'POST'}
+            HTTP method.
+        path : `str`
+            Request path, e.g. '/firefly/CmdSrv/sync'.
+        query : `dict`
+            Query parameters as returned by `urllib.parse.parse_qs`.
+        body : `bytes`
+            Request body.
+        content_type : `str`
+            Value of the Content-Type header of the request.
+        content_encoding : `str`
+            Value of the Content-Encoding header of the request.
+
+        Returns
+        -------
+        out : `tuple`
+            (status code, content type, response body as `bytes`)
+        """
+        self.latency and time.sleep(self.latency)
+        if content_encoding:
+            if FEATURE_COMPRESSED_REQUESTS not in self.features:
+                return self._count_and_reply('unsupported_encoding', 415, 'text/plain', b'Unsupported Media Type')
+            self.compressed_bytes += len(body)
+            body = decompress(body, content_encoding)
+        params = {k: v[0] for k, v in query.items()}
+        if method == 'POST' and content_type.startswith('application/x-www-form-urlencoded'):
+            params.update({k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()})
+
+        if path.endswith('/healthz'):
+            return self._count_and_reply('healthz', 200, 'text/plain', b'OK')
+        if not path.endswith('/CmdSrv/sync'):
+            return self._count_and_reply('not_found', 404, 'text/plain', b'Not Found')
+
+        cmd = params.get('cmd')
+        if cmd == 'CmdVersion':
+            data = {FIREFLY_VERSION_KEY: self.version}
+            self.advertise and data.update({FIREFLY_CAPABILITIES_KEY: sorted(self.features)})
+            return self._reply_json(cmd, {'success': True, 'data': data})
+        elif cmd == 'upload':
+            with self._lock:
+                self._upload_cnt += 1
+                self.upload_bytes += len(body)
+                name = '${upload-dir}/stand-in-upload-%d' % self._upload_cnt
+            return self._count_and_reply(cmd, 200, 'text/plain', name.encode('utf-8'))
+        elif cmd == 'pushAction':
+            self.actions.append(json.loads(params.get('action', '{}')))
+            return self._reply_json(cmd, [{'success': True}])
+        elif cmd == FEATURE_BATCH_ACTIONS and cmd in self.features:
+            actions = json.loads(params.get('actions', '[]'))
+            self.actions.extend(actions)
+            return self._reply_json(cmd, [{'success': True} for _ in actions])
+        elif cmd == 'pushAliveCheck':
+            return self._reply_json(cmd, [{'active': True}])
+        return self._count_and_reply(cmd, 400, 'text/plain', ('Unknown command: %s' % cmd).encode('utf-8'))
+
+    def _reply_json(self, cmd, obj):
+        return self._count_and_reply(cmd, 200, 'application/json', json.dumps(obj).encode('utf-8'))
+
+    def _count_and_reply(self, cmd, status, content_type, body):
+        with self._lock:
+            self.counts[cmd] += 1
+        return status, content_type, body
+
+
+class StandInServer:
+    """
+    Serve a `StandInFirefly` over HTTP on a local port in a background thread.
+
+    Parameters
+    ----------
+    host : `str`
+        Interface to bind to.
+    port : `int`
+        Port to bind to. The default, 0, picks a free port.
+    unix_socket : `str`, optional
+        Listen on a Unix domain socket at this path instead of a TCP port; clients then need
+        a `firefly_client.transport.UnixSocketTransport`.
+    **firefly_params : optional keyword arguments
+        Passed to `StandInFirefly`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, unix_socket=None, **firefly_params):
+        self.firefly = StandInFirefly(**firefly_params)
+        firefly = self.firefly
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = not unix_socket
+
+            def _do(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                status, content_type, out = firefly.handle(self.command, parsed.path, parse_qs(parsed.query),
+                                                           body, self.headers.get('Content-Type', ''),
+                                                           self.headers.get('Content-Encoding', ''))
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET = _do
+            do_POST = _do
+
+            def log_message(self, *args):
+                pass
+
+        self.unix_socket = unix_socket
+        if unix_socket:
+            self.httpd = socketserver.ThreadingUnixStreamServer(unix_socket, Handler)
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        if self.unix_socket:
+            return 'http://localhost/firefly'
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%d/firefly' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.unix_socket and os.path.exists(self.unix_socket) and os.unlink(self.unix_socket)
+
+    def __enter__(self): return self.start()
+
+    def __exit__(self, *exc): self.stop()
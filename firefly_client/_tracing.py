@@ -0,0 +1,218 @@
+"""
+Lightweight in-process tracing of client calls.
+
+A traced call such as `FireflyClient.show_fits_image` opens a root span, and the upload,
+dispatch and HTTP request it makes open nested spans with the same trace ID. When a websocket
+event later arrives for the plot, table or chart an action targeted, a span for the event is
+added to that trace, covering the time from the dispatch until the event. That splits the
+latency of a call into upload, server and browser time.
+
+Finished spans go to exporters, which are plain callables taking a `Span`. `InMemoryExporter`
+keeps them in a list and `JsonLinesExporter` appends them to a file; no collector is needed.
+Tracing is off until enabled, e.g. through `FireflyClient.enable_tracing`.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_span = ContextVar('firefly_client_span', default=None)
+
+
+def _new_id(nbytes): return os.urandom(nbytes).hex()
+
+
+class Span:
+    """One timed operation of a trace. Times are seconds since the epoch."""
+
+    def __init__(self, name, trace_id, parent_id=None, start=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    @property
+    def duration(self): return None if self.end is None else self.end - self.start
+
+    def set(self, **attributes): self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {'name': self.name, 'trace_id': self.trace_id, 'span_id': self.span_id,
+                'parent_id': self.parent_id, 'start': self.start, 'end': self.end,
+                'duration': self.duration, 'attributes': self.attributes, 'error': self.error}
+
+    def __repr__(self):
+        return 'Span(%s, trace=%s, duration=%s)' % (self.name, self.trace_id, self.duration)
+
+
+class InMemoryExporter:
+    """Exporter that keeps finished spans in `spans`, at most `max_spans` of them."""
+
+    def __init__(self, max_spans=10000):
+        self.max_spans = max_spans
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        with self._lock:
+            self.spans.append(span)
+            del self.spans[:-self.max_spans]
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def traces(self):
+        """Finished spans grouped by trace ID (`dict`), each list ordered by start time."""
+        out = {}
+        with self._lock:
+            for span in sorted(self.spans, key=lambda s: s.start):
+                out.setdefault(span.trace_id, []).append(span)
+        return out
+
+    def to_json(self):
+        with self._lock:
+            return json.dumps([s.to_dict() for s in self.spans], indent=2, default=str)
+
+
+class JsonLinesExporter:
+    """Exporter that appends each finished span as one line of JSON to the file at `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, 'a') as fp:
+            fp.write(line + '\n')
+
+
+class Tracer:
+    """
+    Creates spans and sends finished ones to the exporters.
+
+    It also remembers the targets (plot, table or chart IDs) of recently dispatched actions,
+    so websocket events about those targets join the trace of the action.
+    """
+
+    CORRELATION_TTL = 60.0
+    MAX_CORRELATIONS = 1000
+
+    def __init__(self):
+        self.enabled = False
+        self.exporters = []
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_exporter(self, exporter):
+        exporter not in self.exporters and self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter):
+        exporter in self.exporters and self.exporters.remove(exporter)
+
+    def current_span(self): return _current_span.get()
+
+    def _export(self, span):
+        for exporter in list(self.exporters):
+            try:
+                exporter(span)
+            except Exception:
+                pass  # an exporter must never break the traced call
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Open a span nested in the current one (a new trace if there is none) for the ``with`` block.
+        Yields the `Span`, or None if tracing is off.
+        """
+        if not self.enabled:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else _new_id(16), parent.span_id if parent else None,
+                    attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = '%s: %s' % (type(err).__name__, err)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.time()
+            self._export(span)
+
+    def correlate(self, targets, span):
+        """Remember that websocket events about any of `targets` belong to the trace of `span`."""
+        if not self.enabled or span is None:
+            return
+        now = time.time()
+        with self._lock:
+            for target in targets:
+                self._pending.pop(target, None)
+                self._pending[target] = (span, now)
+            while len(self._pending) > self.MAX_CORRELATIONS:
+                self._pending.popitem(last=False)
+
+    def record_event(self, event_name, targets, **attributes):
+        """
+        Add a span for a websocket event to the trace of the latest action dispatched for one of
+        `targets`. The span starts when that action was dispatched and ends now.
+        """
+        if not self.enabled or not targets:
+            return None
+        now = time.time()
+        with self._lock:
+            while self._pending:
+                oldest = next(iter(self._pending.values()))
+                if now - oldest[1] <= self.CORRELATION_TTL:
+                    break
+                self._pending.popitem(last=False)
+            found = [self._pending[t] for t in targets if t in self._pending]
+        if not found:
+            return None
+        action_span, dispatched = max(found, key=lambda f: f[1])
+        span = Span('ws_event', action_span.trace_id, action_span.span_id, start=dispatched,
+                    attributes=dict(attributes, event=event_name))
+        span.end = now
+        self._export(span)
+        return span
+
+
+tracer = Tracer()
+
+
+def traced(func):
+    """Decorator that runs the method in a span named after it, when tracing is on."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not tracer.enabled:
+            return func(*args, **kwargs)
+        with tracer.span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def targets_of(payload):
+    """IDs of the plots, tables and charts an action payload or event data refers to (`list`)."""
+    if not isinstance(payload, dict):
+        return []
+    targets = []
+    for key in ('plotId', 'tbl_id', 'chartId'):
+        value = payload.get(key)
+        if isinstance(value, str):
+            targets.append(value)
+        elif isinstance(value, (list, tuple)):
+            targets.extend(v for v in value if isinstance(v, str))
+    for nested in ('request', 'wpRequest', 'payload'):
+        isinstance(payload.get(nested), dict) and targets.extend(targets_of(payload[nested]))
+    return targets
@@ -0,0 +1,57 @@
+"""
+Background uploads of `FireflyClient`, e.g. the full resolution image of a progressive display.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+try:
+    from .fc_utils import warn, upload_logger
+except ImportError:
+    from fc_utils import warn, upload_logger
+
+
+class UploadPool:
+    """
+    Thread pool running uploads, and the actions showing what they uploaded, in the background.
+
+    The threads are started on the first `submit`. Errors are logged as warnings and raised
+    again by the `result` of the future.
+
+    Parameters
+    ----------
+    workers : `int`
+        Number of uploads running at the same time.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = None
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` in the pool, return its `concurrent.futures.Future`."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='firefly-upload')
+            future = self._executor.submit(func, *args, **kwargs)
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        if not future.cancelled() and future.exception():
+            warn('background upload failed: %s', future.exception(), log=upload_logger)
+
+    def wait(self, timeout=None):
+        """Wait until the submitted uploads are done. Returns True if none is left."""
+        with self._lock:
+            futures = list(self._futures)
+        return not wait(futures, timeout).not_done
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        executor and executor.shutdown(wait=False, cancel_futures=True)
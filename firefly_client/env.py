@@ -16,6 +16,8 @@ ENV_FF_URL = 'FIREFLY_URL'
 ENV_FF_CHANNEL = 'FIREFLY_CHANNEL'
 ENV_FF_HTML = 'FIREFLY_HTML'
 ENV_USER = 'USER'
+ENV_FF_AUTO_BATCH = 'FIREFLY_AUTO_BATCH'
+ENV_FF_UNIX_SOCKET = 'FIREFLY_UNIX_SOCKET'
 
 EXT_INCORRECT = 'jupyter_firefly_extensions appears to be installed incorrectly.'
 SUGGESTION = 'fix jupyter_firefly_extensions in Jupyter Lab or use FireflyClient.make_client()'
@@ -31,6 +33,8 @@ class Env:
     firefly_channel_from_env = os.environ.get(ENV_FF_CHANNEL)
     firefly_html = os.environ.get(ENV_FF_HTML, '')
     user = os.environ.get(ENV_USER, '')
+    auto_batch = str_2_bool(os.environ.get(ENV_FF_AUTO_BATCH, ''))
+    unix_socket = os.environ.get(ENV_FF_UNIX_SOCKET)
 
     @classmethod
     def validate_lab_client(cls, generate_lab_ext_channel):
@@ -1,17 +1,97 @@
 import json
+import logging
+import sys
 import urllib.parse
 import mimetypes
 import base64
+from collections import Counter
+
+logger = logging.getLogger('firefly_client')
+dispatch_logger = logger.getChild('dispatch')
+upload_logger = logger.getChild('upload')
+ws_logger = logger.getChild('ws')
 
 
 class DebugMarker:
     firefly_client_debug = False
+    payload_limit = 2000  # max characters of a payload in a log message, None for no limit
+    sample_every = 1  # log only every Nth dispatch debug message of an action type
+
+
+class _DefaultHandler(logging.StreamHandler):
+    """Print 'LEVEL: message' to stdout, unless the application configured logging itself."""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+        self.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+
+    def emit(self, record):
+        if logging.getLogger().handlers:
+            return  # the record propagates to the handlers of the application
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+logger.addHandler(_DefaultHandler())
+
+
+class LazyJSON:
+    """JSON text of `obj`, built only when a log message is formatted, cut to `DebugMarker.payload_limit` characters."""
+
+    def __init__(self, obj, limit=None):
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self):
+        text = json.dumps(self.obj, indent=2, default=str)
+        limit = self.limit or DebugMarker.payload_limit
+        if limit and len(text) > limit:
+            return '%s ... <%d more characters>' % (text[:limit], len(text) - limit)
+        return text
+
+
+_sample_counts = Counter()
+
+
+def sampled(key):
+    """True for the first and then every `DebugMarker.sample_every`-th call with `key`."""
+    if DebugMarker.sample_every <= 1:
+        return True
+    _sample_counts[key] += 1
+    return _sample_counts[key] % DebugMarker.sample_every == 1
+
+
+def set_debug(on):
+    """Turn debug logging of the firefly_client loggers on, or back to the level inherited from the root logger."""
+    if on != DebugMarker.firefly_client_debug:
+        logger.setLevel(logging.DEBUG if on else logging.NOTSET)
+    DebugMarker.firefly_client_debug = on
+
+
+def configure_logging(level=None, payload_limit=False, sample_every=None):
+    """
+    Configure the firefly_client loggers.
+
+    Parameters
+    ----------
+    level : `int` or `str`, optional
+        Level of the 'firefly_client' logger, e.g. 'DEBUG'. The 'dispatch', 'upload' and 'ws'
+        child loggers can also be configured through the `logging` module.
+    payload_limit : `int` or None, optional
+        Maximum number of characters of a payload in a log message, None for no limit.
+    sample_every : `int`, optional
+        Log only the first and every Nth debug message of dispatched actions of each type.
+    """
+    level is not None and logger.setLevel(level)
+    payload_limit is not False and setattr(DebugMarker, 'payload_limit', payload_limit)
+    sample_every and setattr(DebugMarker, 'sample_every', sample_every)
 
 
 def str_2_bool(v): return v.lower() in ("yes", "true", "t", "1")
 def _make_key(channel, location): return channel+'---'+location
-def debug(s): DebugMarker.firefly_client_debug and print('DEBUG: %s' % s)
-def warn(s): print('WARNING: %s' % s)
+def is_debug(log=logger): return log.isEnabledFor(logging.DEBUG)
+def debug(msg, *args, log=logger): log.isEnabledFor(logging.DEBUG) and log.debug(msg, *args)
+def warn(msg, *args, log=logger): log.warning(msg, *args)
 def dict_to_str(in_dict): return json.dumps(in_dict, indent=2, default=str)
 
 
@@ -74,6 +154,8 @@ ACTION_DICT = {
     'TableSort': 'table.sort',
     'ShowXYPlot': 'charts.data/chartAdd',
     'ShowPlot': 'charts.data/chartAdd',
+    'UpdateChart': 'charts.data/chartUpdate',
+    'ExtendChart': 'charts.data/chartExtend',
     'ZoomImage': 'ImagePlotCntlr.ZoomImage',
     'PanImage': 'ImagePlotCntlr.recenter',
     'AlignImages': 'ImagePlotCntlr.wcsMatch',
@@ -4,24 +4,79 @@ import time
 from urllib.parse import urljoin
 import math
 import base64
-import traceback
+import threading
 import _thread
-from copy import deepcopy
+from itertools import count
+from json import JSONDecodeError
 try:
     from .env import Env
 except ImportError:
     from env import Env
 
 try:
-    from .fc_utils import ALL, debug, warn, dict_to_str, DebugMarker
+    from .fc_utils import ALL, debug, warn, is_debug, LazyJSON, ws_logger
 except ImportError:
-    from fc_utils import ALL, debug, warn, dict_to_str, DebugMarker
+    from fc_utils import ALL, debug, warn, is_debug, LazyJSON, ws_logger
+try:
+    from ._metrics import metrics
+except ImportError:
+    from _metrics import metrics
+try:
+    from ._tracing import tracer, targets_of
+except ImportError:
+    from _tracing import tracer, targets_of
 
 
 MAX_CHANNELS = 3
+WS_ACTION_MESSAGE = 'pushAction'
+WS_ACTION_ACK = 'pushActionAck'
 def _make_key(channel, location): return channel+'---'+location
 
 
+class PendingAcks:
+    """Request IDs of actions sent over the websocket that wait for their acknowledgement."""
+
+    def __init__(self):
+        self._ids = count(1)
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def register(self):
+        waiter = {'event': threading.Event(), 'status': None, 'error': None}
+        with self._lock:
+            request_id = next(self._ids)
+            self._waiters[request_id] = waiter
+        return request_id, waiter
+
+    def resolve(self, request_id, status):
+        with self._lock:
+            waiter = self._waiters.pop(request_id, None)
+        if waiter:
+            waiter['status'] = status
+            waiter['event'].set()
+
+    def fail_all(self, error):
+        with self._lock:
+            waiters, self._waiters = self._waiters, {}
+        for waiter in waiters.values():
+            waiter['error'] = error
+            waiter['event'].set()
+
+    def discard(self, request_ids):
+        """Stop waiting for the acknowledgement of `request_ids`; resolved ones are already gone."""
+        with self._lock:
+            for request_id in request_ids:
+                self._waiters.pop(request_id, None)
+
+    def wait(self, request_id, waiter, timeout):
+        if not waiter['event'].wait(timeout):
+            self.discard([request_id])
+            raise TimeoutError('no acknowledgement for websocket action %s within %ss' % (request_id, timeout))
+        if waiter['error']:
+            raise waiter['error']
+        return waiter['status']
+
+
 class FFWs:
     """
     For use only by FireflyClient to manage web sockets and channel connections. This class should never be instantiated
@@ -44,7 +99,7 @@ class FFWs:
                 err_msg = 'You may only use %s channels for a python session' % MAX_CHANNELS
                 raise ConnectionRefusedError(err_msg)
             cls.connections[key] = cls(channel, wsproto, location, auth_headers, header_cb)
-            debug('starting chan: %s %s url:%s' % (channel, wsproto, location))
+            debug('starting chan: %s %s url:%s', channel, wsproto, location, log=ws_logger)
         return cls.connections[key]
 
     @classmethod
@@ -79,29 +134,30 @@ class FFWs:
         self.channel_headers = {'FF-channel': channel}
         self.listeners = {}
         self.forever_loop = True
+        self.connected = threading.Event()
+        self.pending_acks = PendingAcks()
 
         def on_message(wsapp, ev):
             try:
                 self.received_message(ev, header_cb)
             except Exception as on_mess_ex:
-                print(traceback.format_exc())
+                ws_logger.exception('error handling websocket message')
                 raise on_mess_ex
 
         def on_open(wsapp):
-            if not DebugMarker.firefly_client_debug:
+            if not is_debug(ws_logger):
                 return
             try:
-                debug('on open: Status: %d' % wsapp.sock.handshake_response.status)
-                debug('response headers: \n%s' % dict_to_str(wsapp.sock.handshake_response.headers))
+                debug('on open: Status: %d', wsapp.sock.handshake_response.status, log=ws_logger)
+                debug('response headers: \n%s', LazyJSON(wsapp.sock.handshake_response.headers), log=ws_logger)
             except Exception as open_ex:
-                print(traceback.format_exc())
+                ws_logger.exception('error handling websocket open')
                 raise open_ex
 
         def on_error(wsapp, exception_from_socket):
-            warn('Error: Websocket connection failed')
-            print(exception_from_socket)
-            warn('Websocket Status: %d' % wsapp.sock.handshake_response.status)
-            warn('Websocket response headers: \n%s' % dict_to_str(wsapp.sock.handshake_response.headers))
+            warn('Error: Websocket connection failed: %s', exception_from_socket, log=ws_logger)
+            warn('Websocket Status: %d', wsapp.sock.handshake_response.status, log=ws_logger)
+            warn('Websocket response headers: \n%s', LazyJSON(wsapp.sock.handshake_response.headers), log=ws_logger)
             raise exception_from_socket
 
         def threaded_connect():
@@ -115,10 +171,12 @@ class FFWs:
                 self.debug_show_env(socket_headers)
                 self.websocket.run_forever(ping_interval=10)
                 self.forever_loop = False
-                debug('websocket thread ended')
+                debug('websocket thread ended', log=ws_logger)
             except Exception:
-                debug('websocket thread ended with exception')
-                print(traceback.format_exc())
+                ws_logger.exception('websocket thread ended with exception')
+            finally:
+                self.connected.clear()
+                self.pending_acks.fail_all(ConnectionError('websocket connection closed'))
 
         try:
             _thread.start_new_thread(threaded_connect, ())
@@ -126,70 +184,114 @@ class FFWs:
             raise ValueError(Env.failed_net_message(location)) from err
 
     def debug_show_env(self, socket_headers):
-        if not DebugMarker.firefly_client_debug:
+        if not is_debug(ws_logger):
             return
-        debug('Attempting to connect\n    %s\n    %s\n    channel: %s' % (self.location, self.ws_url, self.channel))
-        debug('Header sent to websocket connections: %s' % dict_to_str(socket_headers))
+        debug('Attempting to connect\n    %s\n    %s\n    channel: %s', self.location, self.ws_url, self.channel,
+              log=ws_logger)
+        debug('Header sent to websocket connections: %s', LazyJSON(socket_headers), log=ws_logger)
 
     def debug_header_event_message(self, ev):
-        if not DebugMarker.firefly_client_debug:
+        if not is_debug(ws_logger):
             return
-        debug('Event: %s' % ev['name'])
-        log_ev = deepcopy(ev)
-        try:
-            log_ev['data']['plotState']['bandStateAry'] = '<<<<<truncated>>>>>'
-        except KeyError:
-            pass
-        debug('JSON Data:\n%s' % json.dumps(log_ev, indent=2, default=str))
-        debug('All Listeners for channel: %s, location: %s' % (self.channel, self.location))
+        debug('Event: %s', ev['name'], log=ws_logger)
+        log_ev = ev
+        plot_state = ev.get('data', {}).get('plotState') if isinstance(ev.get('data'), dict) else None
+        if isinstance(plot_state, dict) and 'bandStateAry' in plot_state:
+            log_ev = {**ev, 'data': {**ev['data'], 'plotState': {**plot_state, 'bandStateAry': '<<<<<truncated>>>>>'}}}
+        debug('JSON Data:\n%s', LazyJSON(log_ev), log=ws_logger)
+        debug('All Listeners for channel: %s, location: %s', self.channel, self.location, log=ws_logger)
         for callback, eventIDList in self.listeners.items():
-            debug("          %s" % eventIDList)
+            debug("          %s", eventIDList, log=ws_logger)
         self.execute_callbacks(ev, do_callback=False)
 
-    def execute_callbacks(self, ev, do_callback=True):
+    def execute_callbacks(self, ev, do_callback=True, received=None):
         name = ev['name']
         for callback, eventIDList in self.listeners.items():
             if name in eventIDList or ALL in eventIDList:
-                callback(ev) if do_callback else debug('callback: %s' % name)
+                if not do_callback:
+                    debug('callback: %s', name, log=ws_logger)
+                elif not metrics.enabled:
+                    callback(ev)
+                else:
+                    cb_name = getattr(callback, '__qualname__', repr(callback))
+                    received and metrics.observe('ws_callback_lag_seconds', time.perf_counter() - received)
+                    with metrics.timer('ws_callback_seconds', callback=cb_name):
+                        callback(ev)
 
     def received_message(self, message, header_cb):
+        received = time.perf_counter()
+        metrics.mark('ws_messages', channel=self.channel)
         try:
             ev = json.loads(message)
         except JSONDecodeError as err:
-            warn('Error with JSON input - event string could not be parsed')
-            warn(message)
-            warn(err)
+            warn('Error with JSON input - event string could not be parsed: %s\n%s', err, message, log=ws_logger)
             return
 
         if ev['name'] == 'EVT_CONN_EST':
             try:
                 conn_info = ev['data']
-                debug('Connection established:\n    %s' % message)
+                debug('Connection established:\n    %s', message, log=ws_logger)
                 if self.channel is None:
                     self.channel = conn_info['channel']
                 self.channel_headers = {'FF-channel': self.channel, 'FF-connID': conn_info.get('connID')}
                 header_cb(self.channel_headers)
+                self.connected.set()
             except Exception as err:
-                print(message)
-                raise err
+                warn('Could not establish the connection from the event: %s\n%s', err, message, log=ws_logger)
+                raise
+        elif ev['name'] == WS_ACTION_ACK:
+            data = ev.get('data', {})
+            self.pending_acks.resolve(data.get('requestId'), data)
         else:
+            tracer.enabled and tracer.record_event(ev['name'], targets_of(ev.get('data')), channel=self.channel)
             self.debug_header_event_message(ev)
-            self.execute_callbacks(ev)
+            self.execute_callbacks(ev, received=received)
 
     def disconnect(self):
         """Disconnect the WebSocket.
         """
         self.websocket.close()
 
+    def send_actions(self, data_list, timeout):
+        """
+        Send actions as websocket frames, then wait for all their acknowledgements.
+
+        Parameters
+        ----------
+        data_list : `list` of `dict`
+            Form data of each action, as it would be posted to CmdSrv/sync.
+        timeout : `float`
+            Seconds to wait for each acknowledgement.
+
+        Returns
+        -------
+        out : `list` of `dict`
+            Status of each action.
+
+        .. note:: Raises ConnectionError, before anything is sent, if the websocket is not connected.
+        """
+        if not self.connected.is_set():
+            raise ConnectionError('websocket is not connected')
+        sent = []
+        try:
+            for data in data_list:
+                request_id, waiter = self.pending_acks.register()
+                sent.append((request_id, waiter))
+                self.websocket.send(json.dumps({'name': WS_ACTION_MESSAGE, 'requestId': request_id, 'data': data}))
+            return [self.pending_acks.wait(request_id, waiter, timeout) for request_id, waiter in sent]
+        finally:
+            # after a timeout or a failed send, the actions not acknowledged yet are not waited for anymore
+            self.pending_acks.discard([request_id for request_id, _ in sent])
+
     def do_add_listener(self, callback, name=ALL):
-        debug('adding listener to %s, %s' % (self.channel, self.ws_url))
+        debug('adding listener to %s, %s', self.channel, self.ws_url, log=ws_logger)
         if callback not in self.listeners.keys():
             self.listeners[callback] = []
         if name not in self.listeners[callback]:
             self.listeners[callback].append(name)
 
     def do_remove_listener(self, callback, name=ALL):
-        debug('removing listener to %s, %s' % (self.channel, self.ws_url))
+        debug('removing listener to %s, %s', self.channel, self.ws_url, log=ws_logger)
         if callback in self.listeners.keys():
             if name in self.listeners[callback]:
                 self.listeners[callback].remove(name)
@@ -6,16 +6,18 @@ by dispatching remote actions.
 """
 import io
 import re
-import requests
-import webbrowser
 import json
 import time
-import socket
 from urllib.parse import urljoin
 import math
 import weakref
 import os
+import tempfile
+import threading
+import functools
+from contextlib import contextmanager
 from copy import copy
+from itertools import chain, groupby
 
 
 try:
@@ -31,15 +33,57 @@ try:
 except ImportError:
     from range_values import RangeValues
 try:
-    from .fc_utils import debug, warn, dict_to_str, create_image_url, ensure3, gen_item_id,\
-        DebugMarker, ALL, ACTION_DICT, LO_VIEW_DICT
+    from .fc_utils import debug, warn, is_debug, sampled, set_debug, configure_logging, LazyJSON, \
+        create_image_url, ensure3, gen_item_id, ALL, ACTION_DICT, LO_VIEW_DICT, dispatch_logger, upload_logger
 except ImportError:
-    from fc_utils import debug, warn, dict_to_str, create_image_url, ensure3, gen_item_id,\
-        DebugMarker, ALL, ACTION_DICT, LO_VIEW_DICT
+    from fc_utils import debug, warn, is_debug, sampled, set_debug, configure_logging, LazyJSON, \
+        create_image_url, ensure3, gen_item_id, ALL, ACTION_DICT, LO_VIEW_DICT, dispatch_logger, upload_logger
 try:
-    from ._server_compat import MIN_SERVER_VERSION, FIREFLY_VERSION_KEY, is_server_compatible
+    from ._sender import BackgroundSender, RoundTripEstimator, coalesce_key
 except ImportError:
-    from _server_compat import MIN_SERVER_VERSION, FIREFLY_VERSION_KEY, is_server_compatible
+    from _sender import BackgroundSender, RoundTripEstimator, coalesce_key
+try:
+    from .transport import RequestsTransport, UnixSocketTransport
+    from .regions import Regions
+except ImportError:
+    from transport import RequestsTransport, UnixSocketTransport
+    from regions import Regions
+try:
+    from ._compression import RequestCompression, FORM_CONTENT_TYPE
+except ImportError:
+    from _compression import RequestCompression, FORM_CONTENT_TYPE
+try:
+    from ._charts import ChartStream, large_trace_columns, to_jsonable
+except ImportError:
+    from _charts import ChartStream, large_trace_columns, to_jsonable
+try:
+    from ._fits import binned_cards, block_mean, image_array, image_cards, open_image, write_bintable, \
+        write_cutout, write_image
+    from ._uploads import UploadPool
+except ImportError:
+    from _fits import binned_cards, block_mean, image_array, image_cards, open_image, write_bintable, \
+        write_cutout, write_image
+    from _uploads import UploadPool
+try:
+    from ._metrics import metrics
+except ImportError:
+    from _metrics import metrics
+try:
+    from ._tracing import tracer, traced, targets_of, InMemoryExporter
+except ImportError:
+    from _tracing import tracer, traced, targets_of, InMemoryExporter
+try:
+    from ._scheduler import SendScheduler, BULK, NORMAL, lane_for_data
+except ImportError:
+    from _scheduler import SendScheduler, BULK, NORMAL, lane_for_data
+try:
+    from ._server_compat import MIN_SERVER_VERSION, FIREFLY_VERSION_KEY, FIREFLY_CAPABILITIES_KEY, \
+        FEATURE_BATCH_ACTIONS, FEATURE_WS_ACTIONS, FEATURE_COMPRESSED_REQUESTS, FEATURE_REGION_CHANGES_FILE, \
+        FEATURE_TYPED_ARRAYS, FEATURE_CHART_EXTEND, ServerFeatures, is_server_compatible
+except ImportError:
+    from _server_compat import MIN_SERVER_VERSION, FIREFLY_VERSION_KEY, FIREFLY_CAPABILITIES_KEY, \
+        FEATURE_BATCH_ACTIONS, FEATURE_WS_ACTIONS, FEATURE_COMPRESSED_REQUESTS, FEATURE_REGION_CHANGES_FILE, \
+        FEATURE_TYPED_ARRAYS, FEATURE_CHART_EXTEND, ServerFeatures, is_server_compatible
 
 __docformat__ = 'restructuredtext'
 _def_html_file = Env.find_default_firefly_html()
@@ -50,6 +94,11 @@ LAB = 'lab'
 UNKNOWN = 'UNKNOWN'
 
 
+@functools.lru_cache(maxsize=256)
+def _stretch_rv(algorithm, stype, params):
+    return RangeValues.create_rv_by_stretch_type(algorithm, stype, **dict(params))
+
+
 class FireflyClient:
     """
     For Firefly client to build interface to remotely communicate to the Firefly viewer.
@@ -116,6 +165,16 @@ class FireflyClient:
     PINNED_CHART_VIEWER_ID = 'PINNED_CHART_VIEWER_ID'
     PINNED_IMAGE_VIEWER_ID = 'DEFAULT_FITS_VIEWER_ID'
 
+    # region data larger than this many characters is uploaded as a region file, see `region_spill_bytes`
+    REGION_SPILL_BYTES = 256 * 1024
+    # chart trace arrays with at least this many points are uploaded as a table, see `chart_table_points`
+    CHART_TABLE_POINTS = 10000
+    # progressive image displays show first a preview binned to at most this many pixels on a side
+    PREVIEW_SIZE = 512
+    # colors of the mask layers added by `add_masks`, in bit order
+    MASK_COLORS = ('#ff0000', '#00ff00', '#0000ff', '#ffff00', '#ff00ff', '#00ffff', '#ff8000', '#8000ff',
+                   '#0080ff', '#ff0080', '#80ff00', '#00ff80')
+
     _debug = False
     # Keep track of instances.
     instances = []
@@ -174,7 +233,7 @@ class FireflyClient:
 
     @classmethod
     def make_client(cls, url=_default_url, html_file=_def_html_file, launch_browser=True,
-                    channel_override=None, verbose=False, token=None, viewer_override=None):
+                    channel_override=None, verbose=False, token=None, viewer_override=None, transport=None):
         """
         Factory method to create a Firefly client in a plain Python, IPython, or
         notebook session, and attempt to open a display.  If a display cannot be
@@ -214,19 +273,23 @@ class FireflyClient:
             It is only for those special circumstances that you would use
             firefly_client to control a custom created interface that is not a triview ora slate view.
             maybe one of FireflyClient.TRIVIEW_VIEWER, FireflyClient.SLATE_VIEWER, FireflyClient.NO_VIEWER,
+        transport: `firefly_client.transport.Transport` or None
+            How HTTP requests reach the server, see `firefly_client.transport`. The default is a
+            `UnixSocketTransport` if the environment variable 'FIREFLY_UNIX_SOCKET' is set to the
+            path of a socket, else a `RequestsTransport`.
 
         Returns
         -------
         fc : `FireflyClient`
             A FireflyClient that works in the lab environment
         """
-        fc = cls(url, Env.resolve_client_channel(channel_override), html_file, token, viewer_override)
+        fc = cls(url, Env.resolve_client_channel(channel_override), html_file, token, viewer_override, transport)
         verbose and Env.show_start_browser_tab_msg(fc.get_firefly_url())
         launch_browser and fc.launch_browser()
         return fc
 
-    def __init__(self, url, channel, html_file=_def_html_file, token=None, viewer_override=None):
-        DebugMarker.firefly_client_debug = FireflyClient._debug
+    def __init__(self, url, channel, html_file=_def_html_file, token=None, viewer_override=None, transport=None):
+        set_debug(FireflyClient._debug)
         FireflyClient.instances.append(weakref.ref(self))
 
         ssl = url.startswith('https://')
@@ -239,6 +302,22 @@ class FireflyClient:
         self.auth_headers = {'Authorization': 'Bearer {}'.format(token)} if token and ssl else None
         self.header_from_ws = {'FF-channel': channel}
         self.lab_env_tab_type = UNKNOWN
+        self._sender = None
+        self._local = threading.local()  # per thread state of batch()
+        self.round_trip = RoundTripEstimator()
+        self.server_features = ServerFeatures()
+        self._ws_actions = False
+        self.scheduler = SendScheduler.for_server(self.location)
+        self._ws_ack_timeout = 5.0
+        self.compression = None
+        self.region_spill_bytes = FireflyClient.REGION_SPILL_BYTES
+        self.chart_table_points = FireflyClient.CHART_TABLE_POINTS
+        self.chart_flush_interval = 0.1
+        self._chart_streams = {}
+        self._chart_lock = threading.RLock()
+        self.preview_size = FireflyClient.PREVIEW_SIZE
+        self._uploads = UploadPool()
+        self._progressive = {}  # plot ID to the number of its latest progressive display
 
         # urls for cmd service and browser
         protocol = 'https' if ssl else 'http'
@@ -246,17 +325,19 @@ class FireflyClient:
         self.url_browser = urljoin(urljoin(f'{protocol}://{self.location}/', html_file), '?__wsch=')
         self.url_bw = self.url_browser  # keep around for backward compatibility
 
-        self.session = requests.Session()
-        token and ssl and self.session.headers.update(self.auth_headers)
+        if transport is None:
+            transport = UnixSocketTransport(Env.unix_socket) if Env.unix_socket else RequestsTransport()
+        self.transport = transport
+        self.session = getattr(transport, 'session', transport)  # kept for backward compatibility
+        token and ssl and self.transport.headers.update(self.auth_headers)
         not ssl and token and warn('token ignored: should be None when url starts with http://')
         self.firefly_viewer = FireflyClient.get_viewer_mode(html_file,viewer_override)
 
-        access = FireflyClient.confirm_access(url, token)
+        access = FireflyClient.confirm_access(url, token, self.transport)
         if not access['success']:
-            debug(f'Failed to access url: {url}, with token: {token}\n'
-                  f'Response status: {access["response"].status_code} ({access["response"].reason})\n'
-                  f'Response headers: {dict_to_str(access["response"].headers)}\n'
-                  f'Response text: {access["response"].text}')
+            debug('Failed to access url: %s, with token: %s\nResponse status: %s (%s)\n'
+                  'Response headers: %s\nResponse text: %s', url, token, access['response'].status_code,
+                  access['response'].reason, LazyJSON(dict(access['response'].headers)), access['response'].text)
             url_err_msg = Env.failed_net_message(url, access['response'].status_code)
             token_err_msg = (
                 'Check if the passed `token` is valid and has the necessary '
@@ -275,8 +356,9 @@ class FireflyClient:
                 f'  Required: >={MIN_SERVER_VERSION}\n'
                 f'  Please use the URL of a compatible Firefly server\n'
             )
+        Env.auto_batch and self.start_background_sender(auto_batch=True)
 
-        debug(f'new instance: {url}')
+        debug('new instance: %s', url)
 
     def _lab_env_tab_start(self, tab_type, html_file):
         """start a tab in the lab environment, tab_type must be 'lab' or 'browser' """
@@ -310,16 +392,16 @@ class FireflyClient:
             return FireflyClient.SLATE_VIEWER if html_file == 'slate.html' else FireflyClient.TRIVIEW_VIEWER
         
     @staticmethod
-    def confirm_access(url, token=None):
+    def confirm_access(url, token=None, transport=None):
         headers = {'Authorization': f'Bearer {token}'} if token else None
         healthz_url = url + ('healthz' if url.endswith('/') else '/healthz')
         # disable redirects that may happen in the absence of a token
-        response = requests.get(healthz_url, headers=headers, allow_redirects=False)
+        response = (transport or RequestsTransport()).get(healthz_url, headers=headers, allow_redirects=False)
         return {'success': response.status_code == 200, 'response': response}
 
     def _confirm_version(self):
         version_url = f'{self.url_cmd_service}?cmd=CmdVersion'
-        server_response = self.session.get(version_url, headers=self.header_from_ws)
+        server_response = self.transport.get(version_url, headers=self.header_from_ws)
 
         server_version = None
         compatible = True # to preserve backward compatibility with servers that don't have version_url
@@ -330,6 +412,7 @@ class FireflyClient:
                 version_data = payload.get('data', {})
                 server_version = version_data.get(FIREFLY_VERSION_KEY)
                 compatible = is_server_compatible(server_version)
+                self.server_features.set_advertised(version_data.get(FIREFLY_CAPABILITIES_KEY))
 
         return {
             'compatible': compatible,
@@ -338,30 +421,102 @@ class FireflyClient:
         }
 
     def _send_url_as_get(self, url):
-        return self.call_response(self.session.get(url, headers=self.header_from_ws))
+        self._flush_for_read()
+        with self.scheduler.slot(NORMAL, self.channel):
+            return self.call_response(self.transport.get(url, headers=self.header_from_ws))
+
+    def _post_cmd(self, data):
+        compressed = self._compress_cmd(data)
+        start = time.perf_counter()
+        with tracer.span('http_post', cmd=data.get('cmd'), compressed=bool(compressed)):
+            if compressed:
+                headers = {**self.header_from_ws, 'Content-Type': FORM_CONTENT_TYPE,
+                           'Content-Encoding': self.compression.encoding}
+                response = self.transport.post(self.url_cmd_service, data=compressed[0], headers=headers)
+            else:
+                response = self.transport.post(self.url_cmd_service, data=data, headers=self.header_from_ws)
+        self.round_trip.update(time.perf_counter() - start)
+        if compressed:
+            self.compression.record(compressed[1], len(compressed[0]))
+            metrics.observe('request_compression_ratio', compressed[1] / len(compressed[0]))
+        return response
+
+    def _compress_cmd(self, data):
+        """(compressed body, raw size) of an action request worth compressing, else None."""
+        if not self.compression or data.get('cmd') not in ('pushAction', FEATURE_BATCH_ACTIONS):
+            return None
+        if not self.server_features.supports(FEATURE_COMPRESSED_REQUESTS):
+            return None
+        return self.compression.encode(data)
 
     def _send_url_as_post(self, data):
-        return self.call_response(self.session.post(self.url_cmd_service, data=data, headers=self.header_from_ws))
+        with self.scheduler.slot(lane_for_data(data), data.get('channelID', self.channel)):
+            ws = self._action_websocket(data)
+            if ws:
+                return ws.send_actions([data], self._ws_ack_timeout)[0]
+            return self.call_response(self._post_cmd(data))
+
+    def _action_websocket(self, data):
+        """The websocket connection to send this action on, or None to send it over HTTP."""
+        if not self._ws_actions or data.get('cmd') != 'pushAction' or data.get('channelID') != self.channel:
+            return None
+        if not self.server_features.supports(FEATURE_WS_ACTIONS):
+            return None
+        ws = FFWs.get(self.channel, self.location)
+        return ws if ws and ws.connected.is_set() else None
+
+    def _send_actions_as_post(self, data_list):
+        """Send the form data of several actions in as few requests as the server allows, return their statuses."""
+        statuses = []
+        for _, group in groupby(data_list, key=lambda d: d['channelID']):
+            statuses.extend(self._send_action_group(list(group)))
+        return statuses
+
+    def _send_action_group(self, data_list):
+        data = {'channelID': data_list[0]['channelID'], 'cmd': FEATURE_BATCH_ACTIONS,
+                'actions': '[%s]' % ','.join(d['action'] for d in data_list)}
+        ws = self._action_websocket(data_list[0])
+        if ws:
+            with self.scheduler.slot(lane_for_data(data), data['channelID']):
+                return ws.send_actions(data_list, self._ws_ack_timeout)
+        if len(data_list) > 1 and self.server_features.supports(FEATURE_BATCH_ACTIONS) is not False:
+            try:
+                with self.scheduler.slot(lane_for_data(data), data['channelID']):
+                    statuses = self._parse_response(self._post_cmd(data))
+                if not isinstance(statuses, list) or len(statuses) != len(data_list):
+                    raise ValueError('unexpected response to %s: %s' % (FEATURE_BATCH_ACTIONS, statuses))
+                self.server_features.set_supported(FEATURE_BATCH_ACTIONS, True)
+                return statuses
+            except ValueError as err:
+                if self.server_features.supports(FEATURE_BATCH_ACTIONS):
+                    raise
+                debug('server does not accept batched actions, sending them one at a time: %s', err, log=dispatch_logger)
+                self.server_features.set_supported(FEATURE_BATCH_ACTIONS, False)
+        return [self._send_url_as_post(d) for d in data_list]
 
     def call_response(self, response):
+        return self._parse_response(response)[0]
+
+    def _parse_response(self, response):
         if response.status_code != 200:
             raise ValueError(Env.failed_net_message(self.url, response.status_code))
         try:
-            status = json.loads(response.text)
-            return status[0]
+            with metrics.timer('response_parse_seconds'):
+                return json.loads(response.text)
         except ValueError as err:
             warn('JSON parsing Error:')
             if len(response.text) > 300:
-                warn('Response string (first 300 characters):\n' + response.text[0:300])
-                debug('Full Response:\n' + response.text)
+                warn('Response string (first 300 characters):\n%s', response.text[0:300])
+                debug('Full Response:\n%s', response.text)
             else:
-                warn('Response string:\n' + response.text[0:300])
+                warn('Response string:\n%s', response.text[0:300])
 
             raise err
     
     @staticmethod
     def _get_ip():
         """Find local IP address, based on https://stackoverflow.com/q/166506/8252556."""
+        import socket
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
             s.connect(('8.8.8.8', 1)) # doesn't even have to be reachable
@@ -433,6 +588,89 @@ class FireflyClient:
         """
         FFWs.remove_listener(self.channel, self.location, callback, name)
 
+    def configure_scheduler(self, rate=None, burst=None, channel_rate=None, channel_burst=None,
+                            max_in_flight=None, bulk_max_in_flight=None):
+        """
+        Limit the requests sent to this client's Firefly server.
+
+        Requests wait in one of three priority lanes: interactive (zoom, pan, stretch and color
+        changes), normal (other actions and reads) and bulk (uploads and actions with very large
+        payloads). A waiting request goes before any request in a lower priority lane. The limits
+        are shared by all FireflyClient instances using the same server; per channel limits apply
+        to each channel separately. All limits default to None, which means unlimited.
+
+        Parameters
+        ----------
+        rate : `float`, optional
+            Maximum average number of requests per second to the server.
+        burst : `float`, optional
+            Number of requests that can go at once above `rate` after an idle period (the default is `rate`).
+        channel_rate : `float`, optional
+            Maximum average number of requests per second on each channel.
+        channel_burst : `float`, optional
+            Like `burst`, for `channel_rate`.
+        max_in_flight : `int`, optional
+            Maximum number of requests in flight to the server at the same time, at least 2.
+        bulk_max_in_flight : `int`, optional
+            Maximum number of bulk requests in flight (the default is `max_in_flight` - 1), so an
+            interactive request never waits for an upload to finish.
+        """
+        self.scheduler.configure(rate, burst, channel_rate, channel_burst, max_in_flight, bulk_max_in_flight)
+
+    def use_websocket_transport(self, enable=True, ack_timeout=5.0):
+        """
+        Send dispatched actions as frames on the websocket opened by `add_listener`, instead of HTTP POSTs.
+
+        Each frame carries a request ID and waits for the server to acknowledge it, so return
+        values are the same as over HTTP, without the per-request HTTP overhead. Actions still go
+        over HTTP while no listener is connected, for other channels, or if the server does not
+        advertise support for websocket actions.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            Turn the websocket transport on (the default) or off.
+        ack_timeout : `float`, optional
+            Seconds to wait for the acknowledgement of an action before raising TimeoutError
+            (the default is 5).
+
+        Returns
+        -------
+        out : `bool`
+            True if the server supports websocket actions.
+        """
+        self._ws_actions = enable
+        self._ws_ack_timeout = ack_timeout
+        return bool(self.server_features.supports(FEATURE_WS_ACTIONS))
+
+    def enable_compression(self, enable=True, encoding='gzip', min_bytes=32 * 1024, level=6):
+        """
+        Compress large dispatched actions before sending them to the server.
+
+        Action requests of at least `min_bytes` (e.g. long region lists or chart data arrays)
+        are sent with a gzip or deflate Content-Encoding. This is used only when the server lists
+        compressed requests among its capabilities; other servers get uncompressed requests.
+        The sizes before and after compression are in `compression`, e.g. ``fc.compression.ratio``.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            Turn compression on (the default) or off.
+        encoding : {'gzip', 'deflate'}, optional
+            Content coding to use (the default is 'gzip').
+        min_bytes : `int`, optional
+            Size of the form-encoded request from which it is compressed (the default is 32 KB).
+        level : `int`, optional
+            zlib compression level, 1 (fastest) to 9 (smallest); the default is 6.
+
+        Returns
+        -------
+        out : `bool` or None
+            Whether the server supports compressed requests, None if not known yet.
+        """
+        self.compression = RequestCompression(encoding, min_bytes, level) if enable else None
+        return self.server_features.supports(FEATURE_COMPRESSED_REQUESTS)
+
     def wait_for_events(self):
         """
         Wait over events from the server.
@@ -519,6 +757,7 @@ class FireflyClient:
         open_success = False
 
         if do_open:
+            import webbrowser
             open_success = webbrowser.open(url)
             if open_success is True:
                 time.sleep(5)  # todo: find something better to do than sleeping
@@ -557,12 +796,17 @@ class FireflyClient:
         """
 
         url = self.url_cmd_service + '?cmd=upload'
-        files = {'file': open(path, 'rb')}
-        result = self.session.post(url, files=files, headers=self.header_from_ws)
+        start = time.perf_counter()
+        with open(path, 'rb') as fp, self.scheduler.slot(BULK, self.channel), \
+                tracer.span('upload', bytes=os.path.getsize(path)):
+            result = self.transport.post(url, files={'file': fp}, headers=self.header_from_ws)
         if result.status_code == 200:
+            metrics.enabled and self._record_upload(os.path.getsize(path), time.perf_counter() - start)
+            debug('uploaded %s in %.3fs', path, time.perf_counter() - start, log=upload_logger)
             index = result.text.find('$')
             return result.text[index:]
-        raise requests.HTTPError('Upload unsuccessful')
+        from requests import HTTPError
+        raise HTTPError('Upload unsuccessful')
 
     def upload_fits_data(self, stream):
         """
@@ -622,11 +866,22 @@ class FireflyClient:
         url += 'true&type=FITS' if data_type.upper() == 'FITS' else 'false&type=UNKNOWN'
         stream.seek(0, 0)
         data_pack = {'data': stream}
-        result = self.session.post(url, files=data_pack, headers=self.header_from_ws)
+        start = time.perf_counter()
+        with self.scheduler.slot(BULK, self.channel), tracer.span('upload', type=data_type.upper()):
+            result = self.transport.post(url, files=data_pack, headers=self.header_from_ws)
         if result.status_code == 200:
+            metrics.enabled and self._record_upload(stream.tell(), time.perf_counter() - start)
+            debug('uploaded %s data in %.3fs', data_type, time.perf_counter() - start, log=upload_logger)
             index = result.text.find('$')
             return result.text[index:]
-        raise requests.HTTPError('Upload unsuccessful')
+        from requests import HTTPError
+        raise HTTPError('Upload unsuccessful')
+
+    @staticmethod
+    def _record_upload(nbytes, seconds):
+        metrics.observe('upload_bytes', nbytes)
+        metrics.observe('upload_seconds', seconds)
+        seconds > 0 and metrics.observe('upload_bytes_per_second', nbytes / seconds)
 
     @staticmethod
     def create_image_url(image_source):
@@ -671,9 +926,229 @@ class FireflyClient:
         channel = self.channel if override_channel is None else override_channel
         action = {'type': action_type, 'payload': payload}
         data = {'channelID': channel, 'cmd': 'pushAction', 'action': json.dumps(action)}
-        debug('dispatch: type: %s, channel: %s \n%s' % (action_type, channel, dict_to_str(action)))
+        if is_debug(dispatch_logger) and sampled(action_type):
+            debug('dispatch: type: %s, channel: %s \n%s', action_type, channel, LazyJSON(action), log=dispatch_logger)
+
+        metrics.observe('dispatch_payload_bytes', len(data['action']), action=action_type)
+        with metrics.timer('dispatch_seconds', action=action_type), \
+                tracer.span('dispatch', action=action_type, channel=channel) as span:
+            span and tracer.correlate(targets_of(payload), span)
+            batch = getattr(self._local, 'batch', None)
+            if batch is not None:
+                batch.append(data)
+                return {'success': True, 'queued': True}
+            if self._sender:
+                return self._sender.submit(data, coalesce_key(action_type, payload, channel))
+            return self._send_url_as_post(data)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the actions dispatched inside a ``with`` block and send them together when the block ends.
+
+        Inside the block, dispatching methods return {'success': True, 'queued': True}. The list
+        given by the ``with`` statement is filled with the server status of each action when the
+        block ends. Servers that can't take several actions in one request get them one at a time.
+        Nothing is sent if the block raises an exception. A nested ``with fc.batch()`` joins the outer batch.
+
+        Examples
+        --------
+        >>> with fc.batch() as statuses:
+        ...     for pid in plot_ids:
+        ...         fc.set_zoom(pid, 2)
+        >>> all(s['success'] for s in statuses)
+        """
+        if getattr(self._local, 'batch', None) is not None:
+            yield self._local.batch_statuses
+            return
+        self._local.batch, self._local.batch_statuses = [], []
+        statuses = self._local.batch_statuses
+        try:
+            yield statuses
+            data_list = self._local.batch
+        finally:
+            self._local.batch = self._local.batch_statuses = None
+        self.flush()
+        statuses.extend(self._send_actions_as_post(data_list))
 
-        return self._send_url_as_post(data)
+    def start_background_sender(self, auto_batch=False, max_window=0.01):
+        """
+        Send dispatched actions from a background thread, merging superseded ones.
+
+        While the background sender runs, `set_zoom`, `set_pan`, `set_stretch`, `set_color` (and
+        table filter and sort) return right away with {'success': True, 'queued': True}. If a newer
+        one of these is dispatched for the same plot (or table) before the older one went out,
+        only the newer one is sent. Any other action waits for everything queued before it and
+        returns the server status as usual, so ordering between related actions is kept.
+
+        Use `flush()` to wait until all queued actions are sent. Reads from the server flush first.
+
+        Parameters
+        ----------
+        auto_batch : `bool`, optional
+            If True, every dispatched action returns right away, and actions dispatched while a
+            request is in flight, or within a short window after the first one, are sent together
+            in one request. The window is half the average round-trip time to the server, but at
+            most `max_window`. Setting the environment variable FIREFLY_AUTO_BATCH to true turns
+            this on for every new FireflyClient.
+        max_window : `float`, optional
+            Upper bound of the batching window in seconds (the default is 0.01).
+        """
+        if self._sender and self._sender.auto_batch != auto_batch:
+            self.stop_background_sender()
+        if not self._sender:
+            self._sender = BackgroundSender(self._send_url_as_post,
+                                            self._send_actions_as_post if auto_batch else None,
+                                            self.round_trip, max_window)
+
+    def stop_background_sender(self):
+        """Send any queued actions and go back to sending each action as it is dispatched."""
+        sender, self._sender = self._sender, None
+        sender and sender.stop()
+
+    def flush(self, timeout=None):
+        """
+        Wait until all actions queued by the background sender are sent.
+
+        Parameters
+        ----------
+        timeout : `float`, optional
+            Maximum number of seconds to wait.
+
+        .. note:: If a queued action failed since the last flush, its error is raised here.
+        """
+        for chart_id in list(self._chart_streams):
+            self._flush_chart(chart_id)
+        self._sender and self._sender.flush(timeout)
+
+    def _flush_for_read(self):
+        """
+        Send everything dispatched so far, since a read must see its effect. Errors of those
+        actions belong to them, not to the read: they are logged, or raised by the next `flush`.
+        """
+        for chart_id in list(self._chart_streams):
+            self._flush_chart_later(chart_id)
+        self._sender and self._sender.flush(raise_errors=False)
+
+    def wait_uploads(self, timeout=None):
+        """
+        Wait until the background uploads (e.g. of progressive image displays) are done and the
+        images they show are sent, then `flush`.
+
+        Parameters
+        ----------
+        timeout : `float`, optional
+            Maximum number of seconds to wait for the uploads.
+        """
+        self._uploads.wait(timeout)
+        self.flush()
+
+    @staticmethod
+    def configure_logging(level=None, payload_limit=False, sample_every=None):
+        """
+        Configure logging of firefly_client.
+
+        Messages go to the 'firefly_client' logger and its 'dispatch', 'upload' and 'ws' children.
+        They are printed to stdout as 'LEVEL: message' unless the application configures
+        `logging` itself. Debug messages are only formatted when their logger is enabled for debug.
+
+        Parameters
+        ----------
+        level : `int` or `str`, optional
+            Level of the 'firefly_client' logger, e.g. 'DEBUG'.
+        payload_limit : `int` or None, optional
+            Maximum number of characters of an action payload or event in a log message (the
+            default is 2000), None for no limit.
+        sample_every : `int`, optional
+            Log only the first and every Nth dispatched action of each type.
+        """
+        configure_logging(level, payload_limit, sample_every)
+
+    @staticmethod
+    def enable_metrics(enable=True, reset=False):
+        """
+        Turn on (or off) recording of client-side metrics, for all FireflyClient instances.
+
+        Recorded metrics are latency and payload size of dispatched actions per action type, upload
+        sizes, times and throughput, response parsing times, websocket messages per second, and
+        the execution time and lag of event callbacks. Recording is off by default.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            Turn recording on (the default) or off.
+        reset : `bool`, optional
+            If True, clear the metrics recorded so far.
+        """
+        reset and metrics.reset()
+        metrics.enabled = enable
+
+    @staticmethod
+    def get_stats():
+        """
+        Get the metrics recorded since `enable_metrics`.
+
+        Returns
+        -------
+        out : `dict`
+            Metric name to a list of entries, one per label set (e.g. per action type), each with
+            its 'type', 'labels' and values: 'value' for counters; 'count', 'sum', 'mean', 'min',
+            'max', 'p50', 'p90', 'p99' for histograms; 'count' and 'per_second' for meters.
+        """
+        return metrics.snapshot()
+
+    @staticmethod
+    def export_stats(path, fmt=None):
+        """
+        Write the recorded metrics to a file.
+
+        Parameters
+        ----------
+        path : `str`
+            Path of the file.
+        fmt : {'json', 'prometheus'}, optional
+            Format of the file. The default is JSON for paths ending in '.json', else the
+            Prometheus text format, e.g. for the node exporter textfile collector.
+        """
+        metrics.export(path, fmt)
+
+    @staticmethod
+    def enable_tracing(enable=True, exporter=None):
+        """
+        Turn on (or off) tracing of client calls, for all FireflyClient instances.
+
+        Calls like `show_fits_image` and `show_table` get a trace with nested spans for their
+        uploads, dispatched actions and HTTP requests. Websocket events about the plot, table or
+        chart of a dispatched action join its trace as a 'ws_event' span that lasts from the
+        dispatch until the event arrived, when a listener is added with `add_listener`.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            Turn tracing on (the default) or off.
+        exporter : `Function`, optional
+            Called with each finished span. The default is a new in-memory exporter.
+
+        Returns
+        -------
+        out : `object`
+            The exporter, e.g. an `InMemoryExporter` with the finished spans in `spans`, or
+            None when turning tracing off.
+
+        Examples
+        --------
+        >>> spans = fc.enable_tracing()
+        >>> fc.show_fits_image('m31.fits')
+        >>> [(s.name, s.duration) for s in spans.spans]
+        """
+        if not enable:
+            tracer.enabled = False
+            tracer.exporters = []
+            return None
+        exporter = exporter or InMemoryExporter()
+        tracer.add_exporter(exporter)
+        tracer.enabled = True
+        return exporter
     
     def get_payload_from_file(self, file_input):
         """Get payload for actions dispatched to Firefly server from the file input.
@@ -811,6 +1286,7 @@ class FireflyClient:
         """
         return self.dispatch(ACTION_DICT['ReinitViewer'], {})
 
+    @traced
     def show_data(self, file_input, preview_metadata=False, title=None):
         """
         Show any data file of the type that Firefly supports:
@@ -846,8 +1322,9 @@ class FireflyClient:
             }
         return self.dispatch(ACTION_DICT['ShowAnyData'], payload)
 
+    @traced
     def show_fits_image(self, file_input=None, file_on_server=None, url=None, 
-                        plot_id=None, viewer_id=None, **additional_params):
+                        plot_id=None, viewer_id=None, cutout=None, progressive=False, **additional_params):
         """
         Show a FITS image. 
         
@@ -888,6 +1365,17 @@ class FireflyClient:
             .. note:: Not needed in triview mode of Firefly, which is also 
                       the default view mode.
 
+        cutout : `tuple`, optional
+            Show only part of the image of the local FITS file `file_input`: (ra, dec, size) in
+            degrees for a square on the sky (needs astropy), or a pixel box (x0, y0, x1, y1) of
+            zero-based pixels, x1 and y1 excluded. Only the cutout is read from the file, through
+            a memory map, and uploaded; its WCS keeps the sky coordinates of the full image.
+            With `multiImageIdx`, the cutout is taken from that image of the file.
+        progressive : `bool`, optional
+            For a local FITS file whose image is larger than `preview_size` pixels, first show a
+            preview binned to at most `preview_size` pixels (block means, with the WCS adjusted),
+            and replace it with the full image under the same `plot_id` when the upload of the
+            file, done in the background, ends. See `show_array`.
         **additional_params : optional keyword arguments
             Any valid fits viewer plotting parameter, please see the details in 
             `FITS plotting parameters`_ (note that they are case-insensitive).
@@ -936,6 +1424,15 @@ class FireflyClient:
         if url:
             warn('url is deprecated, use file_input parameter instead')
             payload['wpRequest'].update({'url': url})
+        if progressive and cutout is None and isinstance(file_input, str) and os.path.isfile(file_input):
+            preview = self._file_preview(file_input, additional_params.get('multiImageIdx'))
+            if preview:
+                return self._show_progressive(preview, lambda: self.upload_file(file_input),
+                                              plot_id, viewer_id, additional_params)
+        if cutout is not None:
+            if not (isinstance(file_input, str) and os.path.isfile(file_input)):
+                raise ValueError('cutout needs file_input to be a local FITS file')
+            file_input = self._upload_cutout(file_input, cutout, additional_params.pop('multiImageIdx', None))
         if file_input:
             file_payload = self.get_payload_from_file(file_input)
             if 'fileOnServer' in file_payload:
@@ -951,6 +1448,171 @@ class FireflyClient:
         warning and r.update({'warning': warning})
         return r
     
+    def _upload_cutout(self, path, cutout, image_index=None):
+        """Upload a cutout of the image of the local FITS file `path`, return the server file reference."""
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+b') as fp:
+            box = write_cutout(fp, path, cutout, image_index)
+            debug('cutout %s of %s: %d bytes', box, path, fp.tell(), log=upload_logger)
+            return self.upload_fits_data(fp)
+
+    @traced
+    def show_array(self, data, plot_id=None, viewer_id=None, header=None, progressive=False, **additional_params):
+        """
+        Show a numpy array as an image.
+
+        Parameters
+        ----------
+        data : `numpy.ndarray`
+            Image, 2-D or a cube, the last axis is x. Don't change it before the call returns, or
+            with `progressive`, before the full image is shown.
+        plot_id : `str`, optional
+            The ID you assign to the image plot.
+        viewer_id : `str`, optional
+            The ID of the viewer (or cell) to show the image in, see `show_fits_image`.
+        header : `dict`, `list` of `tuple` or `astropy.io.fits.Header`, optional
+            Header keywords of the image, such as the WCS. Keywords about the data layout
+            (BITPIX, NAXIS, ...) are ignored.
+        progressive : `bool`, optional
+            If the image is larger than `preview_size` pixels, first show a preview binned to at
+            most `preview_size` pixels (block means, with the WCS adjusted), then upload the full
+            image in the background and show it under the same plot ID. `wait_uploads()` waits for it.
+        **additional_params : optional keyword arguments
+            FITS viewer plotting parameters, see `show_fits_image`.
+
+        Returns
+        -------
+        out : `dict`
+            Status of the request, like {'success': True}. With a preview, it also has
+            'preview': True and 'full': a `concurrent.futures.Future` of the status of showing the
+            full image.
+        """
+        data = image_array(data)
+        cards = image_cards(header.items() if hasattr(header, 'items') else header or [])
+        factor = math.ceil(max(data.shape[-2:]) / self.preview_size)
+        if progressive and factor > 1:
+            preview = block_mean(data, factor), binned_cards(cards, factor)
+            return self._show_progressive(preview, lambda: self._upload_image(data, cards),
+                                          plot_id, viewer_id, additional_params)
+        return self.show_fits_image(self._upload_image(data, cards), plot_id=plot_id, viewer_id=viewer_id,
+                                    **additional_params)
+
+    def _upload_image(self, data, cards=()):
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+b') as fp:
+            write_image(fp, data, cards)
+            return self.upload_fits_data(fp)
+
+    def _file_preview(self, path, image_index=None, factor=None):
+        """
+        First plane and header cards of the image of a local FITS file binned by `factor`, or to
+        fit in `preview_size` pixels; None if that needs no binning.
+        """
+        cards, values, data = open_image(path, image_index)
+        factor = factor or math.ceil(max(data.shape[-2:]) / self.preview_size)
+        if factor <= 1:
+            return None
+        blank = values.get('BLANK') if data.dtype.kind in 'iu' else None
+        preview = block_mean(data, factor, blank=blank) * values.get('BSCALE', 1.0) + values.get('BZERO', 0.0)
+        return preview, binned_cards(image_cards(cards), factor)
+
+    def _show_progressive(self, preview, upload_full, plot_id, viewer_id, additional_params):
+        """
+        Show the `preview` (image, header cards) now, then upload the full image with `upload_full()`
+        in the background and show it under the same plot ID, unless a newer progressive display
+        of the plot started meanwhile.
+        """
+        plot_id = plot_id or gen_item_id('Image')
+        generation = self._progressive[plot_id] = self._progressive.get(plot_id, 0) + 1
+        start = time.perf_counter()
+        # the preview is a single image, multiImageIdx only applies to the full file
+        preview_params = {k: v for k, v in additional_params.items() if k != 'multiImageIdx'}
+        status = self.show_fits_image(self._upload_image(*preview), plot_id=plot_id, viewer_id=viewer_id,
+                                      **preview_params)
+        debug('preview of %s shown in %.3fs', plot_id, time.perf_counter() - start, log=upload_logger)
+
+        def show_full():
+            file_on_server = upload_full()
+            if self._progressive.get(plot_id) != generation:
+                return {'success': True, 'superseded': True}
+            return self.show_fits_image(file_on_server, plot_id=plot_id, viewer_id=viewer_id, **additional_params)
+
+        status.update({'preview': True, 'full': self._uploads.submit(show_full)})
+        return status
+
+    @traced
+    def show_image_grid(self, sources, ncols=None, titles=None, plot_ids=None, cell_size=1, downsample=None,
+                        stretch=None, zoom=None, workers=4, **additional_params):
+        """
+        Show many images in a grid, e.g. cutouts to review.
+
+        In slate mode, the grid cells are added in one request. The images are uploaded several
+        at a time, and each is shown as soon as its upload ends. The stretch and zoom are then
+        applied to all the plots in one request.
+
+        Parameters
+        ----------
+        sources : `list`
+            The images: local FITS file paths, numpy arrays, server file references or URLs.
+        ncols : `int`, optional
+            Number of columns of the grid. The default makes the grid about square.
+        titles : `list` of `str`, optional
+            Titles of the images.
+        plot_ids : `list` of `str`, optional
+            IDs of the plots. They are created automatically if not specified.
+        cell_size : `int`, optional
+            Width and height of each cell in slate layout units.
+        downsample : `int`, optional
+            Bin local files and arrays by this factor (block means) before uploading them.
+        stretch : `dict`, optional
+            Keyword arguments of `set_stretch` for all the plots, e.g. *{'stype': 'zscale'}*.
+        zoom : `float`, optional
+            Zoom factor of all the plots.
+        workers : `int`, optional
+            Number of uploads running at the same time.
+        **additional_params : optional keyword arguments
+            FITS viewer plotting parameters for all the images, see `show_fits_image`.
+
+        Returns
+        -------
+        out : `dict`
+            Status of the request, like {'success': True, 'plot_ids': [...], 'cell_ids': [...]}.
+        """
+        count = len(sources)
+        ncols = ncols or max(1, math.ceil(math.sqrt(count)))
+        plot_ids = plot_ids or [gen_item_id('Image') for _ in sources]
+        titles = titles or [None] * count
+        cell_ids = [None] * count
+        if self.is_slate():
+            with self.batch():
+                cell_ids = [self.add_cell(i // ncols * cell_size, i % ncols * cell_size, cell_size, cell_size,
+                                          LO_VIEW_DICT['image'])['cell_id'] for i in range(count)]
+
+        def show(i):
+            params = dict(additional_params, **({'title': titles[i]} if titles[i] else {}))
+            return self.show_fits_image(self._grid_source(sources[i], downsample), plot_id=plot_ids[i],
+                                        viewer_id=cell_ids[i], **params)
+
+        pool = UploadPool(workers)
+        try:
+            futures = [pool.submit(show, i) for i in range(count)]
+            statuses = [f.result() for f in futures]
+        finally:
+            pool.shutdown()
+        with self.batch() as style_statuses:
+            stretch and self.set_stretch(plot_ids, **stretch)
+            zoom and self.set_zoom(plot_ids, zoom)
+        return {'success': all(s.get('success') for s in statuses + style_statuses),
+                'plot_ids': plot_ids, 'cell_ids': cell_ids}
+
+    def _grid_source(self, source, downsample=None):
+        """`file_input` of `show_fits_image` for a grid image, binned by `downsample` if it is local."""
+        if hasattr(source, 'ndim'):
+            data = image_array(source)
+            return self._upload_image(block_mean(data, downsample) if downsample and downsample > 1 else data)
+        if downsample and downsample > 1 and isinstance(source, str) and os.path.isfile(source):
+            binned = self._file_preview(source, factor=downsample)
+            return self._upload_image(*binned) if binned else source
+        return source
+
     def show_fits(self, *args, **kwargs):
         """
         .. deprecated:: 3.4.0
@@ -959,6 +1621,7 @@ class FireflyClient:
         warn("show_fits() is deprecated. Use show_fits_image() instead.")
         return self.show_fits_image(*args, **kwargs)
 
+    @traced
     def show_fits_3color(self, three_color_params, plot_id=None, viewer_id=None):
         """
         Show a 3-color image constructed from the three color parameters
@@ -1001,6 +1664,7 @@ class FireflyClient:
         warning and r.update({'warning': warning})
         return r
 
+    @traced
     def show_table(self, file_input=None, file_on_server=None, url=None, 
                    tbl_id=None, title=None, page_size=100, is_catalog=True,
                    meta=None, target_search_info=None, options=None, table_index=None,
@@ -1323,6 +1987,7 @@ class FireflyClient:
         warning and r.update({'warning': warning})
         return r
 
+    @traced
     def show_chart(self, group_id=None, **chart_params):
         """
         Show a plot.ly chart
@@ -1334,7 +1999,14 @@ class FireflyClient:
 
         See `plotly.js attribute reference <https://plot.ly/javascript/reference/>`_
         for the supported trace types and attributes. Note, that *data* and *layout* are expected to be
-        basic Python object hierarchies, as *json.dumps* is used to convert them to JSON.
+        basic Python object hierarchies, as *json.dumps* is used to convert them to JSON, except that numpy
+        arrays are accepted anywhere.
+
+        Numeric arrays of at least `chart_table_points` points at the top level of a trace without a
+        *tbl_id* (e.g. *x* and *y*) are uploaded as a FITS table, and the trace is changed to refer to
+        the table columns, so Firefly can decimate the points server-side. Set `chart_table_points` to
+        None to always send the points inline. Numpy arrays sent inline use plotly's typed array form
+        (*{'dtype': 'f4', 'bdata': ...}*) when the server supports it.
 
         Parameters
         ----------
@@ -1370,13 +2042,149 @@ class FireflyClient:
                    'chartType': 'plot.ly',
                    'closable': True}
 
-        for item in ['data', 'layout']:
-            (item in chart_params) and payload.update({item: chart_params.get(item)})
+        if 'data' in chart_params:
+            payload['data'] = [self._chart_trace(trace, chart_id, i) for i, trace in enumerate(chart_params['data'])]
+            kept = [sent if 'tbl_id' in sent and 'tbl_id' not in trace else trace
+                    for trace, sent in zip(chart_params['data'], payload['data'])]
+            self._reset_chart_stream(chart_id, kept)
+        'layout' in chart_params and payload.update({'layout': to_jsonable(chart_params['layout'],
+                                                                            self._typed_arrays())})
 
         r = self.dispatch(ACTION_DICT['ShowPlot'], payload)
         warning and r.update({'warning': warning})
         return r
 
+    def _chart_trace(self, trace, chart_id, index):
+        """A trace ready for the chart payload, its large arrays moved to an uploaded table."""
+        columns = large_trace_columns(trace, self.chart_table_points)
+        if columns:
+            tbl_id = '%s-trace-%d' % (chart_id, index)
+            with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as fp:
+                write_bintable(fp, columns)
+                file_on_server = self.upload_data(fp, 'UNKNOWN')
+            self.show_table(file_input=file_on_server, tbl_id=tbl_id, title=tbl_id, is_catalog=False, visible=False)
+            trace = {**trace, 'tbl_id': tbl_id, **{key: 'tables::%s' % key for key in columns}}
+        return to_jsonable(trace, self._typed_arrays())
+
+    def _typed_arrays(self): return bool(self.server_features.supports(FEATURE_TYPED_ARRAYS))
+
+    def update_chart(self, chart_id, changes):
+        """
+        Change parts of an existing chart.
+
+        Parameters
+        ----------
+        chart_id : `str`
+            ID of the chart, as given to or returned by `show_chart`.
+        changes : `dict`
+            Dotted paths into the chart to their new values, e.g.
+            *{'layout.title': 'Light curve', 'data.0.marker.color': 'red', 'data.0.y': new_y}*.
+            Numpy arrays are accepted.
+
+        Returns
+        -------
+        out : `dict`
+            Status of the request, like {'success': True}.
+        """
+        payload = {'chartId': chart_id, 'changes': to_jsonable(changes, self._typed_arrays())}
+        return self.dispatch(ACTION_DICT['UpdateChart'], payload)
+
+    def extend_chart(self, chart_id, trace_index=0, max_points=None, **columns):
+        """
+        Append points to a trace of an existing chart.
+
+        New points are buffered per chart and sent together at most once per
+        `chart_flush_interval` seconds (the default is 0.1), so a live chart fed point by point
+        sends one small update per interval. Points still buffered are sent by a timer after the
+        interval, or right away by `flush()`.
+
+        Only the new points are sent when the server supports the chart extend action. Otherwise
+        the arrays of the trace are kept on the client, and the whole extended arrays are sent
+        as a chart update.
+
+        Parameters
+        ----------
+        chart_id : `str`
+            ID of a chart created with `show_chart`.
+        trace_index : `int`, optional
+            Index of the trace in the chart data (the default is 0).
+        max_points : `int`, optional
+            Keep only this many of the latest points of the trace.
+        **columns : optional keyword arguments
+            Trace keys to the new values, a single value or a list or numpy array, e.g.
+            *x=t, y=flux*.
+
+        Returns
+        -------
+        out : `dict`
+            Status of the request, {'success': True, 'queued': True} if the points are buffered.
+
+        Examples
+        --------
+        >>> fc.show_chart(chartId='lc', data=[{'x': [], 'y': [], 'mode': 'lines'}])
+        >>> for t, flux in readings():
+        ...     fc.extend_chart('lc', x=t, y=flux, max_points=10000)
+        """
+        with self._chart_lock:
+            stream = self._chart_streams.get(chart_id) or self._reset_chart_stream(chart_id)
+            stream.add(trace_index, columns, max_points)
+            wait = stream.last_flush + self.chart_flush_interval - time.monotonic()
+            if wait > 0 or stream.sending:
+                self._flush_chart_after(chart_id, stream, wait)
+                return {'success': True, 'queued': True}
+        return self._flush_chart(chart_id)
+
+    def _reset_chart_stream(self, chart_id, traces=None):
+        with self._chart_lock:
+            old = self._chart_streams.get(chart_id)
+            old and old.timer and old.timer.cancel()
+            stream = self._chart_streams[chart_id] = ChartStream(traces)
+            return stream
+
+    def _flush_chart(self, chart_id):
+        """
+        Send the buffered points of a chart now. The lock is only held to take the points, so
+        `extend_chart` callers don't wait for the request; one request per chart is in flight at a time.
+        """
+        with self._chart_lock:
+            stream = self._chart_streams.get(chart_id)
+            if not stream:
+                return {'success': True}
+            stream.timer and stream.timer.cancel()
+            stream.timer = None
+            if stream.sending:
+                return {'success': True, 'queued': True}  # sent after the request in flight
+            pending = stream.take()
+            if not pending:
+                return {'success': True}
+            stream.last_flush = time.monotonic()
+            if self.server_features.supports(FEATURE_CHART_EXTEND):
+                action, payload = ACTION_DICT['ExtendChart'], stream.extend_payload(chart_id, pending)
+            else:
+                action = ACTION_DICT['UpdateChart']
+                payload = {'chartId': chart_id, 'changes': to_jsonable(stream.apply(pending), self._typed_arrays())}
+            stream.sending = True
+        try:
+            return self.dispatch(action, payload)
+        finally:
+            with self._chart_lock:
+                stream.sending = False
+                stream.pending and self._flush_chart_after(
+                    chart_id, stream, stream.last_flush + self.chart_flush_interval - time.monotonic())
+
+    def _flush_chart_after(self, chart_id, stream, wait):
+        """Start the timer sending the buffered points of a chart in `wait` seconds, unless one is running."""
+        if not stream.timer:
+            stream.timer = threading.Timer(max(wait, 0.0), self._flush_chart_later, (chart_id,))
+            stream.timer.daemon = True
+            stream.timer.start()
+
+    def _flush_chart_later(self, chart_id):
+        try:
+            self._flush_chart(chart_id)
+        except Exception as err:
+            warn('sending chart points failed: %s', err)
+
     def show_coverage(self, viewer_id=None, table_group='main'):
         """
         Show image coverage associated with the active table in the specified table group
@@ -1513,6 +2321,7 @@ class FireflyClient:
         self.add_extension(ext_type='table.highlight', extension_id='table_highlight')
         return highlight_callback
 
+    @traced
     def show_hips(self, plot_id=None, viewer_id=None, hips_root_url=None, hips_image_conversion=None,
                   **additional_params):
         """
@@ -1642,26 +2451,48 @@ class FireflyClient:
 
         Parameters
         ----------
-        plot_id : `str` or `list` of `str`
+        plot_id : `str`, `list` of `str` or `dict`
             ID of the plot to be zoomed. If `plot_id` is a list or tuple, then each plot in the list
-            or the tuple is zoomed in order.
+            or the tuple is zoomed in order, in one request. If it is a `dict`, it maps each plot ID
+            to its zoom factor.
         factor : `int` or  `float`, optional
             Zoom factor for the image.
 
         Returns
         -------
-        out : `dict`
-            Status of the request, like {'success': True}.
+        out : `dict` or `list` of `dict`
+            Status of the request, like {'success': True}, a list of them for a list of plots.
         """
+        if isinstance(plot_id, dict):
+            return self._per_plot({p: v if isinstance(v, dict) else {'factor': v} for p, v in plot_id.items()},
+                                  self.set_zoom, {'factor': factor})
+        if isinstance(plot_id, (list, tuple)):
+            return self._per_plot(plot_id, self.set_zoom, {'factor': factor})
+        payload = {'plotId': plot_id, 'userZoomType': 'LEVEL', 'level': factor, 'actionScope': 'SINGLE'}
+        return self.dispatch(ACTION_DICT['ZoomImage'], payload)
 
-        def zoom_oneplot(one_plot_id, f):
-            payload = {'plotId': one_plot_id, 'userZoomType': 'LEVEL', 'level': f, 'actionScope': 'SINGLE'}
-            return self.dispatch(ACTION_DICT['ZoomImage'], payload)
+    def _per_plot(self, plots, method, defaults):
+        """
+        Call ``method(plot_id, **params)`` for each plot of `plots` in one batch. `plots` is a `dict`
+        of plot ID to the parameters overriding `defaults`, or a `list` of plot IDs using `defaults`.
 
-        if isinstance(plot_id, tuple) or isinstance(plot_id, list):
-            return [zoom_oneplot(x, factor) for x in plot_id]
-        else:
-            return zoom_oneplot(plot_id, factor)
+        Returns
+        -------
+        out : `dict` or `list` of `dict`
+            For a `dict`, {'success': True if all succeeded, 'statuses': `dict` of plot ID to its status};
+            for a `list`, the status of each element, in order.
+        """
+        pairs = list(plots.items()) if isinstance(plots, dict) else [(p, None) for p in plots]
+        nested = getattr(self._local, 'batch', None) is not None  # an outer batch sends them later
+        with self.batch() as statuses:
+            queued = [method(one_plot_id, **{**defaults, **(params or {})}) for one_plot_id, params in pairs]
+        if not nested:
+            for status, queued_status in zip(statuses, queued):
+                status.update({k: v for k, v in queued_status.items() if k not in ('success', 'queued')})
+            queued = statuses
+        if not isinstance(plots, dict):
+            return queued
+        return {'success': all(s.get('success') for s in queued), 'statuses': dict(zip(plots, queued))}
 
     def set_pan(self, plot_id, x=None, y=None, coord='image'):
         """
@@ -1670,9 +2501,10 @@ class FireflyClient:
 
         Parameters
         ----------
-        plot_id : `str` or `list` of `str`
+        plot_id : `str`, `list` of `str` or `dict`
             ID of the plot to be panned. If plot_id is a list or tuple, then each plot in the list
-            or the tuple is panned in order.
+            or the tuple is panned in order, in one request. If it is a `dict`, it maps each plot ID
+            to a `dict` of the parameters (`x`, `y`, `coord`) for that plot.
         x, y : `int` or  `float`, optional
             New center of x and y position to scroll to. Not required if coord is set 'image'
             because it will center on the image.
@@ -1682,10 +2514,11 @@ class FireflyClient:
 
         Returns
         -------
-        out : `dict`
-            Status of the request, like {'success': True}.
+        out : `dict` or `list` of `dict`
+            Status of the request, like {'success': True}, a list of them for a list of plots.
         """
-
+        if isinstance(plot_id, (dict, list, tuple)):
+            return self._per_plot(plot_id, self.set_pan, {'x': x, 'y': y, 'coord': coord})
         payload = {'plotId': plot_id}
         if coord.startswith('image'):
             payload.update({'centerOnImage': 'true'})
@@ -1717,21 +2550,30 @@ class FireflyClient:
         payload = dict(matchType=match_type, lockMatch=lock_match)
         return self.dispatch(ACTION_DICT['AlignImages'], payload)
 
-    def set_stretch(self, plot_id, stype=None, algorithm=None, band=None, **additional_params):
+    def set_stretch(self, plot_id, stype=None, algorithm=None, band=None, data=None, preset=None,
+                    **additional_params):
         """
         Change the stretch of the image (no band or 3-color per-band cases).
 
         Parameters
         ----------
-        plot_id : `str` or `list` of `str`
-            ID of the plot to be stretched. If `plot_id` is a list or tuple, then each plot in the list
-            or the tuple is stretched in order.
+        plot_id : `str`, `list` of `str` or `dict`
+            ID of the plot to be stretched. If `plot_id` is a list or tuple, then all the plots in the
+            list or the tuple are stretched by one action. If it is a `dict`, it maps each plot ID to
+            a `dict` of the parameters for that plot (e.g. *{'p1': {'stype': 'zscale'}, 'p2': {}}*),
+            overriding the other arguments, and all are sent in one request.
         stype : {'percent', 'minmax', 'absolute', 'zscale', 'sigma'}, optional
             Stretch method (the default is 'percent').
         algorithm : {'linear', 'log', 'loglog', 'equal', 'squared', 'sqrt', 'asinh', 'powerlaw_gamma'}, optional
             Stretch algorithm (the default is 'linear').
         band : {'RED', 'GREEN', 'BLUE', 'ALL'}, optional
             3-color band to apply stretch to
+        data : `numpy.ndarray`, optional
+            Pixels of the image. If given, the bounds of the stretch are computed on the client
+            (see `RangeValues.compute_bounds`) and sent as an absolute stretch.
+        preset : `str`, optional
+            Name of a stretch in `RangeValues.PRESETS`, used instead of `stype`, `algorithm` and
+            `additional_params`.
         **additional_params : optional keyword arguments
             Parameters for changing the stretch. The options are shown as below:
 
@@ -1757,13 +2599,23 @@ class FireflyClient:
         Returns
         -------
         out : `dict`
-            Status of the request, like {'success': True}.
+            Status of the request, like {'success': True}. For a `dict` of plots, the statuses of
+            each plot are under 'statuses'.
 
         .. note:: `zscale_contrast`, `zscale_samples`, and `zscale_samples_perline` are used when
                   `stype` is 'zscale', and `lower_value` and `upper_value` are used when `stype` is not 'zscale'.
         """
+        if isinstance(plot_id, dict):
+            return self._per_plot(plot_id, self.set_stretch, dict(stype=stype, algorithm=algorithm, band=band,
+                                                                  data=data, preset=preset, **additional_params))
 
-        serialized_rv = RangeValues.create_rv_by_stretch_type(algorithm, stype, **additional_params)
+        if preset:
+            serialized_rv = RangeValues.create_rv_preset(preset, data)
+        elif data is not None:
+            serialized_rv = RangeValues.create_rv_from_data(data, stype or 'percent', algorithm or 'linear',
+                                                            **additional_params)
+        else:
+            serialized_rv = self._rv_string(algorithm, stype, additional_params)
         bands_3color = ['RED', 'GREEN', 'BLUE', 'ALL']
         if not band:
             band_list = ['NO_BAND']
@@ -1782,6 +2634,14 @@ class FireflyClient:
         return_val['rv_string'] = serialized_rv
         return return_val
 
+    @staticmethod
+    def _rv_string(algorithm, stype, params):
+        """Serialized RangeValues of a stretch, remembered for the parameters used recently."""
+        try:
+            return _stretch_rv(algorithm, stype, tuple(sorted(params.items())))
+        except TypeError:  # a parameter value can't be hashed
+            return RangeValues.create_rv_by_stretch_type(algorithm, stype, **params)
+
     def set_stretch_hprgb(self, plot_id, asinh_q_value=None, scaling_k=1.0,
                           pedestal_value=1, pedestal_type='percent'):
         """
@@ -1791,9 +2651,10 @@ class FireflyClient:
 
         Parameters
         ----------
-        plot_id : `str` or `list` of `str`
+        plot_id : `str`, `list` of `str` or `dict`
             ID of the plot to be stretched. If `plot_id` is a list or tuple, then each plot in the list
-            or the tuple is stretched in order.
+            or the tuple is stretched in order. If it is a `dict`, it maps each plot ID to a `dict` of
+            the parameters for that plot, and all are sent in one request.
         asinh_q_value : `float`, optional
             The asinh softening parameter for Asinh stretch.
             Use Q=0 for linear stretch, increase Q to make brighter features visible.
@@ -1812,6 +2673,10 @@ class FireflyClient:
 
         .. note:: `pedestal_value` is used when `pedestal_type` is not 'zscale'.
         """
+        if isinstance(plot_id, dict):
+            return self._per_plot(plot_id, self.set_stretch_hprgb, {
+                'asinh_q_value': asinh_q_value, 'scaling_k': scaling_k, 'pedestal_value': pedestal_value,
+                'pedestal_type': pedestal_type})
 
         scaling_k = ensure3(scaling_k, 'scaling_k')
         pedestal_type = ensure3(pedestal_type, 'pedestal_type')
@@ -1840,8 +2705,9 @@ class FireflyClient:
 
         Parameters
         ----------
-        plot_id : `str` or `list` of `str`
-            ID of the image plot to be colored.
+        plot_id : `str`, `list` of `str` or `dict`
+            ID of the image plot to be colored. If it is a `dict`, it maps each plot ID to a `dict`
+            of the parameters for that plot, overriding the other arguments, and all are sent in one request.
         colormap_id : `int`, optional
             ID of the colormap or color-table to use, ranging from 0 to 21.
             (the default is 0 i.e. grayscale). For HiPS image, -1 can be used
@@ -1859,6 +2725,9 @@ class FireflyClient:
 
         .. note:: when `colormap_id` is -1 for HiPS image, `contrast` and `bias` have no effect.
         """
+        if isinstance(plot_id, dict):
+            return self._per_plot(plot_id, self.set_color, {'colormap_id': colormap_id, 'bias': bias,
+                                                            'contrast': contrast})
         payload = {'plotId': plot_id,
                    'cbarId': colormap_id,
                    'bias': bias,
@@ -1873,8 +2742,9 @@ class FireflyClient:
 
         Parameters
         ----------
-        plot_id : `str` or `list` of `str`
-            ID of the image plot to be colored.
+        plot_id : `str`, `list` of `str` or `dict`
+            ID of the image plot to be colored. If it is a `dict`, it maps each plot ID to a `dict`
+            of the parameters for that plot, and all are sent in one request.
         use_red : `bool`, optional
             Whether to use red band in coloring the image (default is True)
         use_green : `bool`, optional
@@ -1891,6 +2761,9 @@ class FireflyClient:
         out : `dict`
             Status of the request, like {'success': True}.
         """
+        if isinstance(plot_id, dict):
+            return self._per_plot(plot_id, self.set_rgb_colors, {
+                'use_red': use_red, 'use_green': use_green, 'use_blue': use_blue, 'bias': bias, 'contrast': contrast})
         payload = {'plotId': plot_id, 
                    'useRed': use_red,
                    'useGreen': use_green,
@@ -1995,6 +2868,48 @@ class FireflyClient:
     # Region Stuff
     # -----------------------------------------------------------------
 
+    def _spill_region_data(self, region_data):
+        """
+        Upload `region_data` as a region file if it is larger than `region_spill_bytes` characters.
+
+        Returns
+        -------
+        out : `str` or None
+            The server file reference of the region file, or None if `region_data` is small
+            enough to be sent inline.
+        """
+        if self.region_spill_bytes is None:
+            return None
+        if isinstance(region_data, Regions):
+            chunks = region_data.chunks()
+        else:
+            lines = [region_data] if isinstance(region_data, str) else region_data
+            chunks = ('\n'.join(lines[i:i + 10000]) + '\n' for i in range(0, len(lines), 10000))
+        head, size = [], 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > self.region_spill_bytes:
+                break
+        else:
+            return None
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+b') as fp:
+            for chunk in chain(head, chunks):
+                fp.write(chunk.encode('utf-8'))
+            return self.upload_data(fp, 'UNKNOWN')
+
+    @staticmethod
+    def _region_lines(region_data):
+        return region_data.tolist() if isinstance(region_data, Regions) else region_data
+
+    def _region_changes(self, region_data):
+        """Payload entry of the region data of an add or remove region data action."""
+        if self.server_features.supports(FEATURE_REGION_CHANGES_FILE):
+            spilled = self._spill_region_data(region_data)
+            if spilled:
+                return {'fileOnServer': spilled}
+        return {'regionChanges': self._region_lines(region_data)}
+
     def overlay_region_layer(self, file_on_server=None, region_data=None, title=None,
                              region_layer_id=None, plot_id=None):
         """
@@ -2007,8 +2922,9 @@ class FireflyClient:
             This is the name of the file on the server.  If you use `upload_file()`,
             then it is the return value of the method. Otherwise it
             is a file that Firefly has direct read access to.
-        region_data : `str` or `list` of `str`, optional
-            Region description, either a list of strings or a string.
+        region_data : `str`, `list` of `str` or `~firefly_client.regions.Regions`, optional
+            Region description, either a list of strings or a string, or regions built from
+            catalog columns with `firefly_client.regions`.
         title : `str`, optional
             Title of the region layer.
         region_layer_id : `str`, optional
@@ -2025,6 +2941,8 @@ class FireflyClient:
         .. note:: `file_on_server` and `region_data` are exclusively required.
                   If both are specified, `file_on_server` takes the priority.
                   If none is specified, no region layer is created.
+                  A `region_data` larger than `region_spill_bytes` characters is uploaded as a
+                  region file and the layer is created from that file.
         """
 
         if not region_layer_id:
@@ -2036,7 +2954,8 @@ class FireflyClient:
         if file_on_server:
             payload.update({'fileOnServer': file_on_server})
         elif region_data:
-            payload.update({'regionAry': region_data})
+            spilled = self._spill_region_data(region_data)
+            payload.update({'fileOnServer': spilled} if spilled else {'regionAry': self._region_lines(region_data)})
 
         return self.dispatch(ACTION_DICT['CreateRegionLayer'], payload)
 
@@ -2062,13 +2981,14 @@ class FireflyClient:
         plot_id and payload.update({'plotId': plot_id})
         return self.dispatch(ACTION_DICT['DeleteRegionLayer'], payload)
 
+    @traced
     def add_region_data(self, region_data, region_layer_id, title=None, plot_id=None):
         """
         Add region entries to a region layer with the given ID.
 
         Parameters
         ----------
-        region_data : `str` or `list` of `str`
+        region_data : `str`, `list` of `str` or `~firefly_client.regions.Regions`
             Region entries to be added.
         region_layer_id : `str`
             ID of region layer where the entries are added to.
@@ -2086,10 +3006,12 @@ class FireflyClient:
 
         .. note:: If no region layer with the given ID exists, a new region layer will be created
                   automatically just like how function `overlay_region_layer` works.
+                  A `region_data` larger than `region_spill_bytes` characters is uploaded as a
+                  region file, if the server supports region files in this action.
 
         """
 
-        payload = {'regionChanges': region_data, 'drawLayerId': region_layer_id}
+        payload = {'drawLayerId': region_layer_id, **self._region_changes(region_data)}
         plot_id and payload.update({'plotId': plot_id})
         title and payload.update({'layerTitle': title})
         return self.dispatch(ACTION_DICT['AddRegionData'], payload)
@@ -2100,7 +3022,7 @@ class FireflyClient:
 
         Parameters
         ----------
-        region_data : `str` or `list` of `str`
+        region_data : `str`, `list` of `str` or `~firefly_client.regions.Regions`
             Region entries to be removed.
         region_layer_id : `str`
             ID of the region layer where the region entries are removed from.
@@ -2110,7 +3032,7 @@ class FireflyClient:
         out : `dict`
             Status of the request, like {'success': True}.
         """
-        payload = {'regionChanges': region_data, 'drawLayerId': region_layer_id}
+        payload = {'drawLayerId': region_layer_id, **self._region_changes(region_data)}
 
         return self.dispatch(ACTION_DICT['RemoveRegionData'], payload)
 
@@ -2154,6 +3076,64 @@ class FireflyClient:
         file_on_server and payload.update({'fileKey': file_on_server})
         return self.dispatch(ACTION_DICT['PlotMask'], payload)
 
+    @traced
+    def add_masks(self, masks, plot_id, titles=None, colors=None, mask_ids=None):
+        """
+        Add mask layers for boolean masks held in memory.
+
+        The masks are packed into the bits of one integer image, uploaded once as a FITS file,
+        and the mask layers for all the bits are added in one request.
+
+        Parameters
+        ----------
+        masks : `dict`, `list` or `numpy.ndarray`
+            Boolean masks with the shape of the image, as a `dict` of title to 2-D array, a `list`
+            of 2-D arrays or a 3-D array with one mask per plane. At most 63 masks.
+        plot_id : `str`
+            ID of the plot to overlay the masks on.
+        titles : `list` of `str`, optional
+            Titles of the mask layers. The default is the `dict` keys, or 'mask <n>'.
+        colors : `list` of `str`, optional
+            Html colors of the mask layers. The default is `MASK_COLORS`.
+        mask_ids : `list` of `str`, optional
+            IDs of the mask layers. They are created automatically if not specified.
+
+        Returns
+        -------
+        out : `dict`
+            Status of the request, like {'success': True, 'maskIds': [...], 'fileOnServer': ...}.
+            The mask IDs are for `remove_mask`.
+        """
+        import numpy as np
+        if isinstance(masks, dict):
+            titles = titles or list(masks)
+            masks = list(masks.values())
+        masks = [np.asarray(m) for m in masks]
+        if not masks or len(masks) > 63:
+            raise ValueError('between 1 and 63 masks are needed')
+        if len({m.shape for m in masks}) != 1 or masks[0].ndim != 2:
+            raise ValueError('the masks must be 2-D arrays of the same shape')
+        titles = titles or ['mask %d' % bit for bit in range(len(masks))]
+        mask_ids = mask_ids or [gen_item_id('MaskLayer') for _ in masks]
+        if len(titles) < len(masks) or len(mask_ids) < len(masks):
+            raise ValueError('titles and mask_ids need one entry per mask')
+        dtype = np.uint8 if len(masks) <= 8 else np.int16 if len(masks) <= 15 else \
+            np.int32 if len(masks) <= 31 else np.int64
+        packed = np.zeros(masks[0].shape, dtype=dtype)
+        for bit, mask in enumerate(masks):
+            packed |= mask.astype(bool).astype(dtype) << dtype(bit)
+
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+b') as fp:
+            write_image(fp, packed)
+            file_on_server = self.upload_fits_data(fp)
+        colors = colors or self.MASK_COLORS
+        with self.batch() as statuses:
+            for bit in range(len(masks)):
+                self.add_mask(bit, 0, plot_id, mask_id=mask_ids[bit], color=colors[bit % len(colors)],
+                              title=titles[bit], file_on_server=file_on_server)
+        return {'success': all(s.get('success') for s in statuses), 'maskIds': mask_ids,
+                'fileOnServer': file_on_server}
+
     def remove_mask(self, plot_id, mask_id):
         """
         Remove a mask layer from the plot with the given plot ID.
@@ -0,0 +1,346 @@
+"""
+Module of loadgen.py
+--------------------
+Load generator for sizing Firefly servers, installed as the ``firefly-client-loadgen`` command.
+
+It runs N simulated clients spread over M channels, each one a `FireflyClient` that plays
+a scripted mix of actions (tables, images, zoom/pan bursts, region updates), and reports
+throughput, latency percentiles and error rates. With ``--stand-in`` it runs fully offline
+against a local stand-in server instead of a real Firefly server.
+"""
+import argparse
+import io
+import json
+import math
+import random
+import struct
+import os
+import sys
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from .firefly_client import FireflyClient
+except ImportError:
+    from firefly_client import FireflyClient
+try:
+    from ._stand_in_server import StandInServer
+except ImportError:
+    from _stand_in_server import StandInServer
+try:
+    from .transport import RequestsTransport, UnixSocketTransport, InProcessTransport
+except ImportError:
+    from transport import RequestsTransport, UnixSocketTransport, InProcessTransport
+
+ACTION_MIXES = {
+    'default': {'show_table': 1, 'show_fits_image': 1, 'zoom_pan_burst': 4, 'region_update': 2},
+    'interactive': {'zoom_pan_burst': 8, 'region_update': 2},
+    'upload': {'show_table': 2, 'show_fits_image': 2},
+}
+"""Named action mixes, as relative weights of each scripted action (`dict`)."""
+
+PERCENTILES = (50, 90, 99)
+TRANSPORTS = ('requests', 'unix', 'in-process')
+
+
+def make_transport(spec):
+    """
+    Transport for a simulated client.
+
+    `spec` is None or 'requests', 'unix:<socket path>', or a callable returning a transport
+    (only with thread workers, e.g. for an in-process transport).
+    """
+    if callable(spec):
+        return spec()
+    if spec and spec.startswith('unix:'):
+        return UnixSocketTransport(spec[len('unix:'):])
+    return RequestsTransport()
+
+
+def _fits_image_bytes(size=64):
+    """Build a tiny valid FITS image (float32, size x size) without any FITS library."""
+    cards = ['SIMPLE  =                    T', 'BITPIX  =                  -32', 'NAXIS   =                    2',
+             'NAXIS1  = %20d' % size, 'NAXIS2  = %20d' % size, 'END']
+    header = ''.join(c.ljust(80) for c in cards)
+    header = header.ljust(2880 * math.ceil(len(header) / 2880)).encode('ascii')
+    data = struct.pack('>%df' % (size * size), *[float((i * 7) % 101) for i in range(size * size)])
+    return header + data + b'\0' * (-len(data) % 2880)
+
+
+def _ipac_table_bytes(rows=50):
+    lines = ['|   ra       |   dec      |  mag  |', '|   double   |   double   | real  |']
+    lines += [' %12.6f %12.6f %7.3f' % (10 + i * 0.001, 41 + i * 0.001, 12 + (i % 7) * 0.5) for i in range(rows)]
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+class _SimulatedClient:
+    """One simulated user: a FireflyClient plus the state needed to play the scripted actions."""
+
+    def __init__(self, url, channel, client_idx, burst, regions, token=None, transport=None):
+        self.fc = FireflyClient.make_client(url, launch_browser=False, channel_override=channel, token=token,
+                                            transport=make_transport(transport))
+        self.plot_id = 'loadgen-image-%d' % client_idx
+        self.layer_id = 'loadgen-regions-%d' % client_idx
+        self.tbl_cnt = 0
+        self.burst = burst
+        self.regions = regions
+        self.fits = _fits_image_bytes()
+        self.table = _ipac_table_bytes()
+        self.rnd = random.Random(client_idx)
+
+    def show_table(self, record):
+        self.tbl_cnt += 1
+        tbl_id = '%s-tbl-%d' % (self.plot_id, self.tbl_cnt)
+        record('show_table', lambda: self.fc.show_table(file_input=io.BytesIO(self.table), tbl_id=tbl_id))
+
+    def show_fits_image(self, record):
+        record('show_fits_image', lambda: self.fc.show_fits_image(file_input=io.BytesIO(self.fits),
+                                                                  plot_id=self.plot_id))
+
+    def zoom_pan_burst(self, record):
+        for i in range(self.burst):
+            if i % 2 == 0:
+                record('set_zoom', lambda: self.fc.set_zoom(self.plot_id, self.rnd.choice([0.5, 1, 2, 4])))
+            else:
+                ra, dec = 10.68 + self.rnd.uniform(-0.01, 0.01), 41.27 + self.rnd.uniform(-0.01, 0.01)
+                record('set_pan', lambda: self.fc.set_pan(self.plot_id, ra, dec, coord='J2000'))
+
+    def region_update(self, record):
+        regions = ['image;circle %.2f %.2f 3 # color=red' % (self.rnd.uniform(0, 64), self.rnd.uniform(0, 64))
+                   for _ in range(self.regions)]
+        record('region_update', lambda: self.fc.add_region_data(regions, self.layer_id, plot_id=self.plot_id))
+
+
+def run_client(url, channel, client_idx, mix, iterations, duration, burst=6, regions=20, token=None,
+               transport=None):
+    """
+    Run one simulated client and return its measurements.
+
+    Parameters
+    ----------
+    url : `str`
+        URL of the Firefly server.
+    channel : `str`
+        Channel used by this client.
+    client_idx : `int`
+        Index of this client, used for seeding and plot IDs.
+    mix : `dict`
+        Relative weights of the scripted actions, see `ACTION_MIXES`.
+    iterations : `int` or None
+        Number of scripted actions to run, if `duration` is None.
+    duration : `float` or None
+        Number of seconds to run scripted actions for.
+    burst : `int`
+        Number of zoom/pan calls in a zoom/pan burst.
+    regions : `int`
+        Number of regions sent by a region update.
+    token : `str` or None
+        Authorization token for the server.
+    transport : `str` or `Function` or None
+        Transport of the client, see `make_transport`.
+
+    Returns
+    -------
+    out : `list` of `tuple`
+        One (action name, latency in seconds, error string or None) tuple per call.
+    """
+    records = []
+
+    def record(name, call):
+        start = time.perf_counter()
+        try:
+            call()
+            records.append((name, time.perf_counter() - start, None))
+        except Exception as err:
+            records.append((name, time.perf_counter() - start, '%s: %s' % (type(err).__name__, err)))
+
+    try:
+        client = _SimulatedClient(url, channel, client_idx, burst, regions, token, transport)
+    except Exception as err:
+        return [('connect', 0.0, '%s: %s' % (type(err).__name__, err))]
+
+    client.show_fits_image(record)
+    names = list(mix.keys())
+    weights = [mix[n] for n in names]
+    end = time.perf_counter() + duration if duration else None
+    cnt = 0
+    while (end and time.perf_counter() < end) or (not end and cnt < iterations):
+        getattr(client, client.rnd.choices(names, weights)[0])(record)
+        cnt += 1
+    return records
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    idx = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def summarize(records, elapsed):
+    """
+    Summarize the measurements of all clients.
+
+    Parameters
+    ----------
+    records : `list` of `tuple`
+        (action name, latency in seconds, error string or None) tuples, as returned by `run_client`.
+    elapsed : `float`
+        Wall clock time of the whole run in seconds.
+
+    Returns
+    -------
+    out : `dict`
+        Totals, throughput, error rate and per action latency percentiles in milliseconds.
+    """
+    by_action = defaultdict(list)
+    errors = defaultdict(int)
+    error_samples = {}
+    for name, latency, err in records:
+        by_action[name].append(latency)
+        if err:
+            errors[name] += 1
+            error_samples.setdefault(name, err)
+
+    actions = {}
+    for name, latencies in sorted(by_action.items()):
+        latencies.sort()
+        stats = {'count': len(latencies), 'errors': errors[name],
+                 'mean_ms': 1000 * sum(latencies) / len(latencies), 'max_ms': 1000 * latencies[-1]}
+        stats.update({'p%d_ms' % p: 1000 * _percentile(latencies, p) for p in PERCENTILES})
+        name in error_samples and stats.update({'error_sample': error_samples[name]})
+        actions[name] = stats
+
+    total = len(records)
+    total_errors = sum(errors.values())
+    return {'elapsed_s': elapsed, 'calls': total, 'errors': total_errors,
+            'error_rate': total_errors / total if total else 0.0,
+            'throughput_per_s': total / elapsed if elapsed > 0 else 0.0,
+            'actions': actions}
+
+
+def format_report(summary):
+    lines = ['calls: %d in %.2fs, throughput: %.1f calls/s, errors: %d (%.2f%%)' %
+             (summary['calls'], summary['elapsed_s'], summary['throughput_per_s'],
+              summary['errors'], 100 * summary['error_rate'])]
+    pct_cols = ['p%d_ms' % p for p in PERCENTILES]
+    lines.append('%-16s %8s %8s %10s %s %10s' % ('action', 'count', 'errors', 'mean_ms',
+                                                ' '.join('%10s' % c for c in pct_cols), 'max_ms'))
+    for name, s in summary['actions'].items():
+        lines.append('%-16s %8d %8d %10.2f %s %10.2f' % (name, s['count'], s['errors'], s['mean_ms'],
+                                                       ' '.join('%10.2f' % s[c] for c in pct_cols), s['max_ms']))
+    for name, s in summary['actions'].items():
+        'error_sample' in s and lines.append('first %s error: %s' % (name, s['error_sample']))
+    return '\n'.join(lines)
+
+
+def run_load(url, clients=4, channels=1, mix='default', iterations=50, duration=None, workers='thread',
+             channel_prefix='loadgen', burst=6, regions=20, token=None, transport=None):
+    """
+    Run the simulated clients against a server and summarize the results.
+
+    Parameters
+    ----------
+    url : `str`
+        URL of the Firefly server.
+    clients : `int`
+        Number of simulated clients.
+    channels : `int`
+        Number of channels the clients are spread over.
+    mix : `str` or `dict`
+        Name of an action mix in `ACTION_MIXES` or a dict of action weights.
+    iterations : `int`
+        Number of scripted actions per client, if `duration` is None.
+    duration : `float` or None
+        Number of seconds each client runs for.
+    workers : {'thread', 'process'}
+        Run each client in a thread or in its own process.
+    channel_prefix : `str`
+        Prefix of the generated channel names.
+    burst : `int`
+        Number of zoom/pan calls in a zoom/pan burst.
+    regions : `int`
+        Number of regions sent by a region update.
+    token : `str` or None
+        Authorization token for the server.
+    transport : `str` or `Function` or None
+        Transport of the clients, see `make_transport`.
+
+    Returns
+    -------
+    out : `dict`
+        The summary, see `summarize`.
+    """
+    mix_weights = ACTION_MIXES[mix] if isinstance(mix, str) else mix
+    unknown = set(mix_weights) - set(ACTION_MIXES['default'])
+    if unknown:
+        raise ValueError('unknown actions in mix: %s' % ', '.join(sorted(unknown)))
+    executor_cls = ProcessPoolExecutor if workers == 'process' else ThreadPoolExecutor
+    start = time.perf_counter()
+    with executor_cls(max_workers=clients) as executor:
+        futures = [executor.submit(run_client, url, '%s-%d' % (channel_prefix, i % channels), i, mix_weights,
+                                   iterations, duration, burst, regions, token, transport)
+                   for i in range(clients)]
+        records = [r for f in futures for r in f.result()]
+    return summarize(records, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='firefly-client-loadgen',
+                                     description='Run simulated firefly_client users against a Firefly server.')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='URL of the Firefly server, e.g. http://localhost:8080/firefly')
+    target.add_argument('--stand-in', action='store_true', help='run against a local offline stand-in server')
+    parser.add_argument('--stand-in-latency', type=float, default=0.0,
+                        help='seconds of simulated server work per request for --stand-in')
+    parser.add_argument('-n', '--clients', type=int, default=4, help='number of simulated clients')
+    parser.add_argument('-m', '--channels', type=int, default=1, help='number of channels')
+    parser.add_argument('--mix', default='default', choices=sorted(ACTION_MIXES), help='scripted action mix')
+    parser.add_argument('--iterations', type=int, default=50, help='scripted actions per client')
+    parser.add_argument('--duration', type=float, help='seconds per client, overrides --iterations')
+    parser.add_argument('--workers', default='thread', choices=['thread', 'process'], help='worker type')
+    parser.add_argument('--burst', type=int, default=6, help='zoom/pan calls per burst')
+    parser.add_argument('--regions', type=int, default=20, help='regions per region update')
+    parser.add_argument('--token', help='authorization token for the server')
+    parser.add_argument('--transport', default='requests', choices=TRANSPORTS,
+                        help='how clients reach the server; in-process needs --stand-in and thread workers')
+    parser.add_argument('--unix-socket', help='socket path for --transport unix (a temporary one with --stand-in)')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    if args.transport == 'in-process' and (not args.stand_in or args.workers != 'thread'):
+        parser.error('--transport in-process needs --stand-in and --workers thread')
+    if args.transport == 'unix' and not (args.unix_socket or args.stand_in):
+        parser.error('--transport unix needs --unix-socket')
+    unix_socket = args.unix_socket
+    if args.transport == 'unix' and args.stand_in and not unix_socket:
+        unix_socket = os.path.join(tempfile.mkdtemp(), 'firefly.sock')
+
+    server = None
+    if args.stand_in:
+        server = StandInServer(latency=args.stand_in_latency,
+                               unix_socket=unix_socket if args.transport == 'unix' else None).start()
+    transport = None
+    if args.transport == 'unix':
+        transport = 'unix:' + unix_socket
+    elif args.transport == 'in-process':
+        transport = lambda: InProcessTransport(server.firefly)
+    try:
+        summary = run_load(server.url if server else args.url, args.clients, args.channels, args.mix,
+                           args.iterations, args.duration, args.workers,
+                           burst=args.burst, regions=args.regions, token=args.token, transport=transport)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        server and server.stop()
+    print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+    return 0 if summary['errors'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,7 +11,6 @@ import logging
 import os
 import tempfile
 import time
-from .firefly_client import FireflyClient
 from .fc_utils import gen_item_id
 
 logger = logging.getLogger(__name__)
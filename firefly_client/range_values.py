@@ -1,4 +1,65 @@
 import math
+import weakref
+
+# bounds computed by RangeValues.compute_bounds: id of the array to (weak reference to the array,
+# dict of parameters to bounds)
+_bounds_cache = {}
+
+
+def _sample(data, max_samples):
+    """Finite values of `data` taken at a regular stride, at most about `max_samples` of them."""
+    import numpy as np
+    flat = np.ravel(data)
+    sample = np.asarray(flat[::max(1, flat.size // max_samples)], dtype=np.float64)
+    return sample[np.isfinite(sample)]
+
+
+def _zscale_sample(data, nsamples, samples_perline):
+    """
+    Finite pixels of `data` sampled as IRAF zscale does: along every few lines, about
+    `samples_perline` pixels per line, `nsamples` pixels in all.
+    """
+    import numpy as np
+    arr = np.asarray(data)
+    lines = arr.reshape(-1, arr.shape[-1]) if arr.ndim > 1 else arr.reshape(1, -1)
+    nl, nc = lines.shape
+    col_step = max(2, (nc + samples_perline - 1) // samples_perline)
+    ncols = (nc + col_step - 1) // col_step
+    line_step = max(1, nl // min(nl, (nsamples + ncols - 1) // ncols))
+    sample = np.asarray(lines[::line_step, ::col_step], dtype=np.float64).ravel()
+    return sample[np.isfinite(sample)][:nsamples]
+
+
+def _zscale(sample, contrast, max_reject=0.5, min_npixels=5, krej=2.5, max_iterations=5):
+    """
+    IRAF zscale bounds of `sample`: a line fitted to the sorted values, the outliers rejected
+    over the iterations growing, as in astropy's ZScaleInterval.
+    """
+    import numpy as np
+    sample = np.sort(sample)
+    npix = sample.size
+    vmin, vmax = sample[0], sample[-1]
+    min_good = max(min_npixels, int(npix * max_reject))
+    kernel = np.ones(max(1, int(npix * 0.01)), dtype=bool)
+    x = np.arange(npix)
+    bad = np.zeros(npix, dtype=bool)
+    slope, last_good = 0.0, npix + 1
+    for _ in range(max_iterations):
+        ngood = npix - int(bad.sum())
+        if ngood >= last_good or ngood < min_good:
+            break
+        slope, intercept = np.polyfit(x[~bad], sample[~bad], 1)
+        residual = sample - (slope * x + intercept)
+        threshold = krej * residual[~bad].std()
+        bad |= (residual < -threshold) | (residual > threshold)
+        bad = np.convolve(bad, kernel, mode='same') > 0  # reject the neighbors of the outliers too
+        last_good = ngood
+    if npix - bad.sum() < min_good:
+        return float(vmin), float(vmax)
+    slope = slope / contrast if contrast > 0 else slope
+    center = (npix - 1) // 2
+    median = np.median(sample)
+    return float(max(vmin, median - (center - 1) * slope)), float(min(vmax, median + (npix - center) * slope))
 
 
 class RangeValues:
@@ -12,6 +73,18 @@ class RangeValues:
     """Definition of stretch algorithm (`dict`)."""
     INVERSE_STRETCH_ALGORITHM = {v: k for k, v in STRETCH_ALGORITHM_DICT.items()}
 
+    PRESETS = {'zscale': {'stretch_type': 'zscale', 'algorithm': 'linear'},
+               'minmax': {'stretch_type': 'minmax', 'algorithm': 'linear'},
+               'percent99': {'stretch_type': 'percent', 'algorithm': 'linear', 'lower_value': 1, 'upper_value': 99},
+               'log99.5': {'stretch_type': 'percent', 'algorithm': 'log', 'lower_value': 0.5, 'upper_value': 99.5},
+               'asinh': {'stretch_type': 'zscale', 'algorithm': 'asinh'},
+               'sigma': {'stretch_type': 'sigma', 'algorithm': 'linear', 'lower_value': -2, 'upper_value': 10}}
+    """Named stretches shared by all plots (`dict` of name to parameters of `create_rv_by_stretch_type`
+    and `create_rv_from_data`). Add entries to define more."""
+
+    MAX_SAMPLES = 100000
+    """Number of pixels sampled to compute percent and sigma bounds locally (`int`)."""
+
     @classmethod
     def create_rv(cls, stretch_type, lower_value, upper_value, algorithm,
                   zscale_contrast=25, zscale_samples=600, zscale_samples_perline=120,
@@ -191,3 +264,123 @@ class RangeValues:
                     'asinh_q_value', 'gamma_value', 'rgb_preserve_hue', 'asinh_stretch', 'scaling_k']
         kw = dict((k, rvdict[k]) for k in argnames)
         return RangeValues.create_rv(stretch_type=rvdict['lower_type'], **kw)
+
+    @classmethod
+    def compute_bounds(cls, data, stretch_type='zscale', lower_value=1, upper_value=99, zscale_contrast=25,
+                       zscale_samples=600, zscale_samples_perline=120, max_samples=None):
+        """
+        Compute the lower and upper pixel values of a stretch of an image, on the client.
+
+        The percent and sigma bounds are computed from a regular subsample of `max_samples` pixels
+        (the default is `MAX_SAMPLES`), the zscale bounds from `zscale_samples` pixels sampled along
+        the image lines as IRAF does, and the minmax
+        bounds from all of them. The result is cached for each array and set of parameters; call
+        `clear_cache` after changing the pixels of an array in place.
+
+        Parameters
+        ----------
+        data : `numpy.ndarray`
+            Image pixels. NaN and infinite values are ignored.
+        stretch_type : {'percent', 'minmax', 'absolute', 'zscale', 'sigma'}, optional
+            Stretch type (the default is 'zscale').
+        lower_value, upper_value : `float`, optional
+            Percentiles for 'percent', number of standard deviations from the mean for 'sigma',
+            pixel values for 'absolute'.
+        zscale_contrast : `int`, optional
+            Zscale contrast in percent.
+        zscale_samples : `int`, optional
+            Number of pixels sampled for zscale.
+        zscale_samples_perline : `int`, optional
+            Number of pixels sampled per image line for zscale.
+        max_samples : `int`, optional
+            Number of pixels sampled for percent and sigma.
+
+        Returns
+        -------
+        out : `tuple`
+            (lower, upper) pixel values.
+        """
+        import numpy as np
+        st = stretch_type.lower()
+        if st == 'absolute':
+            return float(lower_value), float(upper_value)
+        key = (st, lower_value, upper_value, zscale_contrast, zscale_samples, zscale_samples_perline, max_samples)
+        ref, bounds = _bounds_cache.get(id(data), (None, None))
+        if ref is None or ref() is not data:
+            bounds = {}
+            try:
+                ref = weakref.ref(data, lambda r, i=id(data): _bounds_cache.pop(i, None))
+                _bounds_cache[id(data)] = ref, bounds
+            except TypeError:  # no weak references to lists, not cached
+                pass
+        if key in bounds:
+            return bounds[key]
+
+        if st in ('minmax', 'maxmin'):
+            arr = np.asarray(data)
+            out = float(np.nanmin(arr)), float(np.nanmax(arr))
+        else:
+            if st == 'zscale':
+                sample = _zscale_sample(data, zscale_samples, zscale_samples_perline)
+            else:
+                sample = _sample(data, max_samples or cls.MAX_SAMPLES)
+            if not sample.size:
+                raise ValueError('no finite pixel values')
+            if st == 'zscale':
+                out = _zscale(sample, zscale_contrast / 100)
+            elif st == 'percent':
+                out = tuple(float(v) for v in np.percentile(sample, [lower_value, upper_value]))
+            elif st == 'sigma':
+                mean, std = sample.mean(), sample.std()
+                out = float(mean + lower_value * std), float(mean + upper_value * std)
+            else:
+                raise ValueError('invalid stretch type: %s' % stretch_type)
+        bounds[key] = out
+        return out
+
+    @classmethod
+    def create_rv_from_data(cls, data, stretch_type='zscale', algorithm='linear', lower_value=1, upper_value=99,
+                            zscale_contrast=25, zscale_samples=600, zscale_samples_perline=120, **additional_params):
+        """
+        Create range values with bounds computed from the pixels on the client (see
+        `compute_bounds`), sent as an absolute stretch so the server doesn't compute them.
+
+        Parameters
+        ----------
+        data : `numpy.ndarray`
+            Image pixels.
+
+        See `compute_bounds` and `create_rv_standard` for the other parameters.
+
+        Returns
+        -------
+        out : `str`
+            a serialized range values string
+        """
+        if stretch_type.lower() in ('minmax', 'maxmin'):
+            stretch_type, lower_value, upper_value = 'minmax', 0, 100
+        lower, upper = cls.compute_bounds(data, stretch_type, lower_value, upper_value, zscale_contrast,
+                                          zscale_samples, zscale_samples_perline)
+        return cls.create_rv_standard(algorithm.lower(), 'absolute', lower, upper, **additional_params)
+
+    @classmethod
+    def create_rv_preset(cls, name, data=None):
+        """
+        Create the range values of the stretch named `name` in `PRESETS`, computed from the pixels
+        `data` if given (see `create_rv_from_data`).
+
+        Returns
+        -------
+        out : `str`
+            a serialized range values string
+        """
+        params = dict(cls.PRESETS[name])
+        stretch_type, algorithm = params.pop('stretch_type'), params.pop('algorithm')
+        if data is not None:
+            return cls.create_rv_from_data(data, stretch_type, algorithm, **params)
+        return cls.create_rv_by_stretch_type(algorithm, stretch_type, **params)
+
+    @staticmethod
+    def clear_cache():
+        """Forget the bounds computed by `compute_bounds`."""
+        _bounds_cache.clear()
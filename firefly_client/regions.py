@@ -0,0 +1,359 @@
+"""
+Module of regions.py
+--------------------
+Region descriptions built from catalog columns, for `FireflyClient.overlay_region_layer`,
+`FireflyClient.add_region_data` and `FireflyClient.remove_region_data`.
+
+`circles`, `boxes`, `points` and `texts` take numpy arrays (or lists, or single values) of
+positions, sizes and properties and return a `Regions` object. Nothing is formatted until the
+regions are sent: the columns are converted to Python lists and every chunk of rows is formatted
+with one string operation, so there is no Python code run per source. A `Regions` object larger
+than `FireflyClient.region_spill_bytes` is written chunk by chunk to the region file uploaded to
+the server, without building the list of region strings.
+
+Examples
+--------
+>>> from firefly_client import regions
+>>> catalog = regions.circles(ra, dec, 3, color='red')                     # ra, dec in degrees
+>>> labels = regions.texts(ra, dec + 0.001, names, color=colors)          # a color per source
+>>> fc.overlay_region_layer(region_data=catalog + labels, region_layer_id='catalog')
+
+`RegionLayer` keeps the regions of a layer on the client, so a changed region set is sent as
+the regions added and removed only.
+"""
+try:
+    from .fc_utils import gen_item_id
+except ImportError:
+    from fc_utils import gen_item_id
+
+SKY_SYSTEMS = ('icrs', 'j2000', 'fk5', 'fk4', 'b1950', 'galactic', 'ecliptic')
+
+# DS9 suffixes of the size units
+SIZE_UNITS = {'arcsec': '"', 'arcmin': "'", 'deg': 'd', 'image': 'i', 'physical': 'p', None: ''}
+
+CHUNK_ROWS = 50000
+
+
+def _literal(text): return str(text).replace('%', '%%')
+
+
+class Regions:
+    """
+    Region descriptions of one or more shapes, formatted on demand.
+
+    Build them with `circles`, `boxes`, `points` or `texts`; add two `Regions` objects with ``+``
+    to send them together.
+
+    Parameters
+    ----------
+    row_format : `str`
+        %-format of one region line.
+    columns : `list`
+        Arrays or lists filling the format fields, in order, all of the same length.
+    nrows : `int`
+        Number of regions.
+    """
+
+    def __init__(self, row_format=None, columns=(), nrows=0):
+        self._blocks = [(row_format, list(columns), nrows)] if nrows else []
+
+    def __len__(self): return sum(b[2] for b in self._blocks)
+
+    def __add__(self, other):
+        out = Regions()
+        out._blocks = self._blocks + other._blocks
+        return out
+
+    def __repr__(self): return 'Regions(%d)' % len(self)
+
+    def chunks(self, rows=CHUNK_ROWS):
+        """
+        Iterate over the region lines in chunks of `rows` lines.
+
+        Yields
+        ------
+        out : `str`
+            Region lines, each ending with a newline.
+        """
+        for row_format, columns, nrows in self._blocks:
+            if not columns:
+                yield '\n'.join([row_format % ()] * nrows) + '\n'
+                continue
+            block_format = None
+            for start in range(0, nrows, rows):
+                parts = [c[start:start + rows] for c in columns]
+                parts = [p.tolist() if hasattr(p, 'tolist') else list(p) for p in parts]
+                count = len(parts[0])
+                if block_format is None or count != rows:
+                    block_format = '\n'.join([row_format] * count) + '\n'
+                values = [v for row in zip(*parts) for v in row]
+                yield block_format % tuple(values)
+
+    def tolist(self):
+        """All region lines as a `list` of `str`."""
+        return [line for chunk in self.chunks() for line in chunk.split('\n')[:-1]]
+
+    def write(self, fp):
+        """
+        Write the region lines as UTF-8 to the binary stream `fp`, chunk by chunk.
+
+        Returns
+        -------
+        out : `int`
+            Number of bytes written.
+        """
+        nbytes = 0
+        for chunk in self.chunks():
+            data = chunk.encode('utf-8')
+            fp.write(data)
+            nbytes += len(data)
+        return nbytes
+
+
+def _column(value):
+    """`value` as a sequence if it is an array or list, None for a single value."""
+    if isinstance(value, (str, bytes)) or value is None:
+        return None
+    if hasattr(value, 'ndim'):
+        return value.ravel() if value.ndim else None
+    return value if isinstance(value, (list, tuple)) else None
+
+
+def _build(shape, coord, fields, properties):
+    """
+    `Regions` with one region of `shape` per row.
+
+    `fields` and `properties` hold (value, %-format) pairs. Single values are written into the
+    row format once, sequences become columns.
+    """
+    row, columns = [], []
+
+    def add(value, fmt):
+        column = _column(value)
+        if column is None:
+            row.append(_literal(fmt % (value.item() if hasattr(value, 'item') else value)))
+        else:
+            row.append(fmt)
+            columns.append(column)
+
+    row.append(_literal('%s;%s ' % (coord, shape)))
+    for i, (value, fmt) in enumerate(fields):
+        i and row.append(' ')
+        add(value, fmt)
+    props = [(k, v) for k, v in properties.items() if v is not None]
+    props and row.append(' #')
+    for key, value in props:
+        row.append(' %s=' % key)
+        add(value, '{%s}' if key == 'text' else '"%s"' if key == 'font' else '%s')
+
+    lengths = {len(c) for c in columns}
+    if len(lengths) > 1:
+        raise ValueError('all the arrays must have the same length')
+    return Regions(''.join(row), columns, lengths.pop() if lengths else 1)
+
+
+def _units(coord, unit, precision):
+    """Formats of a position and a size in `coord` with sizes in `unit`."""
+    sky = coord.lower() in SKY_SYSTEMS
+    if unit == 'default':
+        unit = 'arcsec' if sky else None
+    if unit not in SIZE_UNITS:
+        raise ValueError('unit must be one of %s' % ', '.join(u for u in SIZE_UNITS if u))
+    return '%%.%df%s' % (precision, 'd' if sky else ''), '%.6g' + SIZE_UNITS[unit]
+
+
+def circles(x, y, radius, coord='icrs', unit='default', precision=7, **properties):
+    """
+    Circle regions.
+
+    Parameters
+    ----------
+    x, y : `numpy.ndarray`, `list` or `float`
+        Centers: RA and Dec (or longitude and latitude) in degrees for sky systems, pixels for
+        'image' and 'physical'.
+    radius : `numpy.ndarray`, `list` or `float`
+        Radius in `unit`.
+    coord : `str`, optional
+        Coordinate system, one of `SKY_SYSTEMS`, 'image' or 'physical' (the default is 'icrs').
+    unit : {'arcsec', 'arcmin', 'deg', 'image', 'physical', None}, optional
+        Unit of the sizes. The default is 'arcsec' for sky systems, and pixels of `coord` otherwise.
+    precision : `int`, optional
+        Number of decimals of the positions.
+    **properties : optional keyword arguments
+        Region properties such as `color`, `text`, `width` or `font`, each a single value or one
+        value per region.
+
+    Returns
+    -------
+    out : `Regions`
+    """
+    pos, size = _units(coord, unit, precision)
+    return _build('circle', coord, [(x, pos), (y, pos), (radius, size)], properties)
+
+
+def boxes(x, y, width, height, angle=0, coord='icrs', unit='default', precision=7, **properties):
+    """
+    Box regions, rotated by `angle` degrees. See `circles` for the other parameters.
+
+    Returns
+    -------
+    out : `Regions`
+    """
+    pos, size = _units(coord, unit, precision)
+    return _build('box', coord, [(x, pos), (y, pos), (width, size), (height, size), (angle, '%.6g')],
+                  properties)
+
+
+def points(x, y, point='circle', size=None, coord='icrs', precision=7, **properties):
+    """
+    Point regions.
+
+    Parameters
+    ----------
+    point : {'circle', 'box', 'diamond', 'cross', 'x', 'arrow', 'boxcircle'}, optional
+        Symbol of the points.
+    size : `int`, optional
+        Symbol size in screen pixels.
+
+    See `circles` for the other parameters.
+
+    Returns
+    -------
+    out : `Regions`
+    """
+    pos, _ = _units(coord, None, precision)
+    symbol = point if size is None else '%s %d' % (point, size)
+    return _build('point', coord, [(x, pos), (y, pos)], dict(point=symbol, **properties))
+
+
+def texts(x, y, text, coord='icrs', precision=7, **properties):
+    """
+    Text regions showing `text`, a single string or one per region. See `circles` for the other
+    parameters.
+
+    Returns
+    -------
+    out : `Regions`
+    """
+    pos, _ = _units(coord, None, precision)
+    return _build('text', coord, [(x, pos), (y, pos)], dict(text=text, **properties))
+
+
+def _lines(region_data):
+    if isinstance(region_data, Regions):
+        return region_data.tolist()
+    return [region_data] if isinstance(region_data, str) else list(region_data or [])
+
+
+class RegionLayer:
+    """
+    Region layer shown by a `FireflyClient`, updated by sending only what changed.
+
+    The layer remembers the regions it shows. `update` compares them with the new regions and
+    sends the regions to remove and to add. When that would send more than the new regions
+    themselves, a new layer is created with the new regions and the old layer is deleted after it,
+    in the same request, so the image never shows an empty layer.
+
+    Parameters
+    ----------
+    client : `FireflyClient`
+        Client showing the layer.
+    region_layer_id : `str`, optional
+        ID of the layer. It is automatically created if not specified, and changes when the layer
+        is replaced.
+    title : `str`, optional
+        Title of the layer.
+    plot_id : `str` or `list` of `str`, optional
+        ID of the plots to show the layer on, as for `FireflyClient.overlay_region_layer`.
+
+    Examples
+    --------
+    >>> layer = RegionLayer(fc, title='selection', plot_id='p1')
+    >>> layer.update(regions.circles(ra[selected], dec[selected], 5, color='yellow'))
+    """
+
+    def __init__(self, client, region_layer_id=None, title=None, plot_id=None):
+        self.client = client
+        self.region_layer_id = region_layer_id or gen_item_id('RegionLayer')
+        self.title = title
+        self.plot_id = plot_id
+        self.regions = []
+        self.shown = False
+
+    def update(self, region_data):
+        """
+        Show `region_data` in the layer, in place of the regions shown now.
+
+        Parameters
+        ----------
+        region_data : `str`, `list` of `str` or `Regions`
+            The new regions of the layer.
+
+        Returns
+        -------
+        out : `dict`
+            Status of the request, like {'success': True, 'added': 3, 'removed': 1, 'replaced': False}.
+        """
+        new = list(dict.fromkeys(_lines(region_data)))
+        new_set, old_set = set(new), set(self.regions)
+        added = [r for r in new if r not in old_set]
+        removed = [r for r in self.regions if r not in new_set]
+        out = {'added': len(added), 'removed': len(removed), 'replaced': False}
+        if not self.shown:
+            status = self._overlay(new)
+        elif not added and not removed:
+            status = {'success': True}
+        elif sum(len(r) for r in added + removed) >= sum(len(r) for r in new):
+            status = self._replace(new)
+            out['replaced'] = True
+        else:
+            with self.client.batch() as statuses:
+                queued = [self.client.remove_region_data(removed, self.region_layer_id)] if removed else []
+                added and queued.append(self.client.add_region_data(added, self.region_layer_id))
+            status = _batch_status(statuses, queued)
+        if status.get('success'):
+            self.regions = new
+        return {**status, **out}
+
+    def add(self, region_data):
+        """Add regions to the layer."""
+        return self.update(self.regions + _lines(region_data))
+
+    def remove(self, region_data):
+        """Remove regions from the layer."""
+        removed = set(_lines(region_data))
+        return self.update([r for r in self.regions if r not in removed])
+
+    def delete(self):
+        """Delete the layer from the plots."""
+        status = self.client.delete_region_layer(self.region_layer_id, self.plot_id) if self.shown else {'success': True}
+        self.regions, self.shown = [], False
+        return status
+
+    def _overlay(self, lines, region_layer_id=None):
+        if not lines:
+            return {'success': True}
+        self.shown = True
+        return self.client.overlay_region_layer(region_data=lines, title=self.title, plot_id=self.plot_id,
+                                                region_layer_id=region_layer_id or self.region_layer_id)
+
+    def _replace(self, lines):
+        new_id = gen_item_id('RegionLayer')
+        with self.client.batch() as statuses:
+            queued = [self._overlay(lines, new_id)] if lines else []
+            queued.append(self.client.delete_region_layer(self.region_layer_id, self.plot_id))
+        status = _batch_status(statuses, queued)
+        if status.get('success'):
+            self.region_layer_id = new_id
+            self.shown = bool(lines)
+        return status
+
+
+def _batch_status(statuses, queued):
+    """
+    Status of the actions dispatched in a `FireflyClient.batch`, given the `queued` statuses the
+    dispatches returned. A batch joined to an outer one is sent later, so it is only queued.
+    """
+    if len(statuses) != len(queued):
+        return {'success': all(s.get('success') for s in queued), 'queued': True}
+    return {'success': all(s.get('success') for s in statuses)}
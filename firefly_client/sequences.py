@@ -0,0 +1,334 @@
+"""
+Module of sequences.py
+----------------------
+Showing sequences of images in one Firefly image plot.
+
+`ImageSequencePlayer` shows frames (local FITS files, numpy arrays or files on the server) one
+after the other at a target frame rate. The frames ahead of the playhead are uploaded in the
+background, and a frame whose upload is not done when it is due is dropped instead of holding
+up the frames after it.
+
+`CubeView` shows the planes of a local FITS cube, uploading only the planes looked at.
+"""
+import abc
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+
+try:
+    from ._fits import image_array, image_cards, open_image, write_image
+    from ._uploads import UploadPool
+    from .fc_utils import gen_item_id, debug
+except ImportError:
+    from _fits import image_array, image_cards, open_image, write_image
+    from _uploads import UploadPool
+    from fc_utils import gen_item_id, debug
+
+
+def _upload_fits(client, data, cards=()):
+    """Upload the image `data` with the header `cards` as a FITS file, return the server file reference."""
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+b') as fp:
+        write_image(fp, data, cards)
+        return client.upload_fits_data(fp)
+
+
+class _PlotSequence(abc.ABC):
+    """Shows images one after the other in one plot, applying the stretch and zoom once."""
+
+    def __init__(self, client, plot_id=None, viewer_id=None, workers=2, stretch=None, zoom=None, **show_params):
+        self.client = client
+        self.plot_id = plot_id or gen_item_id('Image')
+        self.viewer_id = viewer_id
+        self.stretch = stretch
+        self.zoom = zoom
+        self.show_params = show_params
+        self.position = None
+        self._uploads = UploadPool(workers)
+        self._styled = False
+
+    def _show(self, index, file_on_server):
+        status = self.client.show_fits_image(file_on_server, plot_id=self.plot_id, viewer_id=self.viewer_id,
+                                             **self.show_params)
+        if not self._styled:
+            self._styled = True
+            self.stretch and self.client.set_stretch(self.plot_id, **self.stretch)
+            self.zoom and self.client.set_zoom(self.plot_id, self.zoom)
+        self.position = index
+        return status
+
+    def step(self, delta=1):
+        """Show the image `delta` images after the one shown last."""
+        return self.show((self.position if self.position is not None else -1) + delta)
+
+    @abc.abstractmethod
+    def show(self, index):
+        """Show image `index` of the sequence."""
+
+
+class ImageSequencePlayer(_PlotSequence):
+    """
+    Play a sequence of images in one plot at a target frame rate.
+
+    Parameters
+    ----------
+    client : `FireflyClient`
+        Client showing the images.
+    frames : `list`
+        The images: local FITS file paths, numpy arrays, server file references (returned by
+        `FireflyClient.upload_file`) or URLs.
+    plot_id : `str`, optional
+        ID of the plot showing the frames. It is automatically created if not specified.
+    viewer_id : `str`, optional
+        ID of the viewer (or cell) of the plot, see `FireflyClient.show_fits_image`.
+    fps : `float`, optional
+        Target number of frames per second.
+    lookahead : `int`, optional
+        Number of frames after the playhead uploaded in advance.
+    workers : `int`, optional
+        Number of uploads running at the same time.
+    stretch : `dict`, optional
+        Keyword arguments of `FireflyClient.set_stretch`, e.g. *{'stype': 'zscale', 'algorithm': 'linear'}*,
+        applied once after the first frame. The following frames keep the stretch and zoom of the plot.
+    zoom : `float`, optional
+        Zoom factor applied once after the first frame.
+    **show_params : optional keyword arguments
+        FITS viewer plotting parameters for every frame, see `FireflyClient.show_fits_image`.
+
+    Attributes
+    ----------
+    position : `int`
+        Index of the frame shown last.
+    shown, dropped : `int`
+        Number of frames shown and dropped by `play`.
+
+    Examples
+    --------
+    >>> player = ImageSequencePlayer(fc, sorted(glob.glob('epochs/*.fits')), fps=5,
+    ...                              stretch={'stype': 'zscale'})
+    >>> player.play()
+    """
+
+    def __init__(self, client, frames, plot_id=None, viewer_id=None, fps=2.0, lookahead=4, workers=2,
+                 stretch=None, zoom=None, **show_params):
+        super().__init__(client, plot_id, viewer_id, workers, stretch, zoom, **show_params)
+        self.frames = frames
+        self.fps = fps
+        self.lookahead = lookahead
+        self.shown = 0
+        self.dropped = 0
+        self._prefetched = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self): return len(self.frames)
+
+    def _upload(self, frame):
+        """Server file reference (or URL) of `frame`."""
+        if hasattr(frame, 'ndim'):
+            return _upload_fits(self.client, image_array(frame))
+        payload = self.client.get_payload_from_file(frame)
+        return payload.get('fileOnServer') or payload['url']
+
+    def _prefetch(self, index, start=0, stop=None, loop=False):
+        """
+        Start the uploads of frame `index` and the `lookahead` frames played after it, forget the
+        others. Returns the `concurrent.futures.Future` of the file reference of frame `index`.
+        """
+        stop = len(self.frames) if stop is None else stop
+        window = [start + (index - start + i) % (stop - start) if loop else index + i
+                  for i in range(self.lookahead + 1)]
+        window = [i for i in window if i < stop]
+        for i in list(self._prefetched):
+            if i not in window:
+                self._prefetched.pop(i).cancel()
+        for i in window:
+            if i not in self._prefetched:
+                frame = self.frames[i]
+                if isinstance(frame, str) and (frame.startswith('${') or '://' in frame):
+                    future = Future()
+                    future.set_result(frame)  # nothing to upload
+                else:
+                    future = self._uploads.submit(self._upload, frame)
+                self._prefetched[i] = future
+        return self._prefetched[index]
+
+    def show(self, index):
+        """Show frame `index` now, waiting for its upload if needed."""
+        index %= len(self.frames)
+        return self._show(index, self._prefetch(index).result())
+
+    def play(self, start=0, stop=None, loop=False, block=True):
+        """
+        Show the frames from `start` to `stop` (excluded) at `fps` frames per second.
+
+        Frames are due at fixed times from the start of the playback. A frame that is not
+        uploaded when it is due is shown late if its upload ends before the next frame is due,
+        and dropped otherwise. A frame whose upload fails is dropped too.
+
+        Parameters
+        ----------
+        start, stop : `int`, optional
+            Range of the frames to play, the default is all of them.
+        loop : `bool`, optional
+            Start again from `start` after the last frame, until `stop` is called.
+        block : `bool`, optional
+            If False, play in a background thread and return right away.
+
+        Returns
+        -------
+        out : `dict`
+            Numbers of frames shown and dropped, e.g. {'shown': 98, 'dropped': 2}. Empty if not `block`.
+        """
+        start = min(max(start, 0), len(self.frames))
+        stop = len(self.frames) if stop is None else min(stop, len(self.frames))
+        self.stop()
+        if stop <= start:
+            self.shown = self.dropped = 0
+            return {'shown': 0, 'dropped': 0}
+        self._stop.clear()
+        if not block:
+            self._thread = threading.Thread(target=self._run, args=(start, stop, loop), daemon=True,
+                                            name='firefly-player')
+            self._thread.start()
+            return {}
+        return self._run(start, stop, loop)
+
+    def _run(self, start, stop, loop):
+        count = stop - start
+        self.shown = self.dropped = 0
+        last = -1  # number of frame periods since t0 of the frame shown last
+        self._prefetch(start, start, stop, loop)
+        t0 = time.monotonic()
+        while count > 0 and not self._stop.is_set():
+            tick = int((time.monotonic() - t0) * self.fps)
+            if tick >= count and not loop:
+                break
+            index = start + tick % count
+            future = self._prefetch(index, start, stop, loop)
+            if tick != last:
+                wait([future], max(0.0, t0 + (tick + 1) / self.fps - time.monotonic()))
+                if not (future.done() and not self._stop.is_set() and int((time.monotonic() - t0) * self.fps) == tick):
+                    continue
+                if future.exception() is None:
+                    self._show(index, future.result())
+                    self.dropped += tick - last - 1
+                    self.shown += 1
+                    last = tick
+                    continue
+                # a frame that failed to upload is dropped, the playback goes on
+                debug('dropping frame %d of %s: %s', index, self.plot_id, future.exception())
+            self._stop.wait(max(0.0, t0 + (tick + 1) / self.fps - time.monotonic()))
+        played = count if not loop else (last + 1)
+        self.dropped = max(self.dropped, played - self.shown)
+        debug('played %d frames of %s: %d shown, %d dropped', played, self.plot_id, self.shown, self.dropped)
+        return {'shown': self.shown, 'dropped': self.dropped}
+
+    def stop(self):
+        """Stop a playback started with ``block=False``."""
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        thread and thread is not threading.current_thread() and thread.join()
+
+    def close(self):
+        """Stop playing and cancel the uploads of the frames not shown yet."""
+        self.stop()
+        for future in self._prefetched.values():
+            future.cancel()
+        self._prefetched = {}
+        self._uploads.shutdown()
+
+
+class CubeView(_PlotSequence):
+    """
+    Show the planes of a local FITS cube one at a time, uploading only the planes looked at.
+
+    The cube is memory-mapped. A plane is uploaded as a 2-D FITS image the first time it is
+    shown (or prefetched), and the server file references of the latest `cache_size` planes are
+    kept, so going back to a plane takes one `FireflyClient.show_fits_image` action and no upload.
+    After a plane is shown, the `prefetch` planes on each side of it are uploaded in the background.
+
+    Parameters
+    ----------
+    client : `FireflyClient`
+        Client showing the planes.
+    path : `str`
+        Path of the local FITS file. Its image must have 3 axes, or more axes of length 1 after the third.
+    image_index : `int`, optional
+        Index of the image HDU among the image HDUs of the file, the default is the first image.
+    cache_size : `int`, optional
+        Number of uploaded planes (and plane ranges) remembered.
+    prefetch : `int`, optional
+        Number of planes uploaded in advance on each side of the plane shown.
+
+    See `ImageSequencePlayer` for the other parameters.
+
+    Examples
+    --------
+    >>> cube = CubeView(fc, 'ngc628_ifu.fits', stretch={'stype': 'zscale'})
+    >>> cube.show(1200)
+    >>> cube.step()            # plane 1201, uploaded in advance
+    >>> cube.show_range(1190, 1210)
+    """
+
+    def __init__(self, client, path, plot_id=None, viewer_id=None, image_index=None, cache_size=16, prefetch=1,
+                 workers=2, stretch=None, zoom=None, **show_params):
+        super().__init__(client, plot_id, viewer_id, workers, stretch, zoom, **show_params)
+        cards, values, data = open_image(path, image_index)
+        if data.ndim < 3 or any(n != 1 for n in data.shape[:-3]):
+            raise ValueError('%s is not a cube' % path)
+        self.path = path
+        self.data = data.reshape(data.shape[-3:])
+        self.cards = image_cards(cards)
+        self.cards += [(key, values[key]) for key in ('BSCALE', 'BZERO', 'BLANK') if key in values]
+        'WCSAXES' not in values and self.cards.insert(0, ('WCSAXES', values['NAXIS']))
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self._cache = OrderedDict()  # (first, stop) plane range to future of the server file reference
+        self._lock = threading.Lock()
+
+    def __len__(self): return self.data.shape[0]
+
+    def _planes(self, first, stop):
+        """`concurrent.futures.Future` of the server file reference of the planes first to stop (excluded)."""
+        with self._lock:
+            future = self._cache.get((first, stop))
+            if future is None or future.cancelled() or (future.done() and future.exception()):
+                future = self._cache[first, stop] = self._uploads.submit(self._upload, first, stop)
+            self._cache.move_to_end((first, stop))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)[1].cancel()
+            return future
+
+    def _upload(self, first, stop):
+        # the planes keep the coordinates of the cube along the third axis
+        cards = [(key, value - first if re.fullmatch(r'CRPIX3[A-Z]?', key) else value) for key, value in self.cards]
+        data = self.data[first] if stop - first == 1 else self.data[first:stop]
+        debug('uploading planes %d to %d of %s', first, stop - 1, self.path)
+        return _upload_fits(self.client, data, cards)
+
+    def show(self, index):
+        """Show plane `index`, then prefetch the planes around it."""
+        index %= len(self)
+        status = self._show(index, self._planes(index, index + 1).result())
+        for offset in range(1, self.prefetch + 1):
+            for neighbor in (index + offset, index - offset):
+                0 <= neighbor < len(self) and self._planes(neighbor, neighbor + 1)
+        return status
+
+    def show_range(self, first, stop):
+        """Show the planes `first` to `stop` (excluded) as one cube, uploaded once."""
+        first, stop = max(first, 0), min(stop, len(self))
+        if stop <= first:
+            raise ValueError('empty plane range')
+        return self._show(first, self._planes(first, stop).result())
+
+    def close(self):
+        """Forget the uploaded planes and cancel the uploads not started."""
+        with self._lock:
+            for future in self._cache.values():
+                future.cancel()
+            self._cache.clear()
+        self._uploads.shutdown()
@@ -0,0 +1,222 @@
+"""
+Module of transport.py
+----------------------
+HTTP transports used by `FireflyClient` to talk to the Firefly server.
+
+A transport has `get` and `post` methods modeled on `requests.Session` and returns objects
+with `status_code`, `reason`, `headers`, `text` and `content`. Pass one to `FireflyClient`
+with the `transport` parameter:
+
+- `RequestsTransport` (the default) uses a `requests.Session`.
+- `UnixSocketTransport` sends HTTP over a Unix domain socket, for a Firefly server running on
+  the same host (e.g. in a container with the socket mounted). The host part of the client URL is
+  only used for the Host header. Websocket events still use TCP.
+- `InProcessTransport` calls a request handler in the same process, e.g. the stand-in server
+  used by the tests, with no networking at all.
+"""
+import abc
+import http.client
+import json
+import os
+import socket
+import threading
+import uuid
+from urllib.parse import urlsplit, urlencode, parse_qs
+
+
+class Response:
+    """Response returned by the transports that do not use requests."""
+
+    def __init__(self, status_code, content=b'', headers=None, reason=''):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.reason = reason
+
+    @property
+    def text(self): return self.content.decode('utf-8', errors='replace')
+
+    def json(self): return json.loads(self.content)
+
+
+def encode_multipart(files):
+    """
+    Encode `files` as a multipart/form-data body.
+
+    Parameters
+    ----------
+    files : `dict`
+        Field name to a file-like object or `bytes`, as for `requests.post`.
+
+    Returns
+    -------
+    out : `tuple`
+        (body as `bytes`, content type)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, value in files.items():
+        content = value.read() if hasattr(value, 'read') else value
+        content = content.encode('utf-8') if isinstance(content, str) else content
+        filename = os.path.basename(str(getattr(value, 'name', None) or field))
+        parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                      'Content-Type: application/octet-stream\r\n\r\n' % (boundary, field, filename)).encode('utf-8'))
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(('--%s--\r\n' % boundary).encode('utf-8'))
+    return b''.join(parts), 'multipart/form-data; boundary=%s' % boundary
+
+
+def encode_body(data=None, files=None):
+    """Body and content type of a POST with form `data` or `files`, like `requests` builds them."""
+    if files:
+        return encode_multipart(files)
+    if isinstance(data, (bytes, str)):
+        return (data.encode('utf-8') if isinstance(data, str) else data), None
+    return urlencode(data or {}).encode('utf-8'), 'application/x-www-form-urlencoded'
+
+
+class Transport(abc.ABC):
+    """Base class of the transports. `headers` are sent with every request."""
+
+    def __init__(self):
+        self.headers = {}
+
+    def get(self, url, headers=None, allow_redirects=True):
+        return self.request('GET', url, headers=headers)
+
+    def post(self, url, data=None, files=None, headers=None):
+        body, content_type = encode_body(data, files)
+        headers = dict(headers or {})
+        content_type and headers.setdefault('Content-Type', content_type)
+        return self.request('POST', url, body, headers)
+
+    @abc.abstractmethod
+    def request(self, method, url, body=None, headers=None):
+        """Send a request, return an object with `status_code`, `reason`, `headers`, `text` and `content`."""
+
+    def _headers(self, headers):
+        return {**self.headers, **(headers or {})}
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    Transport using a `requests.Session`, kept in `session`.
+
+    Parameters
+    ----------
+    session : `requests.Session`, optional
+        Session to use, the default is a new one.
+    """
+
+    def __init__(self, session=None):
+        super().__init__()
+        if session is None:
+            import requests
+            session = requests.Session()
+        self.session = session
+        self.headers = session.headers
+
+    def get(self, url, headers=None, allow_redirects=True):
+        return self.session.get(url, headers=headers, allow_redirects=allow_redirects)
+
+    def post(self, url, data=None, files=None, headers=None):
+        return self.session.post(url, data=data, files=files, headers=headers)
+
+    def request(self, method, url, body=None, headers=None):
+        return self.session.request(method, url, data=body, headers=headers)
+
+    def close(self):
+        self.session.close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, host, timeout):
+        super().__init__(host or 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class UnixSocketTransport(Transport):
+    """
+    Transport sending HTTP/1.1 over a Unix domain socket, with one keep-alive connection per thread.
+
+    Parameters
+    ----------
+    socket_path : `str`
+        Path of the Unix domain socket the Firefly server (or a proxy in front of it) listens on.
+    timeout : `float`, optional
+        Socket timeout in seconds.
+    """
+
+    def __init__(self, socket_path, timeout=60.0):
+        super().__init__()
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, host):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.host != host:
+            conn and conn.close()
+            conn = self._local.conn = _UnixHTTPConnection(self.socket_path, host, self.timeout)
+        return conn
+
+    def request(self, method, url, body=None, headers=None):
+        parts = urlsplit(url)
+        target = parts.path + ('?' + parts.query if parts.query else '')
+        headers = self._headers(headers)
+        for attempt in (0, 1):
+            conn = self._connection(parts.hostname)
+            reused = conn.sock is not None
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+                content = response.read()
+                break
+            except (BrokenPipeError, ConnectionResetError) as error:
+                conn.close()
+                self._local.conn = None
+                # Retry once on a keep-alive connection the server had closed: always for GET, and for
+                # other methods only when no response byte came back, since the server may have run the action.
+                stale = isinstance(error, http.client.RemoteDisconnected) or method in ('GET', 'HEAD')
+                if attempt or not reused or not stale or (body is not None and hasattr(body, 'read')):
+                    raise
+        return Response(response.status, content, dict(response.getheaders()), response.reason)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        conn and conn.close()
+        self._local.conn = None
+
+
+class InProcessTransport(Transport):
+    """
+    Transport calling a request handler directly, without any networking.
+
+    Parameters
+    ----------
+    handler : `object`
+        Object with a ``handle(method, path, query, body, content_type, content_encoding)`` method returning
+        (status code, content type, body as `bytes`), e.g. the stand-in server's `StandInFirefly`.
+    """
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+
+    def request(self, method, url, body=None, headers=None):
+        parts = urlsplit(url)
+        headers = self._headers(headers)
+        status, content_type, content = self.handler.handle(method, parts.path, parse_qs(parts.query),
+                                                            body or b'', headers.get('Content-Type', ''),
+                                                            headers.get('Content-Encoding', ''))
+        return Response(status, content, {'Content-Type': content_type}, http.client.responses.get(status, ''))
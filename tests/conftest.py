@@ -0,0 +1,21 @@
+import pytest
+from firefly_client import FireflyClient
+from firefly_client._stand_in_server import StandInFirefly, ALL_FEATURES
+from firefly_client.transport import InProcessTransport
+
+
+@pytest.fixture
+def in_process_client():
+    """
+    Factory of FireflyClients talking to a StandInFirefly in the same process, without networking.
+
+    ``in_process_client(channel)`` returns (client, stand-in server) for the channel `channel`.
+    `features`, `advertise` and `latency` go to `StandInFirefly`, the other keyword arguments
+    (e.g. viewer_override) to `FireflyClient.make_client`.
+    """
+    def make(channel, features=ALL_FEATURES, advertise=True, latency=0.0, **client_params):
+        firefly = StandInFirefly(features=features, advertise=advertise, latency=latency)
+        fc = FireflyClient.make_client('http://in-process/firefly', launch_browser=False, channel_override=channel,
+                                       transport=InProcessTransport(firefly), **client_params)
+        return fc, firefly
+    return make
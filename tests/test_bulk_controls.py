@@ -0,0 +1,35 @@
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def test_plot_lists_are_one_request(in_process_client):
+    fc, firefly = in_process_client('bulk')
+    plots = ['p%d' % i for i in range(100)]
+    assert len(fc.set_zoom(plots, 2)) == 100
+    assert len(fc.set_pan(plots[:3], 10, 20, coord='J2000')) == 3
+    assert firefly.counts['pushActions'] == 2 and firefly.counts['pushAction'] == 0
+    pans = [a['payload'] for a in firefly.actions if a['type'] == ACTION_DICT['PanImage']]
+    assert [p['plotId'] for p in pans] == plots[:3] and pans[0]['centerPt'] == '10;20;J2000'
+    assert fc.set_stretch(plots, stype='zscale')['success'] and firefly.actions[-1]['payload']['plotId'] == plots
+    assert len(fc.set_zoom(['p1', 'p2', 'p1'], 3)) == 3  # one status per element, duplicates included
+
+
+def test_plot_mappings(in_process_client):
+    fc, firefly = in_process_client('bulk')
+    status = fc.set_stretch({'p1': {}, 'p2': {'algorithm': 'log'}, 'p3': {}}, stype='minmax', algorithm='linear')
+    assert status['success'] and list(status['statuses']) == ['p1', 'p2', 'p3']
+    rvs = [s['rv_string'] for s in status['statuses'].values()]
+    assert rvs[0] == rvs[2] != rvs[1]
+    status = fc.set_color({'p1': {'colormap_id': 3}, 'p2': {}}, bias=0.4)
+    colors = [a['payload'] for a in firefly.actions if a['type'] == ACTION_DICT['ColorImage']]
+    assert [(c['cbarId'], c['bias']) for c in colors] == [(3, 0.4), (0, 0.4)]
+    fc.set_zoom({'p1': 2, 'p2': {'factor': 4}})
+    zooms = [a['payload']['level'] for a in firefly.actions if a['type'] == ACTION_DICT['ZoomImage']]
+    assert zooms == [2, 4] and firefly.counts['pushActions'] == 3
+
+
+def test_plot_lists_in_outer_batch(in_process_client):
+    fc, firefly = in_process_client('bulk')
+    with fc.batch() as statuses:
+        assert fc.set_zoom(['p1', 'p2'], 2) == [{'success': True, 'queued': True}] * 2
+        assert fc.set_pan({'p1': {'x': 1, 'y': 2}})['statuses']['p1']['queued']
+    assert len(statuses) == 3 and firefly.counts['pushActions'] == 1
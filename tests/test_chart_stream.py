@@ -0,0 +1,85 @@
+import threading
+import time
+import numpy as np
+import pytest
+from firefly_client._server_compat import FEATURE_CHART_EXTEND
+from firefly_client._stand_in_server import ALL_FEATURES
+from firefly_client.fc_utils import ACTION_DICT
+
+
+@pytest.fixture
+def stream_client(in_process_client):
+    def make(features=ALL_FEATURES):
+        fc, firefly = in_process_client('stream', features)
+        fc.chart_flush_interval = 0
+        return fc, firefly
+    return make
+
+
+def _actions(firefly, action_type):
+    return [a for a in firefly.actions if a['type'] == action_type]
+
+
+def test_extend_sends_only_new_points(stream_client):
+    fc, firefly = stream_client()
+    fc.show_chart(chartId='lc', data=[{'x': [0, 1], 'y': [5, 6]}])
+    fc.extend_chart('lc', x=np.array([2, 3]), y=[7, 8], max_points=100)
+    extend = _actions(firefly, ACTION_DICT['ExtendChart'])[0]['payload']
+    assert extend == {'chartId': 'lc', 'traceIndices': [0], 'data': {'x': [[2, 3]], 'y': [[7, 8]]},
+                      'maxPoints': 100}
+
+
+def test_extend_falls_back_to_chart_update(stream_client):
+    fc, firefly = stream_client([f for f in ALL_FEATURES if f != FEATURE_CHART_EXTEND])
+    fc.show_chart(chartId='lc', data=[{'x': [0, 1], 'y': [5, 6]}])
+    fc.extend_chart('lc', x=2, y=7)
+    fc.extend_chart('lc', x=[3, 4], y=[8, 9], max_points=4)
+    updates = [a['payload'] for a in _actions(firefly, ACTION_DICT['UpdateChart'])]
+    assert updates[0]['changes'] == {'data.0.x': [0, 1, 2], 'data.0.y': [5, 6, 7]}
+    assert updates[1]['changes'] == {'data.0.x': [1, 2, 3, 4], 'data.0.y': [6, 7, 8, 9]}
+    assert not _actions(firefly, ACTION_DICT['ExtendChart'])
+
+
+def test_extend_is_rate_limited(stream_client):
+    fc, firefly = stream_client()
+    fc.chart_flush_interval = 0.05
+    fc.show_chart(chartId='lc', data=[{'x': [], 'y': []}])
+    assert fc.extend_chart('lc', x=0, y=0)['success']
+    for i in range(1, 5):
+        assert fc.extend_chart('lc', x=i, y=i) == {'success': True, 'queued': True}
+    deadline = time.monotonic() + 2
+    while len(_actions(firefly, ACTION_DICT['ExtendChart'])) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    extends = [a['payload']['data']['x'] for a in _actions(firefly, ACTION_DICT['ExtendChart'])]
+    assert extends == [[[0]], [[1, 2, 3, 4]]]
+
+
+def test_flush_sends_buffered_points(stream_client):
+    fc, firefly = stream_client()
+    fc.chart_flush_interval = 60
+    fc.show_chart(chartId='lc', data=[{'x': [], 'y': []}])
+    fc.extend_chart('lc', x=0, y=0)
+    fc.extend_chart('lc', trace_index=1, x=1, y=1)
+    fc.flush()
+    last = _actions(firefly, ACTION_DICT['ExtendChart'])[-1]['payload']
+    assert last['traceIndices'] == [1] and last['data'] == {'x': [[1]], 'y': [[1]]}
+
+
+def test_extend_does_not_wait_for_the_request_in_flight(stream_client):
+    fc, firefly = stream_client()
+    fc.show_chart(chartId='lc', data=[{'x': [], 'y': []}])
+    release, dispatch = threading.Event(), fc.dispatch
+    fc.dispatch = lambda *args, **kwargs: release.wait(2) and dispatch(*args, **kwargs)
+    sender = threading.Thread(target=fc.extend_chart, args=('lc',), kwargs={'x': 0, 'y': 0})
+    sender.start()
+    while not fc._chart_streams['lc'].sending:
+        time.sleep(0.001)
+    start = time.monotonic()
+    assert fc.extend_chart('lc', x=1, y=1) == {'success': True, 'queued': True}
+    assert time.monotonic() - start < 0.5
+    release.set()
+    sender.join()
+    deadline = time.monotonic() + 2
+    while len(_actions(firefly, ACTION_DICT['ExtendChart'])) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [a['payload']['data']['x'] for a in _actions(firefly, ACTION_DICT['ExtendChart'])] == [[[0]], [[1]]]
@@ -0,0 +1,76 @@
+import base64
+import json
+import numpy as np
+import pytest
+from firefly_client._charts import large_trace_columns, to_jsonable, typed_array
+from firefly_client._fits import bintable_dtype, write_bintable
+from firefly_client._server_compat import FEATURE_BATCH_ACTIONS
+from firefly_client._stand_in_server import ALL_FEATURES
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def test_to_jsonable():
+    obj = {'x': np.arange(3), 'marker': {'size': np.float32(2)}, 'text': ['a', 'b']}
+    assert json.loads(json.dumps(to_jsonable(obj))) == {'x': [0, 1, 2], 'marker': {'size': 2.0}, 'text': ['a', 'b']}
+    assert json.dumps(to_jsonable({'y': [1, np.float32(2.5), np.int64(3)]})) == '{"y": [1, 2.5, 3]}'
+
+
+def test_large_trace_columns():
+    trace = {'x': list(range(100)), 'y': np.ones(100), 'error_y': np.ones(50), 'text': ['t'] * 100, 'mode': 'markers'}
+    assert sorted(large_trace_columns(trace, 100)) == ['x', 'y']
+    assert large_trace_columns({**trace, 'tbl_id': 't1'}, 100) == {}
+    assert large_trace_columns(trace, None) == {}
+
+
+def test_write_bintable_layout(tmp_path):
+    path = tmp_path / 't.fits'
+    with open(path, 'wb') as fp:
+        write_bintable(fp, {'x': np.arange(3.0), 'flag': np.array([True, False, True])})
+    raw = path.read_bytes()
+    assert len(raw) % 2880 == 0 and raw.startswith(b'SIMPLE  =')
+    assert b"XTENSION= 'BINTABLE'" in raw and b'NAXIS1  =                    9' in raw
+    rows = np.frombuffer(raw[5760:5760 + 27], dtype=[('x', '>f8'), ('flag', 'S1')])
+    assert rows['x'].tolist() == [0, 1, 2] and rows['flag'].tolist() == [b'T', b'F', b'T']
+
+
+def test_bintable_dtype_uint64():
+    assert bintable_dtype(np.array([1, 2 ** 63 - 1], np.uint64)) == ('i8', 'K')
+    assert bintable_dtype(np.array([1, 2 ** 63], np.uint64)) == ('f8', 'D')
+
+
+def test_show_chart_moves_large_traces_to_table(in_process_client):
+    fc, firefly = in_process_client('charts')
+    fc.chart_table_points = 1000
+    x = np.linspace(0, 1, 5000)
+    fc.show_chart(chartId='lc', data=[{'x': x, 'y': x ** 2, 'mode': 'markers'}, {'x': [1, 2], 'y': np.array([3, 4])}])
+    table, chart = list(firefly.actions)[-2:]
+    assert table['type'] == ACTION_DICT['FetchTable'] and chart['type'] == ACTION_DICT['ShowPlot']
+    big, small = chart['payload']['data']
+    assert big['tbl_id'] == table['payload']['request']['tbl_id'] == 'lc-trace-0'
+    assert big['x'] == 'tables::x' and big['y'] == 'tables::y' and big['mode'] == 'markers'
+    assert small['x'] == [1, 2] and small['y']['dtype'] in ('i4', 'f8')
+    assert firefly.counts['upload'] == 1
+
+
+@pytest.mark.parametrize('arr, dtype', [
+    (np.arange(4, dtype='>f8'), 'f8'),
+    (np.arange(4, dtype=np.float32), 'f4'),
+    (np.arange(4, dtype=np.int64), 'f8'),
+    (np.array([True, False, True, True]), 'u1'),
+])
+def test_typed_array(arr, dtype):
+    typed = typed_array(arr)
+    assert typed['dtype'] == dtype
+    assert np.frombuffer(base64.b64decode(typed['bdata']), dtype='<' + dtype).tolist() == arr.astype(dtype).tolist()
+
+
+def test_typed_array_2d_shape():
+    assert typed_array(np.zeros((2, 3)))['shape'] == '2, 3'
+
+
+@pytest.mark.parametrize('features, typed', [(ALL_FEATURES, True), ((FEATURE_BATCH_ACTIONS,), False)])
+def test_show_chart_typed_arrays_need_capability(features, typed, in_process_client):
+    fc, firefly = in_process_client('charts', features)
+    fc.show_chart(data=[{'x': np.arange(10.0), 'y': [1] * 10}])
+    x = firefly.actions[-1]['payload']['data'][0]['x']
+    assert (isinstance(x, dict) and x['dtype'] == 'f8') if typed else x == list(range(10))
@@ -0,0 +1,31 @@
+import pytest
+from firefly_client._compression import compress, decompress
+from firefly_client._server_compat import FEATURE_BATCH_ACTIONS, FEATURE_COMPRESSED_REQUESTS
+
+REGIONS = ['image;circle %d %d 3 # color=red' % (i % 500, i // 500) for i in range(5000)]
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test_round_trip(encoding):
+    assert decompress(compress(b'x' * 1000, encoding), encoding) == b'x' * 1000
+
+
+@pytest.mark.parametrize('features, advertise, compressed', [
+    ((FEATURE_BATCH_ACTIONS, FEATURE_COMPRESSED_REQUESTS), True, True),
+    ((FEATURE_BATCH_ACTIONS, FEATURE_COMPRESSED_REQUESTS), False, False),  # not advertised, never probed
+    ((FEATURE_BATCH_ACTIONS,), False, False),
+    ((FEATURE_BATCH_ACTIONS,), True, False),
+])
+def test_large_action_compression(features, advertise, compressed, in_process_client):
+    fc, firefly = in_process_client('gzip', features, advertise)
+    fc.enable_compression()
+    for _ in range(2):
+        assert fc.add_region_data(REGIONS, 'layer1')['success']
+        assert fc.set_zoom('p1', 2)['success']  # small, never compressed
+    assert len(firefly.actions) == 4 and firefly.actions[0]['payload']['regionChanges'] == REGIONS
+    assert fc.compression.requests == (2 if compressed else 0)
+    assert (firefly.compressed_bytes > 0) == compressed
+    if compressed:
+        assert fc.compression.ratio > 5
+        assert fc.server_features.supports(FEATURE_COMPRESSED_REQUESTS)
+    assert firefly.counts['unsupported_encoding'] == 0
@@ -0,0 +1,64 @@
+import io
+import numpy as np
+import pytest
+from firefly_client._fits import header_bytes, read_headers, write_cutout, write_image
+from firefly_client.fc_utils import ACTION_DICT
+
+WCS_CARDS = [('CTYPE1', 'RA---TAN'), ('CTYPE2', 'DEC--TAN'), ('CRPIX1', 50.5), ('CRPIX2', 40.0),
+             ('CRVAL1', 202.48), ('CRVAL2', 47.23), ('CDELT1', -0.001), ('CDELT2', 0.001), ('CRPIX1A', 1.0)]
+
+
+def _read(raw):
+    cards, values, offset, size = next(read_headers(io.BytesIO(raw)))
+    shape = tuple(values['NAXIS%d' % i] for i in range(values['NAXIS'], 0, -1))
+    return values, np.frombuffer(raw[offset:offset + size], dtype='>f4').reshape(shape)
+
+
+def test_pixel_cutout_of_extension(tmp_path):
+    image = np.arange(80 * 100, dtype=np.float32).reshape(80, 100)
+    path = tmp_path / 'mosaic.fits'
+    with open(path, 'wb') as fp:
+        fp.write(header_bytes([('SIMPLE', True), ('BITPIX', 8), ('NAXIS', 0), ('EXTEND', True)]))
+        fp.write(header_bytes([('XTENSION', 'IMAGE'), ('BITPIX', -32), ('NAXIS', 2), ('NAXIS1', 100),
+                               ('NAXIS2', 80), ('PCOUNT', 0), ('GCOUNT', 1)] + WCS_CARDS))
+        raw = image.astype('>f4').tobytes()
+        fp.write(raw + b'\0' * (-len(raw) % 2880))
+    out = io.BytesIO()
+    assert write_cutout(out, str(path), (10, 20, 30, 25), rows_per_write=2) == (10, 20, 30, 25)
+    values, data = _read(out.getvalue())
+    assert 'XTENSION' not in values and values['SIMPLE'] and values['CTYPE1'] == 'RA---TAN'
+    assert (values['NAXIS1'], values['NAXIS2'], values['CRPIX1'], values['CRPIX2']) == (20, 5, 40.5, 20.0)
+    assert (values['CRPIX1A'], values['LTV1'], values['LTV2']) == (-9.0, -10, -20)
+    np.testing.assert_array_equal(data, image[20:25, 10:30])
+
+
+def test_cube_cutout_is_clipped(tmp_path):
+    cube = np.arange(3 * 10 * 10, dtype=np.float32).reshape(3, 10, 10)
+    path = tmp_path / 'cube.fits'
+    with open(path, 'wb') as fp:
+        write_image(fp, cube)
+    out = io.BytesIO()
+    assert write_cutout(out, str(path), (-5, 8, 4, 20)) == (0, 8, 4, 10)
+    np.testing.assert_array_equal(_read(out.getvalue())[1], cube[:, 8:10, 0:4])
+    with pytest.raises(ValueError):
+        write_cutout(io.BytesIO(), str(path), (20, 20, 30, 30))
+
+
+def test_sky_cutout(tmp_path):
+    pytest.importorskip('astropy')
+    path = tmp_path / 'image.fits'
+    with open(path, 'wb') as fp:
+        write_image(fp, np.zeros((80, 100), np.float32), WCS_CARDS)
+    x0, y0, x1, y1 = write_cutout(io.BytesIO(), str(path), (202.48, 47.23, 0.01))
+    assert (x0 + x1) / 2 == pytest.approx(49.5, abs=1) and x1 - x0 == pytest.approx(10, abs=1)
+
+
+def test_show_fits_image_uploads_only_the_cutout(tmp_path, in_process_client):
+    path = tmp_path / 'big.fits'
+    with open(path, 'wb') as fp:
+        write_image(fp, np.zeros((500, 500), np.float32))
+    fc, firefly = in_process_client('cutout')
+    fc.show_fits_image(str(path), plot_id='p1', cutout=(0, 0, 20, 20))
+    assert firefly.upload_bytes < 10000
+    request = firefly.actions[-1]['payload']['wpRequest']
+    assert firefly.actions[-1]['type'] == ACTION_DICT['ShowImage'] and request['file'].startswith('${upload-dir}')
@@ -0,0 +1,74 @@
+import json
+import threading
+import pytest
+from firefly_client.ffws import FFWs, PendingAcks, WS_ACTION_ACK
+
+
+class _EchoAckSocket:
+    """Stands in for the websocket: acknowledges every action frame right away."""
+
+    def __init__(self, ffws):
+        self.ffws = ffws
+        self.frames = []
+
+    def send(self, frame):
+        msg = json.loads(frame)
+        self.frames.append(msg)
+        ack = {'name': WS_ACTION_ACK, 'data': {'requestId': msg['requestId'], 'success': True}}
+        self.ffws.received_message(json.dumps(ack), None)
+
+
+def _make_ffws():
+    ffws = FFWs.__new__(FFWs)
+    ffws.channel, ffws.location, ffws.listeners = 'ch', 'localhost', {}
+    ffws.pending_acks = PendingAcks()
+    ffws.connected = threading.Event()
+    ffws.connected.set()
+    ffws.websocket = _EchoAckSocket(ffws)
+    return ffws
+
+
+def test_send_actions_waits_for_acks():
+    ffws = _make_ffws()
+    data_list = [{'channelID': 'ch', 'cmd': 'pushAction', 'action': '{"type": "t%d"}' % i} for i in range(3)]
+    statuses = ffws.send_actions(data_list, timeout=1)
+    assert [s['success'] for s in statuses] == [True] * 3
+    assert [f['data'] for f in ffws.websocket.frames] == data_list
+    assert len({f['requestId'] for f in ffws.websocket.frames}) == 3
+
+
+def test_missing_ack_times_out():
+    acks = PendingAcks()
+    request_id, waiter = acks.register()
+    with pytest.raises(TimeoutError):
+        acks.wait(request_id, waiter, timeout=0.01)
+
+
+def test_closed_connection_fails_pending():
+    acks = PendingAcks()
+    request_id, waiter = acks.register()
+    acks.fail_all(ConnectionError('closed'))
+    with pytest.raises(ConnectionError):
+        acks.wait(request_id, waiter, timeout=1)
+
+
+class _SilentSocket:
+    """Stands in for a websocket that never acknowledges, and fails on the frame number `fail_at`."""
+
+    def __init__(self, fail_at=None):
+        self.sent, self.fail_at = 0, fail_at
+
+    def send(self, frame):
+        if self.sent == self.fail_at:
+            raise ConnectionError('closed')
+        self.sent += 1
+
+
+@pytest.mark.parametrize('fail_at, error', [(None, TimeoutError), (1, ConnectionError)])
+def test_unacknowledged_actions_are_forgotten(fail_at, error):
+    ffws = _make_ffws()
+    ffws.websocket = _SilentSocket(fail_at)
+    data_list = [{'channelID': 'ch', 'cmd': 'pushAction', 'action': '{}'}] * 3
+    with pytest.raises(error):
+        ffws.send_actions(data_list, timeout=0.01)
+    assert ffws.pending_acks._waiters == {}
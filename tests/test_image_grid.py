@@ -0,0 +1,20 @@
+import numpy as np
+from firefly_client import FireflyClient
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def test_show_image_grid_in_slate(in_process_client):
+    fc, firefly = in_process_client('grid', viewer_override=FireflyClient.SLATE_VIEWER)
+    sources = [np.full((64, 64), i, dtype=np.float32) for i in range(5)] + ['${upload-dir}/on-server.fits']
+    status = fc.show_image_grid(sources, ncols=3, downsample=4, stretch={'stype': 'zscale'}, zoom=2)
+    assert status['success'] and len(status['plot_ids']) == 6
+    actions = list(firefly.actions)
+    cells = [a['payload'] for a in actions if a['type'] == ACTION_DICT['AddCell']]
+    assert [(c['row'], c['col']) for c in cells] == [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]
+    shown = {a['payload']['wpRequest']['plotId']: a['payload']['viewerId']
+             for a in actions if a['type'] == ACTION_DICT['ShowImage']}
+    assert shown == dict(zip(status['plot_ids'], status['cell_ids']))
+    assert firefly.counts['upload'] == 5 and firefly.upload_bytes < 5 * 7000  # binned to 16 x 16
+    styles = [a['type'] for a in actions[-7:]]
+    assert styles.count(ACTION_DICT['StretchImage']) == 1 and styles.count(ACTION_DICT['ZoomImage']) == 6
+    assert firefly.counts['pushActions'] == 2  # the cells, then the stretch and zoom
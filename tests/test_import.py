@@ -0,0 +1,24 @@
+import subprocess
+import sys
+import pytest
+
+
+def _run(code):
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+
+
+def test_package_import_is_lazy():
+    out = _run('import sys, firefly_client; '
+               'print(*[m in sys.modules for m in ("requests", "webbrowser", "firefly_client.firefly_client")])')
+    assert out == ['False', 'False', 'False']
+
+
+def test_client_module_defers_requests():
+    out = _run('import sys; from firefly_client import FireflyClient, RangeValues; print("requests" in sys.modules)')
+    assert out == ['False']
+
+
+def test_unknown_attribute():
+    import firefly_client
+    with pytest.raises(AttributeError):
+        firefly_client.NoSuchThing
@@ -0,0 +1,30 @@
+import pytest
+from firefly_client._stand_in_server import StandInServer
+from firefly_client.loadgen import _percentile, run_load, summarize
+
+
+@pytest.mark.parametrize('pct, expected', [
+    (50, 5),
+    (90, 9),
+    (99, 10),
+    (100, 10),
+])
+def test_percentile(pct, expected):
+    assert _percentile(list(range(1, 11)), pct) == expected
+
+
+def test_summarize_counts_errors():
+    records = [('set_zoom', 0.01, None), ('set_zoom', 0.03, 'ValueError: boom'), ('set_pan', 0.02, None)]
+    summary = summarize(records, elapsed=1.0)
+    assert summary['calls'] == 3
+    assert summary['errors'] == 1
+    assert summary['actions']['set_zoom']['errors'] == 1
+    assert summary['actions']['set_zoom']['error_sample'] == 'ValueError: boom'
+    assert summary['throughput_per_s'] == 3
+
+
+def test_run_load_against_stand_in():
+    with StandInServer() as server:
+        summary = run_load(server.url, clients=2, channels=2, iterations=5)
+        assert summary['errors'] == 0
+        assert server.firefly.counts['pushAction'] == summary['calls']
@@ -0,0 +1,46 @@
+import logging
+import pytest
+from firefly_client import FireflyClient
+from firefly_client._stand_in_server import StandInServer
+from firefly_client.fc_utils import DebugMarker, LazyJSON, sampled, set_debug, warn
+
+
+@pytest.fixture
+def client():
+    with StandInServer() as server:
+        yield FireflyClient.make_client(server.url, launch_browser=False, channel_override='logging')
+
+
+def test_lazy_json_truncates(monkeypatch):
+    monkeypatch.setattr(DebugMarker, 'payload_limit', 20)
+    text = str(LazyJSON({'regionAry': ['circle 1 2 3'] * 100}))
+    assert text.startswith('{') and 'more characters>' in text
+
+
+def test_sampled(monkeypatch):
+    monkeypatch.setattr(DebugMarker, 'sample_every', 3)
+    assert [sampled('sampled-test') for _ in range(6)] == [True, False, False, True, False, False]
+
+
+def test_dispatch_does_not_format_payload_without_debug(client, monkeypatch):
+    formatted = []
+    monkeypatch.setattr(LazyJSON, '__str__', lambda self: formatted.append(self) or '')
+    client.dispatch('test.action', {'regionAry': ['circle 1 2 3'] * 1000})
+    assert formatted == []
+
+
+def test_dispatch_debug_goes_to_dispatch_logger(client, caplog):
+    set_debug(True)
+    try:
+        with caplog.at_level(logging.DEBUG, logger='firefly_client'):
+            client.dispatch('test.action', {'marker': 'counted'})
+    finally:
+        set_debug(False)
+    records = [r for r in caplog.records if r.name == 'firefly_client.dispatch']
+    assert records and 'counted' in records[0].getMessage()
+
+
+def test_warn_uses_logging(caplog):
+    with caplog.at_level(logging.WARNING, logger='firefly_client'):
+        warn('something %s', 'odd')
+    assert caplog.records[-1].getMessage() == 'something odd'
@@ -0,0 +1,29 @@
+import io
+import numpy as np
+import pytest
+from firefly_client._fits import write_image
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def test_write_image_layout():
+    fp = io.BytesIO()
+    write_image(fp, np.arange(6, dtype=np.int16).reshape(2, 3))
+    raw = fp.getvalue()
+    assert len(raw) == 2 * 2880
+    assert b'BITPIX  =                   16' in raw and b'NAXIS1  =                    3' in raw
+    assert np.frombuffer(raw[2880:2892], dtype='>i2').tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_add_masks_packs_bits_and_batches_layers(in_process_client):
+    fc, firefly = in_process_client('masks')
+    masks = {'saturated': np.eye(4, dtype=bool), 'cosmic ray': np.ones((4, 4), bool), 'edge': np.zeros((4, 4))}
+    status = fc.add_masks(masks, 'p1', colors=['red', 'blue'])
+    assert status['success'] and len(status['maskIds']) == 3
+    assert firefly.counts['upload'] == 1 and firefly.counts['pushActions'] == 1
+    layers = [a['payload'] for a in firefly.actions if a['type'] == ACTION_DICT['PlotMask']]
+    assert [(p['title'], p['maskValue'], p['color']) for p in layers] == \
+        [('saturated', 1, 'red'), ('cosmic ray', 2, 'blue'), ('edge', 4, 'red')]
+    assert all(p['fileKey'] == status['fileOnServer'] and p['imageNumber'] == 0 for p in layers)
+    with pytest.raises(ValueError):
+        fc.add_masks(masks, 'p1', mask_ids=['m1', 'm2'])
+    assert firefly.counts['upload'] == 1  # checked before uploading
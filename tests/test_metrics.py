@@ -0,0 +1,60 @@
+import json
+import pytest
+from firefly_client import FireflyClient
+from firefly_client._metrics import Histogram, MetricsRegistry, metrics
+from firefly_client._stand_in_server import StandInServer
+from firefly_client.fc_utils import ACTION_DICT
+
+
+@pytest.fixture
+def enabled_metrics():
+    FireflyClient.enable_metrics(reset=True)
+    yield metrics
+    FireflyClient.enable_metrics(False, reset=True)
+
+
+def test_histogram_quantiles():
+    h = Histogram((1, 2, 5, 10))
+    for v in (0.5, 1.5, 1.5, 3, 8):
+        h.observe(v)
+    snap = h.snapshot()
+    assert snap['count'] == 5 and snap['min'] == 0.5 and snap['max'] == 8
+    assert 1 <= snap['p50'] <= 2
+    assert snap['p99'] <= 8
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry()
+    registry.inc('x')
+    registry.observe('y_seconds', 1.0)
+    with registry.timer('z_seconds'):
+        pass
+    assert registry.snapshot() == {}
+
+
+def test_prometheus_and_json_export(tmp_path):
+    registry = MetricsRegistry()
+    registry.enabled = True
+    registry.inc('coalesced_actions', 3)
+    registry.observe('dispatch_seconds', 0.003, action='ImagePlotCntlr.ZoomImage')
+    text = registry.to_prometheus()
+    assert 'firefly_client_coalesced_actions_total 3' in text
+    assert 'firefly_client_dispatch_seconds_bucket{action="ImagePlotCntlr.ZoomImage",le="+Inf"} 1' in text
+    assert 'firefly_client_dispatch_seconds_count{action="ImagePlotCntlr.ZoomImage"} 1' in text
+    registry.export(str(tmp_path / 'stats.json'))
+    data = json.loads((tmp_path / 'stats.json').read_text())
+    assert data['metrics']['coalesced_actions'][0]['value'] == 3
+
+
+def test_client_records_dispatch_and_upload(enabled_metrics, tmp_path):
+    path = tmp_path / 'tbl.txt'
+    path.write_bytes(b'x' * 1000)
+    with StandInServer() as server:
+        fc = FireflyClient.make_client(server.url, launch_browser=False, channel_override='metrics')
+        fc.set_zoom('p1', 2)
+        fc.upload_file(str(path))
+    stats = fc.get_stats()
+    zoom = [e for e in stats['dispatch_seconds'] if e['labels']['action'] == ACTION_DICT['ZoomImage']]
+    assert zoom[0]['count'] == 1
+    assert stats['upload_bytes'][0]['sum'] == 1000
+    assert stats['response_parse_seconds'][0]['count'] >= 1
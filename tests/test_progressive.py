@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from firefly_client._fits import binned_cards, block_mean, write_image
+from firefly_client.fc_utils import ACTION_DICT
+
+
+@pytest.fixture
+def preview_client(in_process_client):
+    fc, firefly = in_process_client('preview')
+    fc.preview_size = 16
+    return fc, firefly
+
+
+def _shown(firefly):
+    return [a['payload']['wpRequest'] for a in firefly.actions if a['type'] == ACTION_DICT['ShowImage']]
+
+
+def test_block_mean_and_binned_wcs():
+    data = np.arange(7 * 9, dtype=np.int16).reshape(7, 9)
+    np.testing.assert_allclose(block_mean(data, 3, rows_per_read=3),
+                               data[:6].reshape(2, 3, 3, 3).mean(axis=(1, 3)))
+    cards = dict(binned_cards([('CRPIX1', 10.0), ('CRPIX2', 1.0), ('CDELT1', -0.001), ('CD2_2', 0.002)], 4))
+    # pixel 10 of the full image is 1 + (10 - 0.5 - 2) / 4 in the binned one
+    assert cards['CRPIX1'] == pytest.approx(2.875) and cards['CRPIX2'] == pytest.approx(0.625)
+    assert cards['CDELT1'] == pytest.approx(-0.004) and cards['CD2_2'] == pytest.approx(0.008)
+    assert cards['LTM1_1'] == 0.25 and cards['LTV1'] == pytest.approx(0.375)
+
+
+def test_show_array_progressive(preview_client):
+    fc, firefly = preview_client
+    data = np.random.default_rng(1).random((100, 64))
+    status = fc.show_array(data, plot_id='p1', header={'CRPIX1': 50.5, 'BITPIX': 8}, progressive=True,
+                           title='sky')
+    assert status['success'] and status['preview']
+    preview_bytes = firefly.upload_bytes
+    assert preview_bytes < data.nbytes / 4
+    fc.wait_uploads()
+    assert status['full'].result()['success']
+    shown = _shown(firefly)
+    assert [(r['plotId'], r['title']) for r in shown] == [('p1', 'sky'), ('p1', 'sky')]
+    assert shown[0]['file'] != shown[1]['file'] and firefly.upload_bytes - preview_bytes > data.nbytes
+
+
+def test_small_array_and_file_progressive(tmp_path, preview_client):
+    fc, firefly = preview_client
+    assert 'preview' not in fc.show_array(np.ones((8, 8), dtype=bool))
+    path = tmp_path / 'big.fits'
+    with open(path, 'wb') as fp:
+        write_image(fp, np.ones((64, 64), np.float32), [('BZERO', 1.0)])
+    status = fc.show_fits_image(str(path), plot_id='p2', progressive=True, multiImageIdx=0)
+    fc.wait_uploads()
+    assert status['preview'] and status['full'].done()
+    shown = _shown(firefly)
+    assert [r.get('plotId') for r in shown] == [None, 'p2', 'p2']
+    assert 'multiImageIdx' not in shown[1] and shown[2]['multiImageIdx'] == 0
+
+
+def test_file_preview_leaves_out_blank_pixels(tmp_path, preview_client):
+    fc, _ = preview_client
+    data = np.full((64, 64), 10, dtype=np.int16)
+    data[0, 0] = data[4:8, 4:8] = -32768
+    path = tmp_path / 'blank.fits'
+    with open(path, 'wb') as fp:
+        write_image(fp, data, [('BLANK', -32768), ('BSCALE', 2.0)])
+    preview, _ = fc._file_preview(str(path), factor=4)
+    assert preview[0, 0] == 20 and np.isnan(preview[1, 1])
+    assert np.all(preview[np.isfinite(preview)] == 20)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from firefly_client import RangeValues
+from firefly_client.range_values import _zscale
+from firefly_client.fc_utils import ACTION_DICT
+
+
+@pytest.fixture
+def image():
+    data = np.random.default_rng(3).normal(100, 10, (500, 400)).astype(np.float32)
+    data[10, 10] = np.nan
+    return data
+
+
+def test_compute_bounds(image):
+    lower, upper = RangeValues.compute_bounds(image, 'percent', 1, 99)
+    assert lower == pytest.approx(100 - 2.33 * 10, abs=1) and upper == pytest.approx(100 + 2.33 * 10, abs=1)
+    lower, upper = RangeValues.compute_bounds(image, 'sigma', -2, 3)
+    assert lower == pytest.approx(80, abs=1) and upper == pytest.approx(130, abs=1)
+    lower, upper = RangeValues.compute_bounds(image, 'zscale')
+    assert 50 < lower < 100 < upper < 160
+    assert RangeValues.compute_bounds(image, 'minmax') == (float(np.nanmin(image)), float(np.nanmax(image)))
+    assert RangeValues.compute_bounds(image, 'absolute', 3, 4) == (3.0, 4.0)
+
+
+def test_zscale_matches_astropy():
+    rng = np.random.default_rng(0)
+    sample = rng.normal(100, 10, 600)
+    sample[:60], sample[60:80] = rng.uniform(1000, 5000, 60), -500
+    # astropy.visualization.ZScaleInterval().get_limits(sample)
+    assert _zscale(sample, 0.25) == pytest.approx((29.2911148924751, 172.264734175642))
+
+
+def test_bounds_are_cached_per_array(image):
+    bounds = RangeValues.compute_bounds(image, 'percent', 5, 95)
+    image[:] = 0
+    assert RangeValues.compute_bounds(image, 'percent', 5, 95) == bounds
+    RangeValues.clear_cache()
+    assert RangeValues.compute_bounds(image, 'percent', 5, 95) == (0.0, 0.0)
+
+
+def test_rv_from_data_is_absolute(image):
+    rv = RangeValues.parse_rvstring(RangeValues.create_rv_from_data(image, 'percent', 'log', 1, 99))
+    assert rv['lower_type'] == rv['upper_type'] == 'absolute' and rv['algorithm'] == 'log'
+    assert rv['lower_value'] == pytest.approx(RangeValues.compute_bounds(image, 'percent', 1, 99)[0], abs=1e-5)
+    assert RangeValues.parse_rvstring(RangeValues.create_rv_preset('log99.5'))['lower_type'] == 'percent'
+
+
+def test_set_stretch_with_data_and_preset(image, in_process_client):
+    fc, firefly = in_process_client('rv')
+    status = fc.set_stretch({'p1': {'data': image}, 'p2': {'data': image * 2}}, preset='zscale')
+    rvs = [RangeValues.parse_rvstring(s['rv_string']) for s in status['statuses'].values()]
+    assert rvs[1]['upper_value'] == pytest.approx(2 * rvs[0]['upper_value'], rel=1e-4)
+    stretches = [a['payload'] for a in firefly.actions if a['type'] == ACTION_DICT['StretchImage']]
+    assert [s['stretchData'][0]['rv'] for s in stretches] == [s['rv_string'] for s in status['statuses'].values()]
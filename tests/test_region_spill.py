@@ -0,0 +1,32 @@
+import pytest
+from firefly_client._server_compat import FEATURE_BATCH_ACTIONS
+
+REGIONS = ['image;circle %d %d 3 # color=red' % (i % 500, i // 500) for i in range(20000)]
+
+
+def test_small_regions_stay_inline(in_process_client):
+    fc, firefly = in_process_client('spill')
+    fc.overlay_region_layer(region_data=REGIONS[:10], region_layer_id='l1')
+    assert firefly.actions[-1]['payload']['regionAry'] == REGIONS[:10]
+    assert firefly.counts['upload'] == 0
+
+
+@pytest.mark.parametrize('method, inline_key', [
+    ('overlay_region_layer', 'regionAry'),
+    ('add_region_data', 'regionChanges'),
+    ('remove_region_data', 'regionChanges'),
+])
+def test_large_regions_spill_to_file(method, inline_key, in_process_client):
+    fc, firefly = in_process_client('spill')
+    getattr(fc, method)(region_data=REGIONS, region_layer_id='l1')
+    payload = firefly.actions[-1]['payload']
+    assert payload['fileOnServer'].startswith('${upload-dir}') and inline_key not in payload
+    assert firefly.upload_bytes > sum(len(r) for r in REGIONS)
+
+
+def test_region_changes_inline_without_capability(in_process_client):
+    fc, firefly = in_process_client('spill', features=(FEATURE_BATCH_ACTIONS,))
+    fc.add_region_data(REGIONS, 'l1')
+    assert firefly.actions[-1]['payload']['regionChanges'] == REGIONS
+    fc.overlay_region_layer(region_data=REGIONS, region_layer_id='l2')  # region files always work here
+    assert 'fileOnServer' in firefly.actions[-1]['payload']
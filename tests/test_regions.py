@@ -0,0 +1,85 @@
+import io
+import numpy as np
+import pytest
+from firefly_client import regions
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def test_region_lines():
+    circles = regions.circles(np.array([10.5, 20.0]), [1, -2], 3, color=np.array(['red', 'blue']), text='100%')
+    assert circles.tolist() == ['icrs;circle 10.5000000d 1.0000000d 3" # color=red text={100%}',
+                                'icrs;circle 20.0000000d -2.0000000d 3" # color=blue text={100%}']
+    assert regions.points(5, 6, 'cross', 10, coord='image', precision=1).tolist() == \
+        ['image;point 5.0 6.0 # point=cross 10']
+    assert regions.boxes(1, 2, [3, 4], 5, angle=30, coord='image', unit=None, precision=0).tolist() == \
+        ['image;box 1 2 3 5 30', 'image;box 1 2 4 5 30']
+    labels = regions.texts([1], [2], ['M51'], font='helvetica 12')
+    assert labels.tolist() == ['icrs;text 1.0000000d 2.0000000d # text={M51} font="helvetica 12"']
+    assert len(circles + labels) == 3
+
+
+def test_chunks_match_lines():
+    ra = np.linspace(0, 1, 1001)
+    circles = regions.circles(ra, ra, 2, unit='arcmin', color='green')
+    chunks = list(circles.chunks(rows=100))
+    assert len(chunks) == 11
+    fp = io.BytesIO()
+    assert circles.write(fp) == len(''.join(chunks))
+    assert fp.getvalue().decode().splitlines() == circles.tolist()
+    assert circles.tolist()[-1] == "icrs;circle 1.0000000d 1.0000000d 2' # color=green"
+
+
+def test_length_mismatch():
+    with pytest.raises(ValueError):
+        regions.circles(np.zeros(3), np.zeros(4), 1)
+
+
+def test_client_sends_small_regions_inline_and_large_as_file(in_process_client):
+    fc, firefly = in_process_client('regions')
+    fc.overlay_region_layer(region_data=regions.circles([1, 2], [3, 4], 1), region_layer_id='small')
+    assert len(firefly.actions[-1]['payload']['regionAry']) == 2
+    big = regions.circles(np.arange(50000.0), np.arange(50000.0), 1)
+    fc.add_region_data(big, 'big')
+    assert firefly.actions[-1]['payload']['fileOnServer'].startswith('${upload-dir}')
+    assert firefly.upload_bytes > sum(len(line) for line in big.tolist())
+
+
+def test_region_layer_sends_differences(in_process_client):
+    fc, firefly = in_process_client('regions')
+    layer = regions.RegionLayer(fc, region_layer_id='sel', plot_id='p1')
+    lines = regions.circles(np.arange(100.0), np.zeros(100), 1).tolist()
+    assert layer.update(lines)['success']
+    assert firefly.actions[-1]['type'] == ACTION_DICT['CreateRegionLayer']
+    status = layer.update(lines[5:] + ['image;point 1 1'])
+    assert status == {'success': True, 'added': 1, 'removed': 5, 'replaced': False}
+    removed, added = list(firefly.actions)[-2:]
+    assert removed['type'] == ACTION_DICT['RemoveRegionData'] and removed['payload']['regionChanges'] == lines[:5]
+    assert added['type'] == ACTION_DICT['AddRegionData'] and added['payload']['regionChanges'] == ['image;point 1 1']
+    count = len(firefly.actions)
+    assert layer.update(lines[5:] + ['image;point 1 1'])['success'] and len(firefly.actions) == count
+
+
+def test_region_layer_replaced_when_cheaper(in_process_client):
+    fc, firefly = in_process_client('regions')
+    layer = regions.RegionLayer(fc, region_layer_id='sel')
+    layer.update(['image;point %d 1' % i for i in range(10)])
+    assert layer.update(['image;point 1 %d' % i for i in range(20, 25)])['replaced']
+    create, delete = list(firefly.actions)[-2:]
+    assert create['type'] == ACTION_DICT['CreateRegionLayer'] and create['payload']['drawLayerId'] == layer.region_layer_id
+    assert delete['type'] == ACTION_DICT['DeleteRegionLayer'] and delete['payload']['drawLayerId'] == 'sel'
+    layer.delete()
+    assert firefly.actions[-1]['payload']['drawLayerId'] == layer.region_layer_id and not layer.regions
+
+
+def test_region_layer_in_outer_batch_and_failed_replace(monkeypatch, in_process_client):
+    fc, firefly = in_process_client('regions')
+    layer = regions.RegionLayer(fc, region_layer_id='sel')
+    layer.update(['image;point %d 1' % i for i in range(10)])
+    with fc.batch() as statuses:
+        status = layer.update(['image;point 2 2'])
+        assert status['queued'] and status['replaced'] and not statuses
+    assert [s['success'] for s in statuses] == [True, True] and layer.region_layer_id != 'sel'
+    replaced_id = layer.region_layer_id
+    monkeypatch.setattr(fc, '_send_actions_as_post', lambda data_list: [{'success': False}] * len(data_list))
+    assert not layer.update(['image;point 3 3'])['success']
+    assert layer.region_layer_id == replaced_id and layer.regions == ['image;point 2 2']
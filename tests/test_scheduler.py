@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+import pytest
+from firefly_client._scheduler import SendScheduler, TokenBucket, lane_for_data, INTERACTIVE, NORMAL, BULK, \
+    BULK_PAYLOAD_BYTES
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def _data(action_type, payload):
+    return {'channelID': 'ch', 'cmd': 'pushAction', 'action': json.dumps({'type': action_type, 'payload': payload})}
+
+
+@pytest.mark.parametrize('data, lane', [
+    (_data(ACTION_DICT['ZoomImage'], {'plotId': 'p1'}), INTERACTIVE),
+    (_data(ACTION_DICT['ShowTable'], {'request': {}}), NORMAL),
+    (_data(ACTION_DICT['CreateRegionLayer'], {'regionAry': ['x' * BULK_PAYLOAD_BYTES]}), BULK),
+])
+def test_lane_for_data(data, lane):
+    assert lane_for_data(data) == lane
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.last
+    assert bucket.wait_time(now) == 0
+    bucket.consume()
+    bucket.consume()
+    assert bucket.wait_time(now) == pytest.approx(0.1)
+    assert bucket.wait_time(now + 0.1) == pytest.approx(0, abs=1e-9)
+
+
+def test_rate_limit():
+    scheduler = SendScheduler()
+    scheduler.configure(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        with scheduler.slot(NORMAL, 'ch'):
+            pass
+    assert time.monotonic() - start >= 0.09
+
+
+def test_interactive_does_not_wait_for_upload():
+    scheduler = SendScheduler()
+    scheduler.configure(max_in_flight=2)
+    upload_started, upload_done = threading.Event(), threading.Event()
+
+    def upload():
+        with scheduler.slot(BULK, 'ch'):
+            upload_started.set()
+            upload_done.wait(5)
+
+    uploads = [threading.Thread(target=upload) for _ in range(2)]
+    for t in uploads:
+        t.start()
+    upload_started.wait(5)
+    start = time.monotonic()
+    with scheduler.slot(INTERACTIVE, 'ch'):
+        assert scheduler.in_flight[BULK] == 1  # second upload waits for the bulk cap
+    assert time.monotonic() - start < 1
+    upload_done.set()
+    for t in uploads:
+        t.join()
+
+
+def test_unlimited_counts_concurrent_requests():
+    scheduler = SendScheduler()
+
+    def send():
+        for _ in range(2000):
+            with scheduler.slot(BULK, 'ch'):
+                pass
+
+    threads = [threading.Thread(target=send) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert scheduler.in_flight == [0, 0, 0]
@@ -0,0 +1,101 @@
+import pytest
+from firefly_client import FireflyClient
+from firefly_client._sender import ActionMailbox, coalesce_key
+from firefly_client._server_compat import FEATURE_BATCH_ACTIONS
+from firefly_client._stand_in_server import StandInServer
+from firefly_client.fc_utils import ACTION_DICT
+
+
+def _zoom_key(plot_id): return coalesce_key(ACTION_DICT['ZoomImage'], {'plotId': plot_id}, 'ch')
+
+
+def _drain(mailbox):
+    out = []
+    while len(mailbox):
+        out.append(mailbox.take().data)
+    return out
+
+
+def test_coalesce_key():
+    assert _zoom_key('p1') != _zoom_key('p2')
+    assert coalesce_key(ACTION_DICT['ShowImage'], {'plotId': 'p1'}, 'ch') is None
+    assert coalesce_key(ACTION_DICT['ZoomImage'], {}, 'ch') is None
+    red = coalesce_key(ACTION_DICT['StretchImage'], {'plotId': 'p1', 'stretchData': [{'band': 'RED'}]}, 'ch')
+    green = coalesce_key(ACTION_DICT['StretchImage'], {'plotId': 'p1', 'stretchData': [{'band': 'GREEN'}]}, 'ch')
+    assert red != green
+
+
+def test_newer_action_replaces_queued_one_in_place():
+    mailbox = ActionMailbox()
+    mailbox.put('zoom p1 #1', _zoom_key('p1'))
+    mailbox.put('zoom p2', _zoom_key('p2'))
+    mailbox.put('zoom p1 #2', _zoom_key('p1'))
+    assert _drain(mailbox) == ['zoom p1 #2', 'zoom p2']
+    assert mailbox.coalesced_cnt == 1
+
+
+def test_barrier_stops_coalescing():
+    mailbox = ActionMailbox()
+    mailbox.put('zoom p1 #1', _zoom_key('p1'))
+    mailbox.put('show p1', None)
+    mailbox.put('zoom p1 #2', _zoom_key('p1'))
+    assert _drain(mailbox) == ['zoom p1 #1', 'show p1', 'zoom p1 #2']
+
+
+def test_background_sender_sends_latest_state():
+    with StandInServer(latency=0.02) as server:
+        fc = FireflyClient.make_client(server.url, launch_browser=False)
+        fc.start_background_sender()
+        for level in range(1, 21):
+            assert fc.set_zoom('p1', level)['queued']
+        fc.flush()
+        fc.stop_background_sender()
+        zooms = [a['payload']['level'] for a in server.firefly.actions]
+        assert len(zooms) < 20
+        assert zooms[-1] == 20
+
+
+@pytest.mark.parametrize('features, advertise, expected_requests', [
+    ((FEATURE_BATCH_ACTIONS,), True, 1),   # advertised
+    ((FEATURE_BATCH_ACTIONS,), False, 1),  # probed
+    ((), False, 6),                        # probed, refused, then one at a time
+])
+def test_batch(features, advertise, expected_requests):
+    with StandInServer(features=features, advertise=advertise) as server:
+        fc = FireflyClient.make_client(server.url, launch_browser=False)
+        with fc.batch() as statuses:
+            for pid in ['p1', 'p2', 'p3', 'p4', 'p5']:
+                fc.set_zoom(pid, 2)
+        assert [s['success'] for s in statuses] == [True] * 5
+        assert [a['payload']['plotId'] for a in server.firefly.actions] == ['p1', 'p2', 'p3', 'p4', 'p5']
+        assert server.firefly.counts['pushAction'] + server.firefly.counts[FEATURE_BATCH_ACTIONS] == expected_requests
+
+
+def test_auto_batch_keeps_order():
+    with StandInServer(latency=0.02) as server:
+        fc = FireflyClient.make_client(server.url, launch_browser=False)
+        fc.start_background_sender(auto_batch=True)
+        for i in range(10):
+            fc.show_fits_image(url='https://example.com/%d.fits' % i, plot_id='p%d' % i)
+        fc.flush()
+        fc.stop_background_sender()
+        assert [a['payload']['wpRequest']['plotId'] for a in server.firefly.actions] == ['p%d' % i for i in range(10)]
+        assert server.firefly.counts[FEATURE_BATCH_ACTIONS] + server.firefly.counts['pushAction'] < 10
+
+
+def test_read_does_not_raise_errors_of_queued_actions(monkeypatch, in_process_client):
+    fc, _ = in_process_client('reads')
+    fc.start_background_sender()
+    post = fc.transport.post
+
+    def failing_post(url, data=None, **kwargs):
+        if ACTION_DICT['ZoomImage'] in str(data):
+            raise ConnectionError('zoom failed')
+        return post(url, data=data, **kwargs)
+
+    monkeypatch.setattr(fc.transport, 'post', failing_post)
+    assert fc.set_zoom('p1', 2)['queued']
+    assert fc._is_page_connected()
+    with pytest.raises(ConnectionError):
+        fc.flush()
+    fc.stop_background_sender()
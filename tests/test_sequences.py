@@ -0,0 +1,84 @@
+import numpy as np
+from firefly_client._fits import write_image
+from firefly_client.fc_utils import ACTION_DICT
+from firefly_client.sequences import CubeView, ImageSequencePlayer
+
+
+def _types(firefly):
+    return [a['type'] for a in firefly.actions]
+
+
+def test_play_shows_every_frame_in_one_plot(in_process_client):
+    fc, firefly = in_process_client('player')
+    frames = [np.full((4, 4), i, dtype=np.float32) for i in range(6)]
+    player = ImageSequencePlayer(fc, frames, plot_id='seq', fps=50, lookahead=2,
+                                 stretch={'stype': 'minmax'}, zoom=2)
+    result = player.play()
+    assert result['shown'] + result['dropped'] == 6 and result['shown'] >= 1
+    shown = [a['payload']['wpRequest'] for a in firefly.actions if a['type'] == ACTION_DICT['ShowImage']]
+    assert len(shown) == result['shown'] and {r['plotId'] for r in shown} == {'seq'}
+    assert _types(firefly).count(ACTION_DICT['StretchImage']) == 1
+    assert _types(firefly).count(ACTION_DICT['ZoomImage']) == 1
+    player.close()
+
+
+def test_frames_are_dropped_when_behind(in_process_client):
+    fc, firefly = in_process_client('player')
+    frames = ['${upload-dir}/frame-%d' % i for i in range(50)]
+    player = ImageSequencePlayer(fc, frames, fps=1e6)
+    result = player.play()
+    assert result['dropped'] > 0 and result['shown'] + result['dropped'] == 50
+    assert firefly.counts['upload'] == 0
+
+
+def test_step_and_background_play(in_process_client):
+    fc, firefly = in_process_client('player')
+    player = ImageSequencePlayer(fc, ['${upload-dir}/a', '${upload-dir}/b'], plot_id='s', fps=100)
+    player.step()
+    player.step()
+    player.step()
+    files = [a['payload']['wpRequest']['file'] for a in firefly.actions]
+    assert files == ['${upload-dir}/a', '${upload-dir}/b', '${upload-dir}/a'] and player.position == 0
+    player.play(loop=True, block=False)
+    player.stop()
+    assert player._thread is None
+
+
+def test_cube_view_uploads_planes_on_demand(tmp_path, in_process_client):
+    fc, firefly = in_process_client('player')
+    path = tmp_path / 'cube.fits'
+    with open(path, 'wb') as fp:
+        write_image(fp, np.zeros((1, 40, 8, 8), np.float32), [('CRPIX3', 10.0), ('CDELT3', 2.0)])
+    cube = CubeView(fc, str(path), plot_id='cube', cache_size=4, prefetch=1)
+    assert len(cube) == 40
+    cube.show(20)
+    fc.flush()
+    cube._uploads.wait()
+    assert firefly.counts['upload'] == 3  # plane 20 and its neighbors
+    cube.step()
+    cube.show(20)
+    cube._uploads.wait()
+    assert firefly.counts['upload'] == 4  # only plane 22 was new
+    files = [a['payload']['wpRequest']['file'] for a in firefly.actions]
+    assert files[0] == files[2] and len(set(files)) == 2
+    cube.show_range(0, 5)
+    assert len(cube._cache) == 4
+    cube.close()
+
+
+def test_integer_frames_and_failed_uploads(in_process_client):
+    fc, firefly = in_process_client('player')
+    frames = [np.zeros((4, 4), np.uint16), 'missing-frame.fits', np.ones((4, 4), bool)]
+    player = ImageSequencePlayer(fc, frames, fps=20)
+    result = player.play()
+    assert result == {'shown': 2, 'dropped': 1} and firefly.counts['upload'] == 2
+    player.close()
+
+
+def test_empty_ranges_play_nothing(in_process_client):
+    fc, firefly = in_process_client('player')
+    player = ImageSequencePlayer(fc, ['${upload-dir}/a', '${upload-dir}/b'])
+    for params in ({'start': 0, 'stop': 0}, {'start': 2}, {'start': 5}, {'start': 1, 'stop': 1, 'loop': True}):
+        assert player.play(**params) == {'shown': 0, 'dropped': 0}
+    assert ImageSequencePlayer(fc, []).play(loop=True) == {'shown': 0, 'dropped': 0}
+    assert not firefly.actions
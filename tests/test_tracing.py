@@ -0,0 +1,50 @@
+import io
+import pytest
+from firefly_client import FireflyClient
+from firefly_client._stand_in_server import StandInServer
+from firefly_client._tracing import InMemoryExporter, Tracer, targets_of
+
+
+@pytest.fixture
+def spans():
+    exporter = FireflyClient.enable_tracing()
+    yield exporter
+    FireflyClient.enable_tracing(False)
+
+
+def test_nested_spans_share_trace():
+    tracer = Tracer()
+    exporter = InMemoryExporter()
+    tracer.add_exporter(exporter)
+    tracer.enabled = True
+    with tracer.span('outer') as outer:
+        with tracer.span('inner') as inner:
+            pass
+    assert inner.trace_id == outer.trace_id and inner.parent_id == outer.span_id
+    assert [s.name for s in exporter.spans] == ['inner', 'outer']
+
+
+def test_event_joins_trace_of_action():
+    tracer = Tracer()
+    exporter = InMemoryExporter()
+    tracer.add_exporter(exporter)
+    tracer.enabled = True
+    with tracer.span('dispatch') as span:
+        tracer.correlate(targets_of({'plotId': 'p1'}), span)
+    event = tracer.record_event('ImagePlotCntlr.PlotImage', targets_of({'plotId': 'p1'}))
+    assert event.trace_id == span.trace_id and event.parent_id == span.span_id
+    assert tracer.record_event('ImagePlotCntlr.PlotImage', ['other']) is None
+
+
+def test_targets_of_nested_request():
+    assert targets_of({'request': {'tbl_id': 't1'}, 'plotId': ['a', 'b']}) == ['a', 'b', 't1']
+
+
+def test_show_fits_image_trace(spans):
+    with StandInServer() as server:
+        fc = FireflyClient.make_client(server.url, launch_browser=False, channel_override='tracing')
+        fc.show_fits_image(file_input=io.BytesIO(b'SIMPLE'), plot_id='p1')
+    trace = spans.traces()[spans.spans[-1].trace_id]
+    names = [s.name for s in trace]
+    assert names[0] == 'show_fits_image'
+    assert {'upload', 'dispatch', 'http_post'} <= set(names)
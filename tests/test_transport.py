@@ -0,0 +1,79 @@
+import http.client
+import io
+import pytest
+from firefly_client import FireflyClient
+from firefly_client._stand_in_server import StandInServer
+from firefly_client.transport import UnixSocketTransport, encode_multipart
+
+
+def test_encode_multipart():
+    body, content_type = encode_multipart({'file': io.BytesIO(b'payload')})
+    boundary = content_type.split('boundary=')[1]
+    assert body.startswith(('--%s\r\n' % boundary).encode()) and b'\r\n\r\npayload\r\n' in body
+
+
+def test_in_process_transport(in_process_client):
+    fc, firefly = in_process_client('inproc')
+    assert fc.set_zoom('p1', 2)['success']
+    assert fc.upload_data(io.BytesIO(b'SIMPLE'), 'FITS').startswith('${upload-dir}')
+    assert firefly.counts['pushAction'] == 1
+
+
+def test_unix_socket_transport(tmp_path):
+    path = str(tmp_path / 'firefly.sock')
+    with StandInServer(unix_socket=path) as server:
+        fc = FireflyClient.make_client(server.url, launch_browser=False, channel_override='uds',
+                                       transport=UnixSocketTransport(path))
+        for _ in range(3):
+            assert fc.set_pan('p1', 10, 20)['success']
+        assert server.firefly.counts['pushAction'] == 3
+
+
+class _StaleConnection:
+    """Keep-alive connection whose next response fails with `error`."""
+    sock = object()
+
+    def __init__(self, error, calls):
+        self.error, self.calls, self.host = error, calls, 'localhost'
+
+    def request(self, method, target, body=None, headers=None):
+        self.calls.append(method)
+
+    def getresponse(self):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+class _Reply:
+    status, reason = 200, 'OK'
+
+    def read(self): return b'{}'
+
+    def getheaders(self): return []
+
+
+@pytest.mark.parametrize('method, error, retried', [
+    ('GET', ConnectionResetError(), True),
+    ('POST', ConnectionResetError(), False),  # the server may have run the action
+    ('POST', http.client.RemoteDisconnected(), True),  # closed before any response byte
+])
+def test_unix_socket_retries(monkeypatch, method, error, retried):
+    transport = UnixSocketTransport('/nonexistent.sock')
+    calls = []
+    connections = iter([_StaleConnection(error, calls), _StaleConnection(None, calls)])
+
+    def connection(host):
+        conn = next(connections)
+        conn.error is None and setattr(conn, 'getresponse', _Reply)
+        return conn
+
+    monkeypatch.setattr(transport, '_connection', connection)
+    if retried:
+        assert transport.request(method, 'http://localhost/firefly', b'x').status_code == 200
+        assert calls == [method, method]
+    else:
+        with pytest.raises(ConnectionResetError):
+            transport.request(method, 'http://localhost/firefly', b'x')
+        assert calls == [method]